@@ -26,7 +26,100 @@ import idaapi
 import idc
 from idc import Eval
 import time
+import os
+import json
+import socket
+import select
 MAILBOX='mailbox:'
+''' see monitorCore/idaChannel.py, if not set the monitor is asked for the path '''
+CHANNEL_PATH = os.getenv('RESIM_IDA_SOCKET')
+
+class MonitorChannel():
+    ''' client side of the monitor's idaChannel socket '''
+    def __init__(self, path):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        self.next_id = 1
+        self.pending = None
+        self.buf = ''
+
+    def request(self, op):
+        req_id = self.next_id
+        self.next_id += 1
+        self.sock.sendall(json.dumps({'id':req_id, 'op':op})+'\n')
+        return req_id
+
+    def getReply(self, req_id, timeout):
+        ''' reply to the given request, or None if it does not arrive within timeout seconds '''
+        deadline = time.time() + timeout
+        while True:
+            while '\n' in self.buf:
+                line, self.buf = self.buf.split('\n', 1)
+                reply = json.loads(line)
+                if reply.get('id') == req_id:
+                    return reply
+            remain = deadline - time.time()
+            if remain <= 0:
+                return None
+            ready, dum, dum2 = select.select([self.sock], [], [], remain)
+            if not ready:
+                return None
+            data = self.sock.recv(4096)
+            if not data:
+                raise socket.error('monitor closed channel')
+            self.buf += data
+
+    def waitStop(self, timeout):
+        ''' mailbox content once the monitor posts it, or None after timeout seconds '''
+        if self.pending is None:
+            self.pending = self.request('wait_stop')
+        reply = self.getReply(self.pending, timeout)
+        if reply is None:
+            return None
+        self.pending = None
+        return reply.get('mail')
+
+    def ping(self):
+        ''' round trip time in seconds '''
+        start = time.time()
+        self.getReply(self.request('ping'), 5)
+        return time.time() - start
+
+channel = None
+channel_asked = False
+def getChannelPath():
+    ''' ask the monitor once, it has no channel if nothing is returned '''
+    global CHANNEL_PATH, channel_asked
+    if CHANNEL_PATH is None and not channel_asked:
+        channel_asked = True
+        reply = Evalx('SendGDBMonitor("@cgc.getIdaChannelPath()");')
+        if type(reply) is str:
+            for line in reply.splitlines():
+                if line.strip().startswith('/'):
+                    CHANNEL_PATH = line.strip()
+    return CHANNEL_PATH
+
+def getChannel():
+    ''' connect to the monitor's channel if it has one, else None and the monitor is polled '''
+    global channel
+    if channel is None:
+        path = getChannelPath()
+        if path is not None and os.path.exists(path):
+            try:
+                channel = MonitorChannel(path)
+            except socket.error:
+                channel = None
+    return channel
+
+def waitChannel(delay):
+    global channel
+    try:
+        return getChannel().waitStop(delay)
+    except (socket.error, ValueError) as e:
+        print('lost channel to monitor, will poll: %s' % str(e))
+        channel = None
+        return None
+
 def Evalx(cmd):
     retval = '\n'
     simicsString = Eval(cmd)
@@ -72,8 +165,15 @@ def getEIPWhenStopped(delay=0, kernel_ok=False):
         if count == 50:
             print("waiting for response from monitor...")
             idc.Warning("may take a while")
-        time.sleep(delay)
-        simicsString = Evalx('SendGDBMonitor("@cgc.getEIPWhenStopped(%s)");' % kernel_ok)
+        mail = None
+        if getChannel() is not None:
+            mail = waitChannel(delay)
+        else:
+            time.sleep(delay)
+        if mail is not None:
+            simicsString = MAILBOX+mail
+        else:
+            simicsString = Evalx('SendGDBMonitor("@cgc.getEIPWhenStopped(%s)");' % kernel_ok)
         #print 'ready set'
         #print 'getEIPWhenStopped got %s of type %s' % (simicsString, type(simicsString))
         if simicsString is not None and type(simicsString) is str and simicsString != '0' and MAILBOX in simicsString:
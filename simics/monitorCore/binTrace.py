@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+'''
+Binary syscall trace records, as written by TraceMgr when binary tracing is
+enabled, and a command line reader that filters them and renders the text
+form of the trace, i.e., what TraceMgr writes to the text trace file.
+
+Each record is:
+    header: length of remainder, cycle, pid, callnum, number of args  (<IQiiB)
+    args: one unsigned 64-bit value each
+    buffer: 32-bit length followed by raw bytes, e.g., data read or written
+    msg: 32-bit length followed by the text form of the trace message
+pid and callnum are -1 when not known.
+
+Usage:
+    binTrace.py <trace file> [--pid N] [--call N] [--start CYCLE] [--end CYCLE] [--buf]
+'''
+import struct
+import sys
+import argparse
+HEADER = struct.Struct('<IQiiB')
+LEN = struct.Struct('<I')
+ARG = struct.Struct('<Q')
+
+class TraceRecord():
+    def __init__(self, cycle, pid, callnum, args, buf, msg):
+        self.cycle = cycle
+        self.pid = pid
+        self.callnum = callnum
+        self.args = args
+        self.buf = buf
+        self.msg = msg
+
+    def getString(self):
+        ''' same form as the text trace file '''
+        return '%010x--%s' % (self.cycle, self.msg)
+
+def pack(cycle, pid, callnum, args, buf, msg):
+    if pid is None:
+        pid = -1
+    if callnum is None:
+        callnum = -1
+    if args is None:
+        args = ()
+    if buf is None:
+        buf = ''
+    else:
+        buf = str(buf)
+    body = ''.join(ARG.pack(a & 0xffffffffffffffff) for a in args) + LEN.pack(len(buf)) + buf + LEN.pack(len(msg)) + msg
+    return HEADER.pack(HEADER.size - LEN.size + len(body), cycle, pid, callnum, len(args)) + body
+
+def readRecords(fh):
+    while True:
+        header = fh.read(HEADER.size)
+        if len(header) < HEADER.size:
+            break
+        length, cycle, pid, callnum, nargs = HEADER.unpack(header)
+        body = fh.read(length - (HEADER.size - LEN.size))
+        offset = 0
+        args = []
+        for i in range(nargs):
+            args.append(ARG.unpack_from(body, offset)[0])
+            offset += ARG.size
+        buf_len = LEN.unpack_from(body, offset)[0]
+        offset += LEN.size
+        buf = body[offset:offset+buf_len]
+        offset += buf_len
+        msg_len = LEN.unpack_from(body, offset)[0]
+        offset += LEN.size
+        msg = body[offset:offset+msg_len]
+        yield TraceRecord(cycle, pid, callnum, args, buf, msg)
+
+def main():
+    parser = argparse.ArgumentParser(description='Render a binary RESim syscall trace as text')
+    parser.add_argument('trace', help='binary trace file')
+    parser.add_argument('--pid', type=int, help='only records for this pid')
+    parser.add_argument('--call', type=int, help='only records for this syscall number')
+    parser.add_argument('--start', type=lambda x: int(x, 0), help='first cycle')
+    parser.add_argument('--end', type=lambda x: int(x, 0), help='last cycle')
+    parser.add_argument('--buf', action='store_true', help='also show buffer contents as hex')
+    args = parser.parse_args()
+    with open(args.trace, 'rb') as fh:
+        for rec in readRecords(fh):
+            if args.pid is not None and rec.pid != args.pid:
+                continue
+            if args.call is not None and rec.callnum != args.call:
+                continue
+            if args.start is not None and rec.cycle < args.start:
+                continue
+            if args.end is not None and rec.cycle > args.end:
+                continue
+            sys.stdout.write(rec.getString())
+            if args.buf and len(rec.buf) > 0:
+                sys.stdout.write('\t%s\n' % rec.buf.encode('hex'))
+
+if __name__ == '__main__':
+    main()
@@ -26,6 +26,7 @@
 from simics import *
 from collections import OrderedDict
 import memUtils
+import pageUtils
 import sys
 class bookmarkMgr():
     __bookmarks = OrderedDict()
@@ -200,12 +201,14 @@ class bookmarkMgr():
         if self.top.SIMICS_BUG:
           while not done:
             SIM_run_command('pselect cpu-name = %s' % cpu.name)
+            pageUtils.clearPageCache()
             SIM_run_command('skip-to cycle = 0x%x' % start_cycle)
             cycles = SIM_cycle_count(cpu)
             self.lgr.debug('goToDebugBookmark, did skip to start at cycle %x, expected %x ' % (cycles, start_cycle))
             cycle = self.__bookmarks[mark].cycles
             self.lgr.debug("goToDebugBookmark, pslect then skip to 0x%x" % cycle)
             SIM_run_command('pselect cpu-name = %s' % cpu.name)
+            pageUtils.clearPageCache()
             SIM_run_command('skip-to cycle=%d' % cycle)
             eip = self.top.getEIP(cpu)
             current = SIM_cycle_count(cpu)
@@ -222,6 +225,7 @@ class bookmarkMgr():
             self.lgr.debug("goToDebugBookmark, pslect then skip to 0x%x" % cycle)
             SIM_run_command('pselect cpu-name = %s' % cpu.name)
             try:
+                pageUtils.clearPageCache()
                 SIM_run_command('skip-to cycle=%d' % cycle)
             except:
                 print('reverse disabled')
@@ -247,6 +251,7 @@ class bookmarkMgr():
         dum, dum2, cpu = self.context_mgr.getDebugPid() 
         origin = self.__bookmarks[self.__origin_bookmark].cycles
         SIM_run_command('pselect cpu-name = %s' % cpu.name)
+        pageUtils.clearPageCache()
         SIM_run_command('skip-to cycle=%d' % origin)
         current = SIM_cycle_count(cpu)
         eip = self.top.getEIP(cpu)
@@ -262,6 +267,7 @@ class bookmarkMgr():
             dum, dum2, cpu = self.context_mgr.getDebugPid() 
         first = self.__bookmarks['_start+1'].cycles
         SIM_run_command('pselect cpu-name = %s' % cpu.name)
+        pageUtils.clearPageCache()
         SIM_run_command('skip-to cycle=%d' % first)
         current = SIM_cycle_count(cpu)
         step = SIM_step_count(cpu)
@@ -24,8 +24,34 @@
 '''
 
 from simics import *
+import re
+import operand
 modifiesOp0_list = ['mov', 'xor', 'pop', 'add', 'or', 'and', 'inc', 'dec', 'shl', 'shr', 'lea', 'xchg', 'imul']
 ia32_regs = ["eax", "ebx", "ecx", "edx", "ebp", "edi", "esi", "eip", "esp"]
+''' register name -> family, i.e., the 64-bit register containing it '''
+reg_family = {}
+for x in 'abcd':
+    for name in ['r%sx' % x, 'e%sx' % x, '%sx' % x, '%sh' % x, '%sl' % x]:
+        reg_family[name] = 'r%sx' % x
+for x in ['si', 'di', 'bp', 'sp']:
+    for name in ['r'+x, 'e'+x, x, x+'l']:
+        reg_family[name] = 'r'+x
+for name in ['rip', 'eip', 'ip']:
+    reg_family[name] = 'rip'
+for i in range(8, 16):
+    for name in ['r%d' % i, 'r%dd' % i, 'r%dw' % i, 'r%db' % i, 'r%dl' % i]:
+        reg_family[name] = 'r%d' % i
+for name in ['cs', 'ds', 'es', 'fs', 'gs', 'ss']:
+    reg_family[name] = name
+for name in ['rflags', 'eflags', 'flags']:
+    reg_family[name] = 'rflags'
+REG_TOKEN = re.compile('(?<![0-9a-z])[a-z][a-z0-9]*')
+
+def regFamily(reg):
+    if reg is None:
+        return None
+    return reg_family.get(reg.strip().lower())
+
 def modifiesOp0(op):
     if op.startswith('mov') or op.startswith('cmov') or op in modifiesOp0_list:
         return True
@@ -35,28 +61,14 @@ def modifiesOp0(op):
 #2016-11-19 09:35:43,567 - DEBUG - cycleRegisterMod mn: mov op0: eax  op1: dword ptr [ebp+0x8]
 
 def regIsPart(reg1, reg2):
+    ''' do the registers overlap, e.g., al and eax '''
     if reg1 == reg2:
         return True
-    if reg1.endswith('x') and reg1[1] == reg2[0]:
-        return True
-    if reg2.endswith('x') and reg2[1] == reg1[0]:
-        return True
-    if len(reg1) == 2 and len(reg2) == 2 and reg1[0] == reg2[0]:
-        return True
-    return False
+    family = regFamily(reg1)
+    return family is not None and family == regFamily(reg2)
 
 def isReg(reg):
-    if reg in ia32_regs:
-        return True
-    if (len(reg) == 3 and reg.endswith('x')) or (len(reg) == 2 and reg[0] != '0'):
-        try:
-            dum = int(reg)
-            return False
-        except:
-            pass
-        return True
-    else:
-        return False
+    return reg.strip().lower() in reg_family
 
 def isByteReg(reg):
     if len(reg) == 2 and not reg.endswith('x'):
@@ -201,7 +213,76 @@ def addressFromExpression(cpu, exp, lgr):
     return address
 
 
-def getAddressFromOperand(cpu, operand, lgr):
+def parseOperand(text):
+    ''' return an operand.Operand for the given operand text, or None '''
+    if text is None:
+        return None
+    s = text.strip()
+    if len(s) == 0:
+        return None
+    if '[' in s and ']' in s:
+        retval = operand.Operand(s, 'mem')
+        prefix, rest = s.split('[', 1)
+        inner = rest.split(']', 1)[0]
+        segment = None
+        if ':' in prefix:
+            segment = prefix.split(':')[0].split()[-1]
+        ea = operand.EffAddr(segment=segment)
+        ok = s.count('[') == 1
+        for term in inner.replace('-', '+-').split('+'):
+            term = term.strip()
+            if len(term) == 0:
+                continue
+            if '*' in term:
+                index, scale = term.split('*', 1)
+                if not isReg(index) or ea.index is not None:
+                    ok = False
+                    break
+                ea.index = index.strip()
+                try:
+                    ea.scale = int(scale, 0)
+                except ValueError:
+                    ok = False
+                    break
+            elif isReg(term):
+                if ea.base is None:
+                    ea.base = term
+                elif ea.index is None:
+                    ea.index = term
+                else:
+                    ok = False
+                    break
+            else:
+                try:
+                    ea.disp += int(term, 16)
+                except ValueError:
+                    ok = False
+                    break
+        if ok:
+            retval.ea = ea
+        retval.regs = set([regFamily(r) for r in REG_TOKEN.findall(inner) if isReg(r)])
+    elif isReg(s):
+        retval = operand.Operand(s, 'reg')
+        retval.reg = regFamily(s)
+        retval.regs = set([retval.reg])
+    else:
+        try:
+            value = int(s, 16)
+            retval = operand.Operand(s, 'imm')
+            retval.value = value
+        except ValueError:
+            retval = operand.Operand(s, 'other')
+            retval.regs = set([regFamily(r) for r in REG_TOKEN.findall(s) if isReg(r)])
+    return retval
+
+def getAddressFromOperand(cpu, operand_text, lgr):
+    op = parseOperand(operand_text)
+    if op is not None and op.ea is not None:
+        return op.ea.getAddress(cpu)
+    return getAddressFromOperandText(cpu, operand_text, lgr)
+
+def getAddressFromOperandText(cpu, operand, lgr):
+    ''' string parsing of operands the operand model does not handle, e.g., [ebx][esi] '''
     prefix, bracketed = getInBrackets(cpu, operand, lgr)
     #lgr.debug('bracketed it %s prefix is %s' % (bracketed, prefix))
     address = None
@@ -1,6 +1,19 @@
 from simics import *
+import re
+import operand
 modsOp0 = ['ldr', 'mov', 'mvn', 'add', 'sub', 'mul', 'and', 'or', 'eor', 'bic', 'rsb', 'adc', 'sbc', 'rsc']
-reglist = ['pc', 'lr', 'sp', 'r0', 'r1', 'r2', 'r3', 'r4', 'r6', 'r6',' r7', 'r8', 'r9', 'r10', 'r11', 'r12']
+''' register name -> family, i.e., the numbered register '''
+reg_family = {}
+for i in range(16):
+    reg_family['r%d' % i] = 'r%d' % i
+for name, family in [('sb', 'r9'), ('sl', 'r10'), ('fp', 'r11'), ('ip', 'r12'), ('sp', 'r13'), ('lr', 'r14'), ('pc', 'r15')]:
+    reg_family[name] = family
+REG_TOKEN = re.compile('(?<![0-9a-z])[a-z][a-z0-9]*')
+
+def regFamily(reg):
+    if reg is None:
+        return None
+    return reg_family.get(reg.strip().lower())
 def modifiesOp0(mn):
     for mop in modsOp0:
         if mn.startswith(mop):
@@ -8,16 +21,16 @@ def modifiesOp0(mn):
     return False
 
 def isReg(reg):
-    if reg in reglist:
-        return True
-    else:
-        return False 
+    return reg.strip().lower() in reg_family
 
 def getMn(instruct):
     return instruct.split()[0]
 
 def getOperands(instruct):
     mn, rest = instruct.split(' ',1)
+    if rest.strip().startswith('{'):
+        ''' e.g., push {r4, lr} '''
+        return None, rest.strip()
     op1, op2 = rest.split(',', 1)
     return op2.strip(), op1.strip()
 
@@ -25,7 +38,11 @@ def isIndirect(reg):
     return False    
 
 def regIsPart(op, reg):
-    return op == reg
+    ''' do the names refer to the same register, e.g., sp and r13 '''
+    if op == reg:
+        return True
+    family = regFamily(op)
+    return family is not None and family == regFamily(reg)
 
 def isByteReg(reg):
     return False
@@ -35,43 +52,101 @@ def getRegValue(cpu, reg):
     reg_value = cpu.iface.int_register.read(reg_num)
     return reg_value
 
-def getValue(cpu, item):
+def getImmediate(item):
+    item = item.strip()
+    if item.startswith('#'):
+        item = item[1:]
+    try:
+        if item.startswith('0x') or item.startswith('-0x'):
+            return int(item, 16)
+        else:
+            return int(item)
+    except ValueError:
+        return None
+
+def getValue(item, cpu, lgr):
     value = None
+    item = item.strip()
     if isReg(item):
-        value = getRegValue(cpu, value)
+        value = getRegValue(cpu, item)
     elif item.startswith('#'):
-        if item.startswith('#0x'):
-            try:
-                value = int(item[3:], 16)
-            except:
-                return None
+        value = getImmediate(item)
+    return value
+
+def parseOperand(text):
+    ''' return an operand.Operand for the given operand text, or None.  Text following the
+        first operand, e.g., the shift of a register or the offset of a post-indexed address,
+        is taken as part of the operand. '''
+    if text is None:
+        return None
+    s = text.strip()
+    if len(s) == 0:
+        return None
+    if s.startswith('{'):
+        retval = operand.Operand(s, 'reglist')
+        regs = s[1:s.find('}')].split(',')
+        retval.reglist = [regFamily(r) for r in regs if isReg(r)]
+        retval.regs = set(retval.reglist)
+    elif s.startswith('[') and ']' in s:
+        retval = operand.Operand(s, 'mem')
+        inner, after = s[1:].split(']', 1)
+        after = after.strip()
+        ea = operand.EffAddr(writeback=after.startswith('!'))
+        ok = True
+        terms = [t.strip() for t in inner.split(',')]
+        if isReg(terms[0]):
+            ea.base = terms[0]
         else:
-            try:
-                value = int(item[1:])
-            except:
-                return None
-    return None 
-        
+            ok = False
+        for term in terms[1:]:
+            if term.startswith('#'):
+                value = getImmediate(term)
+                if value is None:
+                    ok = False
+                else:
+                    ea.disp += value
+            elif isReg(term.lstrip('-')) and ea.index is None:
+                ea.index = term.lstrip('-')
+                if term.startswith('-'):
+                    ea.scale = -1
+            elif term.startswith('lsl') and ea.index is not None:
+                shift = getImmediate(term[3:])
+                if shift is None:
+                    ok = False
+                else:
+                    ea.scale = ea.scale << shift
+            else:
+                ok = False
+        if after.startswith(','):
+            ''' post-indexed, the base is written back '''
+            ea.post_index = True
+            ea.writeback = True
+        if ok:
+            retval.ea = ea
+        retval.regs = set([regFamily(r) for r in REG_TOKEN.findall(inner) if isReg(r)])
+    else:
+        first = s.split(',', 1)[0].strip()
+        writeback = first.endswith('!')
+        first = first.rstrip('!')
+        if isReg(first):
+            retval = operand.Operand(s, 'reg')
+            retval.reg = regFamily(first)
+            retval.writeback = writeback
+        elif getImmediate(first) is not None:
+            retval = operand.Operand(s, 'imm')
+            retval.value = getImmediate(first)
+        else:
+            retval = operand.Operand(s, 'other')
+        retval.regs = set([regFamily(r) for r in REG_TOKEN.findall(s) if isReg(r)])
+    return retval
 
 def getAddressFromOperand(cpu, op, lgr):
     retval = None
-    if op[0] == '[' and op[-1] == ']':
-        express = op[1:-1]
-    elif op[0] == '[' and op[-2:-1] == ']!':
-        express = op[1:-2]
-    if express is not None:
-        value = 0
-        parts = express.split(',')
-        for p in parts:
-            v = getValue(cpu, p) 
-            if v is not None:
-                value += v
-            else:
-                self.lgr.debug('getAddressFromOperand could not getValue from %s  op %s' % (p, op))
-                return None    
-        retval = value
+    parsed = parseOperand(op)
+    if parsed is not None and parsed.ea is not None:
+        retval = parsed.ea.getAddress(cpu)
     else:
-        self.lgr.debug('getAddressFromOperand nothing from %s' % op)
+        lgr.debug('getAddressFromOperand nothing from %s' % op)
     return retval
            
 def armWriteBack(instruct, reg):
@@ -1,6 +1,11 @@
 import os
-import shlex
-import subprocess
+import struct
+import pickle
+'''
+Find the .text section of ELF32/ELF64 files (either byte order) by reading
+the ELF header and section table directly.  Results are cached by path, size
+and modification time, and the cache is saved with snapshots.
+'''
 class Text():
     def __init__(self, address, offset, size):
         self.address = address
@@ -8,28 +13,90 @@ class Text():
         self.size = size
         self.locate = None
 
+''' (path, size, mtime) -> (address, offset, size) of .text '''
+text_cache = {}
+CACHE_FILE = 'elf_text.pickle'
+''' schema version of the state saved with snapshots '''
+STATE_VERSION = 1
+
+ELFCLASS32 = 1
+ELFCLASS64 = 2
+ELFDATA2MSB = 2
+SHN_XINDEX = 0xffff
+
+def loadCache(name, snap_state=None):
+    if snap_state is not None:
+        cache = snap_state.get('elfText', STATE_VERSION)
+        if cache is not None:
+            text_cache.update(cache)
+        return
+    cache_file = os.path.join('./', name, CACHE_FILE)
+    if os.path.isfile(cache_file):
+        text_cache.update(pickle.load( open(cache_file, 'rb') ))
+
+def saveState(snap_state):
+    snap_state.put('elfText', STATE_VERSION, text_cache)
+
 def getText(path):
     if not os.path.isfile(path):
         return None
-    cmd = 'readelf -WS %s' % path
-    grep = 'grep " .text"'
-    proc1 = subprocess.Popen(shlex.split(cmd),stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    proc2 = subprocess.Popen(shlex.split(grep),stdin=proc1.stdout,
-                         stdout=subprocess.PIPE,stderr=subprocess.PIPE)
-
-    proc1.stdout.close() # Allow proc1 to receive a SIGPIPE if proc2 exits.
-    out,err=proc2.communicate()
-     
-    #print('out: {0}'.format(out))
-    #print('err: {0}'.format(err))
-    ''' section numbering has whitespace '''
-    hack = out[7:]
-    #print('readelf got %s from %s' % (hack, path))
-    parts = hack.split()
-    if len(parts) < 5:
-        return Text(None, None, None)
-    addr = int(parts[2], 16)
-    offset = int(parts[3], 16)
-    size = int(parts[4], 16)
+    st = os.stat(path)
+    key = (path, st.st_size, st.st_mtime)
+    if key not in text_cache:
+        try:
+            text_cache[key] = findSection(path, '.text')
+        except (IOError, struct.error):
+            text_cache[key] = (None, None, None)
+    addr, offset, size = text_cache[key]
     return Text(addr, offset, size)
-     
+
+def findSection(path, want):
+    ''' return address, offset and size of the named section, or Nones '''
+    with open(path, 'rb') as fh:
+        ident = fh.read(16)
+        if len(ident) < 16 or ident[:4] != '\x7fELF':
+            return None, None, None
+        if ord(ident[5]) == ELFDATA2MSB:
+            order = '>'
+        else:
+            order = '<'
+        if ord(ident[4]) == ELFCLASS64:
+            fh.seek(0x28)
+            shoff = struct.unpack(order+'Q', fh.read(8))[0]
+            fh.seek(0x3a)
+            shent_fmt = order+'IIQQQQIIQQ'
+        elif ord(ident[4]) == ELFCLASS32:
+            fh.seek(0x20)
+            shoff = struct.unpack(order+'I', fh.read(4))[0]
+            fh.seek(0x2e)
+            shent_fmt = order+'IIIIIIIIII'
+        else:
+            return None, None, None
+        shentsize, shnum, shstrndx = struct.unpack(order+'HHH', fh.read(6))
+        if shoff == 0:
+            return None, None, None
+        shent_len = struct.calcsize(shent_fmt)
+
+        def readShdr(index):
+            fh.seek(shoff + index * shentsize)
+            return struct.unpack(shent_fmt, fh.read(shent_len))
+
+        if shnum == 0 or shstrndx == SHN_XINDEX:
+            ''' extended numbering, real values are in section header zero '''
+            first = readShdr(0)
+            if shnum == 0:
+                shnum = first[5]
+            if shstrndx == SHN_XINDEX:
+                shstrndx = first[6]
+        ''' name, type, flags, addr, offset, size, link, info, addralign, entsize '''
+        sections = [readShdr(i) for i in range(shnum)]
+        strtab = sections[shstrndx]
+        fh.seek(strtab[4])
+        names = fh.read(strtab[5])
+        for sec in sections:
+            end = names.find('\0', sec[0])
+            if end < 0:
+                end = len(names)
+            if names[sec[0]:end] == want:
+                return sec[3], sec[4], sec[5]
+    return None, None, None
@@ -24,6 +24,7 @@
 '''
 from simics import *
 import decode
+import instructCache
 from collections import OrderedDict
 '''
 Scheme to manage syscall tracing in cases where the application spins around waiting for
@@ -146,7 +147,7 @@ class ExitMaze():
         cmd = 'si -q'
         for i in range(count, 200000):
             eip = getEIP(self.cpu)
-            instruct = SIM_disassemble_address(self.cpu, eip, 1, 0)
+            instruct = instructCache.disassemble(self.cpu, eip)
             result = SIM_run_command(cmd)
             if getCPL(self.cpu) > 0:
                 ''' see if we are returning from kernel or call from outer scope''' 
@@ -338,7 +339,7 @@ class ExitMaze():
         ip = dest
         self.lgr.debug('exitMaze isBump is 0x%x a bump?' % dest)
         while not done and not retval:
-            instruct = SIM_disassemble_address(self.cpu, ip, 1, 0)
+            instruct = instructCache.disassemble(self.cpu, ip)
             if instruct[1].startswith('jmp'):
                 op = instruct[1].split()[1]
                 self.lgr.debug('exitMaze isBump ip 0x%x is jmp op is %s' % (ip, op))
@@ -416,7 +417,7 @@ class ExitMaze():
 
     def compareHap(self, from_eip, third, breakpoint, memory):
             eip = getEIP(self.cpu)
-            instruct = SIM_disassemble_address(self.cpu, eip, 1, 0)
+            instruct = instructCache.disassemble(self.cpu, eip)
             parts = instruct[1].split()
             mn = parts[0]
             if mn == 'cmp':
@@ -26,6 +26,7 @@
 import simics
 from simics import *
 import memUtils
+import pageUtils
 import decode
 import procInfo
 import time
@@ -100,6 +101,7 @@ class findKernelWrite():
     def addStopHapForWriteAlone(self, my_args):
         self.stop_write_hap = SIM_hap_add_callback("Core_Simulation_Stopped", 
 		    self.stopToCheckWriteCallback, my_args)
+        pageUtils.clearPageCache()
         SIM_run_command('reverse')
 
 
@@ -171,6 +173,7 @@ class findKernelWrite():
     def skipAlone(self, cycles):
         self.lgr.debug('findKernelWrite skipAlone to cycle 0x%x' % cycles)
         cmd = 'skip-to cycle=%d' % cycles
+        pageUtils.clearPageCache()
         SIM_run_command(cmd)
         value = self.os_p_utils.getMemUtils().readWord32(self.cpu, self.addr)
         eip = self.top.getEIP(self.cpu)
@@ -240,6 +243,13 @@ class findKernelWrite():
                 SIM_delete_breakpoint(self.kernel_write_break)
                 self.kernel_write_break = None
 
+            exit_cycle = self.top.getSyscallCycles().nextExit(pid, cycle)
+            if exit_cycle is not None:
+                ''' return from this system call was recorded when running forward, skip to it '''
+                self.lgr.debug('thinkWeWrote skip to recorded kernel exit at 0x%x' % exit_cycle)
+                self.cleanup()
+                SIM_run_alone(self.skipAlone, exit_cycle+1)
+                return
             self.kernel_exit_break1 = self.context_manager.genBreakpoint(self.cell, 
                                                         Sim_Break_Linear, Sim_Access_Execute, self.param.sysexit, 1, 0)
             self.kernel_exit_break2 = self.context_manager.genBreakpoint(self.cell, 
@@ -316,6 +326,7 @@ class findKernelWrite():
             if SIM_simics_is_running():
                 self.lgr.error('backOneAlone, simics is still running, is this not part of a stop hap???')
                 return
+            pageUtils.clearPageCache()
             SIM_run_command('skip-to cycle=%d' % previous)
             new = SIM_cycle_count(self.cpu) 
             self.lgr.debug('backOne back to 0x%x got 0x%x' % (previous, new))
@@ -1,8 +1,11 @@
 from simics import *
+from collections import OrderedDict
 '''
 Track task context and set/remove beakpoints & haps accordingly.  Currently recognises two contexts:
 default & RESim.  Also has a carve-out for "maze_exit" breakpoints/haps, managed as an attribute of 
 the hap.  Designed to watch a single thread group.
+By default, breakpoints are suspended (disabled) rather than deleted when an unwatched task is
+scheduled, and are re-enabled when a watched task returns.  See suspendBreaks.
 '''
 class GenBreakpoint():
     def __init__(self, cell, addr_type, mode, addr, length, flags, handle, lgr):
@@ -15,6 +18,7 @@ class GenBreakpoint():
         self.break_num = None
         self.lgr = lgr
         self.handle = handle
+        self.enabled = True
 
         self.set()
 
@@ -32,9 +36,22 @@ class GenBreakpoint():
             SIM_delete_breakpoint(self.break_num)
             #self.lgr.debug('GenBreakpoint clear breakpoint %d break handle is %d' % (self.break_num, self.handle))
             self.break_num = None
+            self.enabled = True
+
+    def enable(self):
+        ''' re-enable a suspended breakpoint, the Simics breakpoint object is retained while suspended '''
+        if self.break_num is not None and not self.enabled:
+            SIM_enable_breakpoint(self.break_num)
+            self.enabled = True
+
+    def disable(self):
+        ''' suspend the breakpoint without deleting it '''
+        if self.break_num is not None and self.enabled:
+            SIM_disable_breakpoint(self.break_num)
+            self.enabled = False
 
 class GenHap():
-    def __init__(self, hap_type, callback, parameter, handle, lgr, breakpoint_list, name, immediate=True):
+    def __init__(self, hap_type, callback, parameter, handle, lgr, breakpoint_list, name, immediate=True, owner=None):
         ''' breakpoint_start and breakpont_end are GenBreakpoint types '''
         self.hap_type = hap_type
         self.callback = callback
@@ -42,8 +59,15 @@ class GenHap():
         self.breakpoint_list = breakpoint_list
         self.lgr = lgr
         self.hap_num = None
+        ''' a range hap whose callback is added by hapAlone, or a cleared hap to be set anew by
+            GenContextMgr.setHapAlone.  Clearing the hap cancels it. '''
+        self.set_pending = False
+        ''' hap_num is None because the hap was cleared, rather than not yet set '''
+        self.cleared = False
         self.handle = handle
         self.name = name
+        ''' optional key used to delete a group of haps, e.g., all haps of a Syscall instance '''
+        self.owner = owner
         self.set(immediate)
 
     def show(self):
@@ -53,12 +77,16 @@ class GenHap():
                 bp.show()
 
     def hapAlone(self, (bs, be)):
+        if not self.set_pending:
+            return
+        self.set_pending = False
         self.hap_num = SIM_hap_add_callback_range(self.hap_type, self.callback, self.parameter, bs.break_num, be.break_num)
         #self.lgr.debug('GenHap alone set hap_handle %s assigned hap %s name: %s on range %s %s (0x%x 0x%x) break handles %s %s' % (str(self.handle), 
         #          str(self.hap_num), self.name, str(bs.break_num), str(be.break_num), 
         #          bs.addr, be.addr, str(bs.handle), str(be.handle)))
 
     def set(self, immediate=True):
+        self.cleared = False
         if len(self.breakpoint_list) > 1:
             for bp in self.breakpoint_list:
                 bp.break_num = SIM_breakpoint(bp.cell, bp.addr_type, bp.mode, bp.addr, bp.length, bp.flags)
@@ -72,6 +100,7 @@ class GenHap():
                 #           str(self.hap_num), self.name, str(bs.break_num), str(be.break_num), 
                 #           bs.addr, be.addr, str(bs.handle), str(be.handle)))
             else:
+                self.set_pending = True
                 SIM_run_alone(self.hapAlone, (bs, be))
         elif len(self.breakpoint_list) == 1:
             bp = self.breakpoint_list[0]
@@ -84,12 +113,25 @@ class GenHap():
             self.lgr.error('GenHap, no breakpoints')
 
     def clear(self, dumb=None):
-        if self.hap_num is not None:
+        if self.hap_num is not None or self.set_pending:
             for bp in self.breakpoint_list:
                 bp.clear()
-            SIM_hap_delete_callback_id(self.hap_type, self.hap_num)
-            #self.lgr.debug('GenHap clear hap %d handle %d' % (self.hap_num, self.handle))
+            if self.hap_num is not None:
+                SIM_hap_delete_callback_id(self.hap_type, self.hap_num)
+                #self.lgr.debug('GenHap clear hap %d handle %d' % (self.hap_num, self.handle))
             self.hap_num = None
+            self.set_pending = False
+            self.cleared = True
+
+    def enable(self):
+        ''' enable breakpoints of a suspended hap.  A cleared hap is set anew by the context manager '''
+        for bp in self.breakpoint_list:
+            bp.enable()
+
+    def disable(self):
+        ''' suspend the hap by disabling its breakpoints, the hap callback remains registered '''
+        for bp in self.breakpoint_list:
+            bp.disable()
    
 class GenContextMgr():
     def __init__(self, top, cell_name, task_utils, param, cpu, lgr):
@@ -116,8 +158,13 @@ class GenContextMgr():
         self.phys_current_task = task_utils.getPhysCurrentTask()
         self.task_break = None
         self.task_hap = None
-        self.breakpoints = []
-        self.haps = []
+        ''' GenBreakpoints and GenHaps keyed by handle '''
+        self.breakpoints = OrderedDict()
+        self.haps = OrderedDict()
+        ''' GenBreakpoints keyed by the Simics breakpoint number assigned when set '''
+        self.break_nums = {}
+        ''' sets of hap handles keyed by owner '''
+        self.owner_haps = {}
         self.break_handle = 0
         self.hap_handle = 0
         self.text_start = None
@@ -131,25 +178,35 @@ class GenContextMgr():
         self.lgr.debug('context_manager cell %s resim_context defined as obj %s' % (self.cell_name, str(obj)))
         ''' avoid searching all task recs to know if pid being watched '''
         self.pid_cache = []
+        ''' watched state keyed by task record, mirrors watch_rec_list for constant time checks on each task switch '''
+        self.watch_rec_set = set()
+        ''' disable/enable breakpoints on context switches rather than delete and recreate them '''
+        self.suspend_breaks = True
 
     def getRealBreak(self, break_handle):
-        for hap in self.haps:
-            for bp in hap.breakpoint_list:
-                if bp.handle == break_handle:
-                    return bp.break_num
+        if break_handle in self.breakpoints:
+            return self.breakpoints[break_handle].break_num
         return None
 
     def getBreakHandle(self, real_bp):
-        for hap in self.haps:
-            #self.lgr.debug('getBreakHandle hap %s' % (hap.name))
-            for bp in hap.breakpoint_list:
-                #self.lgr.debug('getBreakHandle look for %d got %d' % (real_bp, bp.break_num))
-                if bp.break_num == real_bp:
-                    return bp.handle
+        if real_bp in self.break_nums:
+            bp = self.break_nums[real_bp]
+            if bp.break_num == real_bp:
+                return bp.handle
         return None
 
+    def indexBreakNums(self, hap):
+        for bp in hap.breakpoint_list:
+            if bp.break_num is not None:
+                self.break_nums[bp.break_num] = bp
+
+    def unindexBreakNums(self, hap):
+        for bp in hap.breakpoint_list:
+            if bp.break_num is not None and bp.break_num in self.break_nums:
+                del self.break_nums[bp.break_num]
+
     def showHaps(self):
-        for hap in self.haps:
+        for hap in self.haps.values():
             hap.show()
 
     def getRESimContext(self):
@@ -176,7 +233,7 @@ class GenContextMgr():
             cell = self.resim_context
             #self.lgr.debug('gen break with resim context %s' % str(self.resim_context))
         bp = GenBreakpoint(cell, addr_type, mode, addr, length, flags, handle, self.lgr) 
-        self.breakpoints.append(bp)
+        self.breakpoints[handle] = bp
         #self.lgr.debug('genBreakpoint handle %d  number of breakpoints is now %d' % (handle, len(self.breakpoints)))
         return handle
 
@@ -190,75 +247,151 @@ class GenContextMgr():
         #self.lgr.debug('genDeleteBreakpoint could not find break handle %d' % handle)
         pass
 
+    def removeHap(self, hap):
+        ''' drop the hap and its breakpoints from the registry.  Caller clears the Simics objects '''
+        self.unindexBreakNums(hap)
+        for bp in hap.breakpoint_list:
+            if bp.handle in self.breakpoints:
+                del self.breakpoints[bp.handle]
+                #self.lgr.debug('removing bp %d from hap_handle %d  break_num %s' % (bp.handle, hap.handle, str(bp.break_num)))
+            else:
+                self.lgr.error('genDeleteHap bp not in list, handle %d ' % (bp.handle))
+        if hap.owner is not None and hap.owner in self.owner_haps:
+            self.owner_haps[hap.owner].discard(hap.handle)
+            if len(self.owner_haps[hap.owner]) == 0:
+                del self.owner_haps[hap.owner]
+        del self.haps[hap.handle]
+
     def genDeleteHap(self, hap_handle, immediate=False):
         if hap_handle is None:
             self.lgr.error('genDelteHap called with handle of none')
             return
         #self.lgr.debug('genDeleteHap hap_handle %d' % hap_handle)
-        hap_copy = list(self.haps)
-        for hap in hap_copy:
-            if hap.handle == hap_handle:
-                if immediate:
-                    hap.clear(None)
-                else:
-                    SIM_run_alone(hap.clear, None)
-                #self.lgr.debug('num breaks in hap %d is %d' % (hap_handle, len(hap.breakpoint_list)))
-                for bp in hap.breakpoint_list:
-                    if bp in self.breakpoints:
-                        self.breakpoints.remove(bp)
-                        #self.lgr.debug('removing bp %d from hap_handle %d  break_num %s' % (bp.handle, hap_handle, str(bp.break_num)))
-                    else:
-                        self.lgr.error('genDeleteHap bp not in list, handle %d ' % (bp.handle))
-                #self.lgr.debug('genDeleteHap removing hap %d from list' % hap.handle)
-                self.haps.remove(hap)
-                return
-        self.lgr.debug('genDeleteHap could not find hap_num %d' % hap_handle)
+        if hap_handle not in self.haps:
+            self.lgr.debug('genDeleteHap could not find hap_num %d' % hap_handle)
+            return
+        hap = self.haps[hap_handle]
+        if immediate:
+            hap.clear(None)
+        else:
+            SIM_run_alone(hap.clear, None)
+        #self.lgr.debug('num breaks in hap %d is %d' % (hap_handle, len(hap.breakpoint_list)))
+        self.removeHap(hap)
+
+    def clearHapList(self, hap_list):
+        for hap in hap_list:
+            hap.clear(None)
+
+    def genDeleteOwner(self, owner, immediate=False):
+        ''' delete all haps created on behalf of the given owner '''
+        if owner not in self.owner_haps:
+            return
+        hap_list = []
+        for hap_handle in list(self.owner_haps[owner]):
+            hap = self.haps[hap_handle]
+            hap_list.append(hap)
+            self.removeHap(hap)
+        #self.lgr.debug('genDeleteOwner removed %d haps' % len(hap_list))
+        if immediate:
+            self.clearHapList(hap_list)
+        else:
+            SIM_run_alone(self.clearHapList, hap_list)
+
+    def addHap(self, hap, owner):
+        self.haps[hap.handle] = hap
+        self.indexBreakNums(hap)
+        if owner is not None:
+            if owner not in self.owner_haps:
+                self.owner_haps[owner] = set()
+            self.owner_haps[owner].add(hap.handle)
 
-    def genHapIndex(self, hap_type, callback, parameter, handle, name=None):
+    def genHapIndex(self, hap_type, callback, parameter, handle, name=None, owner=None):
         #self.lgr.debug('genHapIndex break_handle %d' % handle)
-        for bp in self.breakpoints:
-            if bp.handle == handle:
-                hap_handle = self.nextHapHandle()
-                hap = GenHap(hap_type, callback, parameter, hap_handle, self.lgr, [bp], name)
-                self.haps.append(hap)
-                return hap.handle
+        if handle in self.breakpoints:
+            bp = self.breakpoints[handle]
+            hap_handle = self.nextHapHandle()
+            hap = GenHap(hap_type, callback, parameter, hap_handle, self.lgr, [bp], name, owner=owner)
+            self.addHap(hap, owner)
+            return hap.handle
         #self.lgr.error('genHapIndex failed to find break %d' % breakpoint)
 
-    def genHapRange(self, hap_type, callback, parameter, handle_start, handle_end, name=None):
+    def genHapRange(self, hap_type, callback, parameter, handle_start, handle_end, name=None, owner=None):
         #self.lgr.debug('genHapRange break_handle %d %d' % (handle_start, handle_end))
-        bp_start = None
+        if handle_end not in self.breakpoints:
+            #self.lgr.error('genHapRange failed to find break for handles %d or %d' % (breakpoint_start, breakpoint_end))
+            return None
         bp_list = []
-        for bp in self.breakpoints:
-            if bp.handle >= handle_start:
-                bp_list.append(bp)
-            if bp.handle == handle_end:
-                hap_handle = self.nextHapHandle()
-                hap = GenHap(hap_type, callback, parameter, hap_handle, self.lgr, bp_list, name, immediate=False)
-                self.haps.append(hap)
-                return hap.handle
-        #self.lgr.error('genHapRange failed to find break for handles %d or %d' % (breakpoint_start, breakpoint_end))
+        for handle in range(handle_start, handle_end+1):
+            if handle in self.breakpoints:
+                bp_list.append(self.breakpoints[handle])
+        hap_handle = self.nextHapHandle()
+        hap = GenHap(hap_type, callback, parameter, hap_handle, self.lgr, bp_list, name, immediate=False, owner=owner)
+        self.addHap(hap, owner)
+        return hap.handle
+
+    def suspendBreaks(self, suspend):
+        ''' select whether context switches suspend breakpoints (disable/enable), or delete and recreate them '''
+        if suspend == self.suspend_breaks:
+            return
+        self.lgr.debug('contextManager cell %s suspendBreaks %r' % (self.cell_name, suspend))
+        if not suspend:
+            ''' haps that are only suspended must be deleted if not currently watching '''
+            for hap in self.haps.values():
+                if hap.hap_num is not None and len(hap.breakpoint_list) > 0 and not hap.breakpoint_list[0].enabled:
+                    self.unindexBreakNums(hap)
+                    hap.clear()
+        self.suspend_breaks = suspend
 
     def setAllBreak(self):
-        for bp in self.breakpoints:
+        for bp in self.breakpoints.values():
             bp.set()
 
     def setAllHap(self, only_maze_breaks=False):
-        for hap in self.haps:
+        for hap in self.haps.values():
             if (not only_maze_breaks and hap.name != 'exitMaze') or (only_maze_breaks and hap.name == 'exitMaze'):
-                hap.set()
+                if not self.suspend_breaks:
+                    hap.set()
+                elif hap.hap_num is None and hap.cleared and not hap.set_pending:
+                    ''' cleared while suspending was off, set it anew outside of this hap '''
+                    hap.set_pending = True
+                    SIM_run_alone(self.setHapAlone, hap)
+                else:
+                    hap.enable()
+                self.indexBreakNums(hap)
+
+    def setHapAlone(self, hap):
+        if hap.handle not in self.haps or not hap.set_pending:
+            return
+        hap.set_pending = False
+        hap.set()
+        self.indexBreakNums(hap)
 
     def clearAllBreak(self):
-        for bp in self.breakpoints:
-            bp.clear()
+        for bp in self.breakpoints.values():
+            if self.suspend_breaks:
+                bp.disable()
+            else:
+                bp.clear()
         
     def clearAllHap(self, keep_maze_breaks=False):
         #self.lgr.debug('clearAllHap start')
         
-        for hap in self.haps:
+        for hap in self.haps.values():
             if not keep_maze_breaks or hap.name != 'exitMaze':
-                hap.clear()
+                if self.suspend_breaks:
+                    hap.disable()
+                else:
+                    self.unindexBreakNums(hap)
+                    hap.clear()
         #self.lgr.debug('clearAllHap finish')
 
+    def runAlone(self, fun, arg):
+        ''' suspending breakpoints is safe within a hap, deleting and recreating them is deferred '''
+        if self.suspend_breaks:
+            fun(arg)
+        else:
+            SIM_run_alone(fun, arg)
+
     def getThreadRecs(self):
         return self.watch_rec_list
 
@@ -308,10 +441,12 @@ class GenContextMgr():
             return
         # get the value that will be written into the current thread address
         cur_addr = SIM_get_mem_op_value_le(memory)
-        pid = self.mem_utils.readWord32(cpu, cur_addr + self.param.ts_pid)
-        prev_task = self.task_utils.getCurTaskRec()
-        prev_pid = self.mem_utils.readWord32(cpu, prev_task + self.param.ts_pid)
-        #self.lgr.debug('changeThread from %d to %d cur_addr 0x%x watchlist len is %d' % (prev_pid, pid, cur_addr, len(self.watch_rec_list)))
+        self.task_utils.invalidateCurProc()
+        if len(self.pending_watch_pids) == 0 and len(self.nowatch_list) == 0:
+            ''' quick check, e.g., switching between two unwatched tasks touches nothing '''
+            if self.watching_tasks == (cur_addr in self.watch_rec_set):
+                return
+        #self.lgr.debug('changeThread to cur_addr 0x%x watchlist len is %d' % (cur_addr, len(self.watch_rec_list)))
         pid = None
         if len(self.pending_watch_pids) > 0:
             ''' Are we waiting to watch pids that have not yet been scheduled?
@@ -319,38 +454,38 @@ class GenContextMgr():
             pid = self.mem_utils.readWord32(cpu, cur_addr + self.param.ts_pid)
             if pid in self.pending_watch_pids:
                 #self.lgr.debug('changedThread, pending add pid %d to watched processes' % pid)
-                self.watch_rec_list.append(cur_addr)
+                self.addWatchRec(cur_addr)
                 self.pending_watch_pids.remove(pid)
 
         if not self.watching_tasks and \
-               (cur_addr in self.watch_rec_list or (len(self.watch_rec_list) == 0 and  len(self.nowatch_list) > 0)) \
+               (cur_addr in self.watch_rec_set or (len(self.watch_rec_list) == 0 and  len(self.nowatch_list) > 0)) \
                and not (self.single_thread and pid != self.debugging_pid):
             ''' Not currently watching processes, but new process should be watched '''
             if self.debugging_pid is not None:
                 cpu.current_context = self.resim_context
                 #self.lgr.debug('resim_context')
-            pid = self.mem_utils.readWord32(cpu, cur_addr + self.param.ts_pid)
-            #self.lgr.debug('Now scheduled %d' % pid)
+            #self.lgr.debug('Now scheduled 0x%x' % cur_addr)
             self.watching_tasks = True
             self.setAllBreak()
             only_maze_breaks = False
             if cur_addr in self.nowatch_list:
                 only_maze_breaks = True
                 #self.lgr.debug('contextManager changedThread, only do maze breaks')
-            SIM_run_alone(self.setAllHap, only_maze_breaks)
+            self.runAlone(self.setAllHap, only_maze_breaks)
         elif self.watching_tasks:
+            prev_task = self.task_utils.getCurTaskRec()
             if prev_task in self.nowatch_list:
                 if cur_addr not in self.nowatch_list:
                     ''' was watching only maze exits, watch everything but maze'''
                     #self.lgr.debug('was watching only maze, now watch all ')
-                    SIM_run_alone(self.clearAllHap, False)
-                    SIM_run_alone(self.setAllHap, False)
+                    self.runAlone(self.clearAllHap, False)
+                    self.runAlone(self.setAllHap, False)
             elif cur_addr in self.nowatch_list:
                 ''' was watching everything, watch only maze '''
                 #self.lgr.debug('Now only watch maze')
-                SIM_run_alone(self.clearAllHap, False)
-                SIM_run_alone(self.setAllHap, True)
-            elif len(self.watch_rec_list) > 0 and cur_addr not in self.watch_rec_list:
+                self.runAlone(self.clearAllHap, False)
+                self.runAlone(self.setAllHap, True)
+            elif len(self.watch_rec_list) > 0 and cur_addr not in self.watch_rec_set:
                 ''' Watching processes, but new process should not be watched '''
                 if self.debugging_pid is not None:
                     cpu.current_context = self.default_context
@@ -358,7 +493,16 @@ class GenContextMgr():
                 #self.lgr.debug('No longer scheduled')
                 self.watching_tasks = False
                 self.clearAllBreak()
-                SIM_run_alone(self.clearAllHap, False)
+                self.runAlone(self.clearAllHap, False)
+
+    def addWatchRec(self, rec):
+        self.watch_rec_list.append(rec)
+        self.watch_rec_set.add(rec)
+
+    def rmWatchRec(self, rec):
+        self.watch_rec_list.remove(rec)
+        if rec not in self.watch_rec_list:
+            self.watch_rec_set.discard(rec)
 
     def watchOnlyThis(self):
         ctask = self.task_utils.getCurTaskRec()
@@ -371,9 +515,9 @@ class GenContextMgr():
     def rmTask(self, pid):
         ''' remove a pid from the list of task records being watched.  return True if this is the last thread. '''
         rec = self.task_utils.getRecAddrForPid(pid)
-        if rec in self.watch_rec_list:
+        if rec in self.watch_rec_set:
             self.lgr.debug('rmTask removing rec 0x%x for pid %d' % (rec, pid))
-            self.watch_rec_list.remove(rec)
+            self.rmWatchRec(rec)
             if pid in self.pid_cache:
                 self.pid_cache.remove(pid)
             if len(self.watch_rec_list) == 0:
@@ -391,13 +535,13 @@ class GenContextMgr():
 
     def addTask(self, pid):
         rec = self.task_utils.getRecAddrForPid(pid)
-        if rec not in self.watch_rec_list:
+        if rec not in self.watch_rec_set:
             if rec is None:
                 self.lgr.debug('genContextManager, addTask got rec of None for pid %d, pending' % pid)
                 self.pending_watch_pids.append(pid)
             else:
                 self.lgr.debug('genContextManager, addTask pid %d add rec 0x%x' % (pid, rec))
-                self.watch_rec_list.append(rec)
+                self.addWatchRec(rec)
             self.pid_cache.append(pid)
         else:
             self.lgr.debug('addTask, already has rec 0x%x for PID %d' % (rec, pid))
@@ -405,7 +549,7 @@ class GenContextMgr():
     def amWatching(self, pid):
         ctask = self.task_utils.getCurTaskRec()
         dumb, comm, cur_pid  = self.task_utils.curProc()
-        if pid == cur_pid and (ctask in self.watch_rec_list or len(self.watch_rec_list)==0):
+        if pid == cur_pid and (ctask in self.watch_rec_set or len(self.watch_rec_list)==0):
             return True
         elif pid in self.pid_cache:
             return True
@@ -437,12 +581,12 @@ class GenContextMgr():
         self.setTaskHap()
         self.watching_tasks = True
         ctask = self.task_utils.getCurTaskRec()
-        if ctask in self.watch_rec_list:
+        if ctask in self.watch_rec_set:
             self.lgr.debug('watchTasks, current task already being watched')
             return
         pid = self.mem_utils.readWord32(self.cpu, ctask + self.param.ts_pid)
         self.lgr.debug('watchTasks cell %s watch record 0x%x pid: %d' % (self.cell_name, ctask, pid))
-        self.watch_rec_list.append(ctask)
+        self.addWatchRec(ctask)
         self.pid_cache.append(pid)
       
     def changeDebugPid(self, pid):
@@ -32,6 +32,11 @@ import errno
 import struct
 import resim_utils
 import memUtils
+import pageUtils
+import instructCache
+import regWriteLog
+import decode
+import decodeArm
 import taskUtils
 import genContextMgr
 import bookmarkMgr
@@ -49,6 +54,7 @@ import traceProcs
 import cloneChild
 import soMap
 import elfText
+import snapState
 import stopFunction
 import trackThreads
 import dataWatch
@@ -58,15 +64,20 @@ import exitMaze
 import net
 import sharedSyscall
 import idaFuns
+import idaChannel
 import traceMgr
 import binder
 import connector
 import diddler
 import targetFS
+import syscallNumbers
 
 import json
 import pickle
 
+''' schema version of the link_dict saved with snapshots '''
+NET_LINK_VERSION = 1
+
 class cellConfig():
     '''
     Manage the Simics simulation cells (boxes), CPU's (processor cores).
@@ -129,6 +140,8 @@ class GenMonitor():
         self.stop_proc_hap = None
         self.proc_break = None
         self.gdb_mailbox = None
+        ''' socket on which IDA waits for mailbox content, see idaChannel '''
+        self.ida_channel = None
         self.stop_hap = None
         self.log_dir = '/tmp/'
         self.mode_hap = None
@@ -139,6 +152,7 @@ class GenMonitor():
         self.soMap = {}
         self.page_faults = {}
         self.rev_to_call = {}
+        self.reg_write_log = {}
         self.pfamily = {}
         self.traceOpen = {}
         self.traceProcs = {}
@@ -151,6 +165,9 @@ class GenMonitor():
         ''' dict of syscall.SysCall keyed on call number '''
         self.call_traces = {}
         self.unistd = {}
+        self.unistd32 = {}
+        ''' compiled syscall number table of each cell, see syscallNumbers '''
+        self.syscall_table = {}
         self.targetFS = {}
         self.trace_all = {}
         self.track_threads = {}
@@ -186,10 +203,18 @@ class GenMonitor():
         target_cpu = self.cell_config.cpuFromCell(self.target)
         self.lgr.debug('New log, in genInit')
         self.run_from_snap = os.getenv('RUN_FROM_SNAP')
+        snap_state = None
+        self.net_links = None
         if self.run_from_snap is not None:
-            net_link_file = os.path.join('./', self.run_from_snap, 'net_link.pickle')
-            if os.path.isfile(net_link_file):
-                self.net_links = pickle.load( open(net_link_file, 'rb') )
+            snap_state = snapState.getSnapState(self.run_from_snap, self.lgr)
+            elfText.loadCache(self.run_from_snap, snap_state=snap_state)
+            if snap_state is not None:
+                self.net_links = snap_state.get('netLinks', NET_LINK_VERSION)
+            else:
+                net_link_file = os.path.join('./', self.run_from_snap, 'net_link.pickle')
+                if os.path.isfile(net_link_file):
+                    self.net_links = pickle.load( open(net_link_file, 'rb') )
+            if self.net_links is not None:
                 for target in self.net_links:
                     for link in self.net_links[target]:
                         cmd = '%s = %s' % (link.name, link.obj)
@@ -221,15 +246,22 @@ class GenMonitor():
             self.traceMgr[cell_name] = traceMgr.TraceMgr(self.lgr)
 
             self.unistd[cell_name] = comp_dict[cell_name]['RESIM_UNISTD']
+            if 'RESIM_UNISTD_32' in comp_dict[cell_name]:
+                self.unistd32[cell_name] = comp_dict[cell_name]['RESIM_UNISTD_32']
+            else:
+                self.unistd32[cell_name] = None
+            self.syscall_table[cell_name] = syscallNumbers.tablePath(param_file)
             root_prefix = comp_dict[cell_name]['RESIM_ROOT_PREFIX']
             self.targetFS[cell_name] = targetFS.TargetFS(root_prefix)
             self.lgr.debug('targetFS for %s is %s' % (cell_name, self.targetFS[cell_name]))
 
-            self.netInfo[cell_name] = net.NetAddresses(self.lgr)
+            self.netInfo[cell_name] = net.NetAddresses(cell_name, self.lgr)
             self.call_traces[cell_name] = {}
             #self.proc_list[cell_name] = {}
             self.stack_base[cell_name] = None
-            if self.run_from_snap is not None:
+            if snap_state is not None:
+                self.netInfo[cell_name].loadState(snap_state)
+            elif self.run_from_snap is not None:
                 net_file = os.path.join('./', self.run_from_snap, cell_name, 'net_list.pickle')
                 if os.path.isfile(net_file):
                     self.netInfo[cell_name].loadfile(net_file)
@@ -380,12 +412,55 @@ class GenMonitor():
                   self.soMap[cell_name], self.dataWatch[cell_name], self.traceMgr[cell_name], self.lgr)
 
 
+    def bootPid(self, cell_name, cpu):
+        ''' pid of the current task if the kernel has booted far enough to have one, else None '''
+        cur_task_rec = self.mem_utils[cell_name].getCurrentTask(self.param[cell_name], cpu)
+        if cur_task_rec is None or cur_task_rec == 0:
+            return None
+        return self.mem_utils[cell_name].readWord32(cpu, cur_task_rec + self.param[cell_name].ts_pid)
+
+    def bootModeHap(self, cell_name, one, old, new):
+        ''' stop the simulation at the first entry to user space once the current task is sane '''
+        if new != Sim_CPU_Mode_User or cell_name not in self.boot_haps or cell_name in self.boot_ready:
+            return
+        cpu = self.cell_config.cpuFromCell(cell_name)
+        if self.bootPid(cell_name, cpu) is not None:
+            self.boot_ready[cell_name] = cpu.cycles
+            self.lgr.debug('bootModeHap cell %s ready at cycle 0x%x' % (cell_name, cpu.cycles))
+            SIM_break_simulation('boot ready %s' % cell_name)
+
+    def addBootHaps(self):
+        for cell_name in self.cell_config.cell_context:
+            if cell_name not in self.param or cell_name in self.task_utils or cell_name in self.boot_haps:
+                continue
+            cpu = self.cell_config.cpuFromCell(cell_name)
+            try:
+                self.boot_haps[cell_name] = SIM_hap_add_callback_obj("Core_Mode_Change", cpu, 0, self.bootModeHap, cell_name)
+            except:
+                self.lgr.debug('addBootHaps could not add mode hap for cell %s, will poll' % cell_name)
+
+    def rmBootHap(self, cell_name):
+        if cell_name in self.boot_haps:
+            SIM_hap_delete_callback_id("Core_Mode_Change", self.boot_haps[cell_name])
+            del self.boot_haps[cell_name]
+
     def doInit(self):
+        ''' Run until each cell has booted far enough to have a current task.  A mode hap per cell
+            stops the simulation on the first entry to user space with a sane current task.  Cells
+            whose hap could not be added, or that were not ready when their hap fired, are only
+            checked every run_cycles. '''
         self.lgr.debug('genMonitor doInit')
         #SIM_run_command('pselect cpu-name = %s' % cpu.name)
         #run_cycles = 90000000
         run_cycles =  9000000
         #run_cycles = 900000
+        self.boot_haps = {}
+        ''' cell -> cycle at which bootModeHap saw it ready.  Not reset between continues, so
+            each cell breaks the simulation at most once, even if the TaskUtils check below
+            is not yet satisfied; after that the cell is only checked every run_cycles. '''
+        self.boot_ready = {}
+        ''' cell -> cycle at the start of the most recent continue '''
+        continue_start = {}
         done = False
         while not done:
             done = True
@@ -408,8 +483,9 @@ class GenMonitor():
                         done = False
                         continue
                     self.lgr.debug('doInit cell %s pid is %d' % (cell_name, pid))
-                    task_utils = taskUtils.TaskUtils(cpu, cell_name, self.param[cell_name], self.mem_utils[cell_name], 
-                            self.unistd[cell_name], self.run_from_snap, self.lgr)
+                    task_utils = taskUtils.TaskUtils(cpu, cell_name, self.param[cell_name], self.mem_utils[cell_name],
+                            self.unistd[cell_name], self.run_from_snap, self.lgr, syscall_table=self.syscall_table[cell_name],
+                            unistd32=self.unistd32[cell_name])
                     tu_cur_task_rec = task_utils.getCurTaskRec()
                     if tu_cur_task_rec is None:
                         self.lgr.debug('doInit cell %s cur_task_rec 0x%x pid %d but None from task_utils ' % (cell_name, cur_task_rec, pid))
@@ -417,6 +493,14 @@ class GenMonitor():
                         continue
                     self.lgr.debug('doInit cell %s cur_task_rec 0x%x pid %d from task_utils 0x%x' % (cell_name, cur_task_rec, pid, tu_cur_task_rec))
                     if tu_cur_task_rec != 0:
+                        self.rmBootHap(cell_name)
+                        if cell_name in continue_start:
+                            ran = cpu.cycles - continue_start[cell_name]
+                            if ran < run_cycles:
+                                saved = run_cycles - ran
+                                print('Cell %s ready early, saved 0x%x cycles (%.2f simulated seconds)' % (cell_name,
+                                      saved, saved / (cpu.freq_mhz * 1000000.0)))
+                                self.lgr.debug('doInit cell %s ready 0x%x cycles into continue, saved 0x%x' % (cell_name, ran, saved))
                         self.task_utils[cell_name] = task_utils
                         self.lgr.debug('doInit Booted enough to get cur_task_rec for cell %s, now call to finishInit' % cell_name)
                         self.finishInit(cell_name)
@@ -428,9 +512,13 @@ class GenMonitor():
                         self.lgr.debug('doInit cell %s taskUtils got task rec of zero' % cell_name)
                         done = False
             if not done:
+                self.addBootHaps()
+                for cell_name in self.boot_haps:
+                    continue_start[cell_name] = self.cell_config.cpuFromCell(cell_name).cycles
                 self.lgr.debug('continue %d cycles' % run_cycles)
                 SIM_continue(run_cycles)
-       
+        for cell_name in list(self.boot_haps):
+            self.rmBootHap(cell_name)
 
 
     def tasks(self):
@@ -472,6 +560,9 @@ class GenMonitor():
                 cmd = 'new-gdb-remote cpu=%s architecture=x86 port=%d' % (cpu.name, port)
             self.lgr.debug('cmd: %s' % cmd)
             SIM_run_command(cmd)
+            if self.ida_channel is None:
+                self.ida_channel = idaChannel.IdaChannel(self.lgr)
+            self.ida_channel.start()
             cmd = 'enable-reverse-execution'
             SIM_run_command(cmd)
             self.rev_execution_enabled = True
@@ -867,12 +958,21 @@ class GenMonitor():
         self.gdb_mailbox = msg
         #self.lgr.debug('in gdbMailbox msg set to <%s>' % msg)
         print('gdbMailbox:%s' % msg)
+        if self.ida_channel is not None:
+            self.ida_channel.post(msg)
+
+    def getIdaChannelPath(self):
+        ''' printed for the IDA client, which asks for the path through gdb, see ida/gdbProt.py '''
+        if self.ida_channel is not None and self.ida_channel.sock is not None:
+            print(self.ida_channel.path)
 
     def emptyMailbox(self):
         if self.gdb_mailbox is not None and self.gdb_mailbox != "None":
             print self.gdb_mailbox
             #self.lgr.debug('emptying mailbox of <%s>' % self.gdb_mailbox)
             self.gdb_mailbox = None
+        if self.ida_channel is not None:
+            self.ida_channel.clear()
 
     def runSkipAndMailAlone(self, cycles): 
         pid, dum2, cpu = self.context_manager[self.target].getDebugPid() 
@@ -891,13 +991,13 @@ class GenMonitor():
                 count = 0
                 while current != previous:
                     SIM_run_command('pselect cpu-name = %s' % cpu.name)
+                    pageUtils.clearPageCache()
                     SIM_run_command('skip-to cycle=%d' % previous)
                     eip = self.getEIP(cpu)
                     current = cpu.cycles
                     instruct = SIM_disassemble_address(cpu, eip, 1, 0)
                     if current != previous:
                         self.lgr.debug('runSkipAndMailAlone, have not yet reached previous %x %x eip: %x' % (current, previous, eip))
-                        time.sleep(1)
                     count += 1
                     if count > 3:
                         self.lgr.debug('skipAndMailAlone, will not reach previous, bail')
@@ -994,6 +1094,7 @@ class GenMonitor():
         self.stopped_reverse_instruction_hap = SIM_hap_add_callback("Core_Simulation_Stopped", 
 		    self.stoppedReverseInstruction, my_args)
         self.lgr.debug('reverseStepInstruction, added stop hap')
+        pageUtils.clearPageCache()
         SIM_run_alone(SIM_run_command, 'reverse-step-instruction %d' % num)
 
     def stoppedReverseInstruction(self, my_args, one, exception, error_string):
@@ -1007,6 +1108,7 @@ class GenMonitor():
             SIM_hap_delete_callback_id("Core_Simulation_Stopped", self.stopped_reverse_instruction_hap)
         else:
             self.lgr.debug('stoppedReverseInstruction in wrong pid (%d), try again' % pid)
+            pageUtils.clearPageCache()
             SIM_run_alone(SIM_run_command, 'reverse-step-instruction')
     
     def reverseToCallInstruction(self, step_into, prev=None):
@@ -1021,7 +1123,9 @@ class GenMonitor():
             if prev is not None:
                 instruct = SIM_disassemble_address(cpu, prev, 1, 0)
                 self.lgr.debug('reverseToCallInstruction instruct is %s at prev: 0x%x' % (instruct[1], prev))
-                if instruct[1] == 'int 128' or (not step_into and instruct[1].startswith('call')):
+                if self.rev_to_call[self.target].isSyscall(instruct[1]) and self.rev_to_call[self.target].jumpToPrevSyscall():
+                    self.lgr.debug('reverseToCallInstruction skipped to recorded syscall')
+                elif instruct[1] == 'int 128' or (not step_into and instruct[1].startswith('call')):
                     self.revToAddr(prev)
                 else:
                     self.rev_to_call[self.target].doRevToCall(step_into, prev)
@@ -1046,6 +1150,43 @@ class GenMonitor():
     def getInstance(self):
         return INSTANCE
  
+    def revToSyscall(self):
+        ''' reverse to the most recent system call of the debugged process, as recorded while running forward '''
+        if self.rev_execution_enabled:
+            self.removeDebugBreaks()
+            self.context_manager[self.target].clearExitBreak()
+            if not self.rev_to_call[self.target].jumpToPrevSyscall():
+                print('no system call recorded for the debugged process')
+                self.skipAndMail()
+        else:
+            print('reverse execution disabled')
+            self.skipAndMail()
+
+    def recordRegWrites(self, regs):
+        ''' Log writes to the given registers, e.g., ['eax', 'ebx'], by the debugged process while running
+            forward, so that revToModReg and backtracking can skip to the last write '''
+        pid, cell_name, cpu = self.context_manager[self.target].getDebugPid() 
+        if pid is None:
+            print('recordRegWrites requires a debugged process')
+            return
+        if self.target not in self.reg_write_log:
+            if cpu.architecture == 'arm':
+                decoder = decodeArm
+            else:
+                decoder = decode
+            cell = self.cell_config.cell_context[self.target]
+            self.reg_write_log[self.target] = regWriteLog.RegWriteLog(self, cpu, cell, self.context_manager[self.target], 
+                       decoder, self.param[self.target].kernel_base, self.lgr)
+            self.rev_to_call[self.target].setRegWriteLog(self.reg_write_log[self.target])
+        self.reg_write_log[self.target].start(regs)
+
+    def stopRecordRegWrites(self):
+        if self.target in self.reg_write_log:
+            self.reg_write_log[self.target].stop()
+
+    def getSyscallCycles(self):
+        return self.rev_to_call[self.target].getSyscallCycles()
+
     def revToModReg(self, reg):
         self.lgr.debug('revToModReg for reg %s' % reg)
         self.removeDebugBreaks()
@@ -1230,6 +1371,7 @@ class GenMonitor():
             if new_cycle >= start_cycles:
                 self.is_monitor_running.setRunning(True)
                 try:
+                    pageUtils.clearPageCache()
                     result = SIM_run_command('skip-to cycle=0x%x' % new_cycle)
                 except: 
                     print('Reverse execution disabled?')
@@ -1253,6 +1395,7 @@ class GenMonitor():
             cycles = cycles - 1
             cycles = cycles & 0xFFFFFFFFFFFFFFFF
             print('this skip-to cycle=0x%x' % cycles)
+            pageUtils.clearPageCache()
             SIM_run_command('skip-to cycle=0x%x' % cycles)
             eip = self.getEIP(cpu)
             cpl = memUtils.getCPL(cpu)
@@ -1534,6 +1677,7 @@ class GenMonitor():
         self.stop_hap = SIM_hap_add_callback("Core_Simulation_Stopped", 
           self.stopHap, stop_action)
         self.lgr.debug('hap set, now reverse')
+        pageUtils.clearPageCache()
         SIM_run_command('rev')
 
     def getSyscall(self, cell_name, callname):
@@ -1845,6 +1989,8 @@ class GenMonitor():
         cpu, comm, pid = self.task_utils[self.target].curProc() 
         phys_block = cpu.iface.processor_info.logical_to_physical(address, Sim_Access_Read)
         SIM_write_phys_memory(cpu, phys_block.address, value, 4)
+        self.mem_utils[self.target].invalidatePageCache()
+        instructCache.codeWritten(cpu, phys_block.address, 4)
         self.lgr.debug('writeWord, disable reverse execution to clear bookmarks, then set origin')
         cmd = 'disable-reverse-execution'
         SIM_run_command(cmd)
@@ -1924,6 +2070,23 @@ class GenMonitor():
     def getAutoMaze(self):
         return self.auto_maze
 
+    def suspendBreaks(self, suspend=True):
+        ''' True: disable/enable breakpoints on context switches.  False: delete and recreate them '''
+        for cell_name in self.context_manager:
+            self.context_manager[cell_name].suspendBreaks(suspend)
+        print('suspend breaks now %r' % suspend)
+
+    def curProcStats(self):
+        ''' report curProc cache hit/miss counts for each cell '''
+        for cell_name in self.task_utils:
+            hits, misses, rate = self.task_utils[cell_name].curProcStats()
+            print('%s curProc hits: %d misses: %d hit rate: %.1f%%' % (cell_name, hits, misses, rate))
+
+    def instructCacheStats(self):
+        ''' report decoded instruction cache hit/miss counts '''
+        hits, misses, stale = instructCache.stats
+        print('instruction cache entries: %d hits: %d misses: %d stale: %d' % (len(instructCache.instruct_cache), hits, misses, stale))
+
     def exitMaze(self, syscallname, debugging=False):
         cpu, comm, pid = self.task_utils[self.target].curProc() 
         cpl = memUtils.getCPL(cpu)
@@ -1981,23 +2144,17 @@ class GenMonitor():
     def writeConfig(self, name):
         cmd = 'write-configuration %s' % name 
         SIM_run_command(cmd)
+        snap_state = snapState.SnapState(self.lgr)
         for cell_name in self.cell_config.cell_context:
             if cell_name in self.netInfo:
-           
-                net_file = os.path.join('./', name, cell_name, 'net_list.pickle')
-                try:
-                    os.mkdir(os.path.dirname(net_file))
-                except OSError as exc:
-                    if exc.errno != errno.EEXIST:
-                        raise
-                    pass
-                self.netInfo[cell_name].pickleit(net_file)
-                self.task_utils[cell_name].pickleit(name)
-                self.soMap[cell_name].pickleit(name)
-                self.traceProcs[cell_name].pickleit(name)
-
-        net_link_file = os.path.join('./', name, 'net_link.pickle')
-        pickle.dump( self.link_dict, open( net_link_file, "wb" ) )
+                self.netInfo[cell_name].saveState(snap_state)
+                self.task_utils[cell_name].saveState(snap_state)
+                self.soMap[cell_name].saveState(snap_state)
+                self.traceProcs[cell_name].saveState(snap_state)
+
+        snap_state.put('netLinks', NET_LINK_VERSION, self.link_dict)
+        elfText.saveState(snap_state)
+        snap_state.write(name)
 
     def showCycle(self):
         pid, cell_name, cpu = self.context_manager[self.target].getDebugPid() 
@@ -2034,6 +2191,14 @@ class GenMonitor():
 
     def flushTrace(self):
         self.traceMgr[self.target].flush()
+        if self.target in self.traceFiles:
+            self.traceFiles[self.target].flush()
+
+    def traceBinary(self, binary=True):
+        ''' True: syscall traces opened from now on are written as binTrace records, see binTrace.py '''
+        for cell_name in self.traceMgr:
+            self.traceMgr[cell_name].setBinary(binary)
+        print('binary traces now %r' % binary)
 
     def getCurrentThreadLeaderPid(self):
         pid = self.task_utils[self.target].getCurrentThreadLeaderPid()
@@ -31,7 +31,10 @@ import memUtils
 import taskUtils
 import resim_utils
 import kParams
+import kernelScan
 import pickle
+''' words of kernel data searched for the current_task pointer '''
+SEARCH_WORDS = 14000000
 class GetKernelParams():
     def __init__(self):
         self.cpu = SIM_current_processor()
@@ -76,6 +79,8 @@ class GetKernelParams():
         self.from_boot = False
         self.try_mode_switches = 0 
         self.init_task = None
+        ''' hash of kernel text used to cache the resulting params '''
+        self.fingerprint = None
 
     def searchCurrentTaskAddr(self, cur_task):
         ''' Look for the Linux data addresses corresponding to the current_task symbol 
@@ -95,32 +100,49 @@ class GetKernelParams():
             addr = phys_block.address
         #print('cmd is %s' % cmd)
         self.lgr.debug('start search addr 0x%x' % addr)
-        got_count = 0
-        offset = 0
-        for i in range(14000000):
-            val = None
-            try:
-                val = SIM_read_phys_memory(self.cpu, addr, 4)
-            except:
-                pass
-            #self.lgr.debug('val is 0x%x' % val)
-            #val = self.mem_utils.readPtr(self.cpu, addr)
-            if val is None:
-                self.lgr.error('got None at 0x%x' % addr)
-                return 
-            if val == cur_task:
-                vaddr = start+offset
-                self.lgr.debug('got match at addr: 0x%x vaddr: 0x%x' % (addr, vaddr))
-                self.hits.append(vaddr)
-                got_count += 1
-                #break
-            if got_count == 9999:
-                self.lgr.error('exceeded count')
-                break
-            #print('got 0x%x from 0x%x' % (val, addr))
-            addr += 4
-            offset += 4
-        self.lgr.debug('final addr is 0x%x num hits %d' % ((start+offset), len(self.hits)))
+        offsets = kernelScan.scanMemory(self.readPhys, addr, SEARCH_WORDS*4, cur_task, lgr=self.lgr)
+        for offset in offsets:
+            vaddr = start+offset
+            #self.lgr.debug('got match at addr: 0x%x vaddr: 0x%x' % (addr+offset, vaddr))
+            self.hits.append(vaddr)
+        self.lgr.debug('searchCurrentTaskAddr num hits %d' % (len(self.hits)))
+
+    def readPhys(self, paddr, count):
+        return str(bytearray(memUtils.readPhysBytes(self.cpu, paddr, count)))
+
+    def getTextStart(self):
+        ''' physical address of the start of kernel text, or None '''
+        if self.cpu.architecture == 'arm':
+            start = self.param.kernel_base + 0x8000
+        else:
+            start = self.param.kernel_base + 0x1000000
+        try:
+            phys_block = self.cpu.iface.processor_info.logical_to_physical(start, Sim_Access_Read)
+        except:
+            return None
+        if not phys_block.valid:
+            return None
+        return phys_block.address
+
+    def useCachedParam(self):
+        ''' If the parameters of a kernel with the same text were saved earlier, use them. '''
+        text_start = self.getTextStart()
+        if text_start is None:
+            self.lgr.debug('useCachedParam could not find kernel text')
+            return False
+        self.fingerprint = kernelScan.fingerprint(self.readPhys, text_start, self.cpu.architecture, self.mem_utils.WORD_SIZE)
+        if self.fingerprint is None:
+            self.lgr.debug('useCachedParam kernel text at 0x%x not readable' % text_start)
+            return False
+        param = kernelScan.loadCachedParam(self.fingerprint)
+        if param is None:
+            self.lgr.debug('useCachedParam no cached params for kernel %s' % self.fingerprint)
+            return False
+        self.lgr.debug('useCachedParam using cached params for kernel %s' % self.fingerprint)
+        print('Kernel matches previously found parameters %s' % self.fingerprint)
+        self.param = param
+        self.saveParam()
+        return True
 
     def checkHits(self, cur_task):
         ''' look at previously generated list of candidate current_task addresses and remove any
@@ -327,6 +349,8 @@ class GetKernelParams():
     def runUntilSwapper(self):
         ''' run until it appears that the swapper is running.  Will set self.idle, real_parent, siblings '''
         self.lgr.debug('runUntilSwapper')
+        if self.useCachedParam():
+            return
         if self.param.current_task is None:
             self.lgr.debug('will get Current Task Ptr, may take a minute')
             self.getCurrentTaskPtr()
@@ -690,7 +714,12 @@ class GetKernelParams():
     def saveParam(self):
         self.lgr.debug('saveParam')
         fname = '%s.param' % self.target
+        if getattr(self.param, 'syscall_table', None) is None and self.param.syscall_jump is not None:
+            self.param.syscall_table = taskUtils.readSyscallTable(self.cpu, self.param, self.mem_utils)
+            self.lgr.debug('saveParam resolved %d sys_call_table entries' % len(self.param.syscall_table))
         pickle.dump( self.param, open( fname, "wb" ) )
+        if self.fingerprint is not None:
+            kernelScan.saveCachedParam(self.fingerprint, self.param)
         self.param.printParams()
         print('Param file stored in %s' % fname)
 
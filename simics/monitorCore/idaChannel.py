@@ -0,0 +1,142 @@
+import os
+import json
+import socket
+import threading
+'''
+Request/response channel between the IDA client (see ida/gdbProt.py) and the
+monitor over a Unix domain socket owned by the monitor.  Messages are JSON, one
+per line.  The client sends {"id": n, "op": "wait_stop"} and the monitor replies
+{"id": n, "mail": msg} as soon as gdbMailbox is given a message, rather than the
+client polling getEIPWhenStopped.  Mail already posted and not yet emptied is
+returned at once.  A "ping" op is answered immediately, e.g., to measure round
+trip latency.
+
+The default path includes the pid of the monitor, so that monitors on one host
+each have their own.  The client asks the monitor for the path via gdb, see
+getIdaChannelPath.  RESIM_IDA_SOCKET overrides the path at both ends.
+
+Only the socket thread reads the socket.  Replies are written under the lock by
+whichever thread has them, i.e., the socket thread or the Simics thread calling post.
+No Simics API is used from the socket thread.
+'''
+DEFAULT_PATH = '/tmp/resim_ida_%d.sock'
+
+class IdaChannel():
+    def __init__(self, lgr, path=None):
+        self.lgr = lgr
+        if path is None:
+            path = os.getenv('RESIM_IDA_SOCKET', DEFAULT_PATH % os.getpid())
+        self.path = path
+        self.lock = threading.Lock()
+        self.sock = None
+        self.conn = None
+        ''' request ids waiting for mail '''
+        self.waiting = []
+        self.mail = None
+        self.thread = None
+
+    def start(self):
+        if self.sock is not None:
+            return True
+        try:
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.bind(self.path)
+            self.sock.listen(1)
+        except (socket.error, OSError) as e:
+            self.lgr.error('IdaChannel failed to listen on %s: %s' % (self.path, str(e)))
+            self.sock = None
+            return False
+        self.thread = threading.Thread(target=self.serve)
+        self.thread.daemon = True
+        self.thread.start()
+        self.lgr.debug('IdaChannel listening on %s' % self.path)
+        return True
+
+    def stop(self):
+        if self.sock is None:
+            return
+        sock = self.sock
+        self.sock = None
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+        sock.close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+    def serve(self):
+        while self.sock is not None:
+            try:
+                conn, dumb = self.sock.accept()
+            except socket.error:
+                break
+            with self.lock:
+                if self.conn is not None:
+                    self.conn.close()
+                self.conn = conn
+                self.waiting = []
+            self.lgr.debug('IdaChannel client connected')
+            self.readRequests(conn)
+            with self.lock:
+                if self.conn is conn:
+                    self.conn = None
+                    self.waiting = []
+            conn.close()
+
+    def readRequests(self, conn):
+        buf = ''
+        while True:
+            try:
+                data = conn.recv(4096)
+            except socket.error:
+                return
+            if not data:
+                return
+            buf += data
+            while '\n' in buf:
+                line, buf = buf.split('\n', 1)
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    self.lgr.error('IdaChannel bad request %s' % line)
+                    continue
+                self.handle(conn, request)
+
+    def handle(self, conn, request):
+        req_id = request.get('id')
+        op = request.get('op')
+        with self.lock:
+            if op == 'wait_stop':
+                if self.mail is not None:
+                    self.send(conn, {'id':req_id, 'mail':self.mail})
+                else:
+                    self.waiting.append(req_id)
+            elif op == 'ping':
+                self.send(conn, {'id':req_id, 'pong':True})
+            else:
+                self.send(conn, {'id':req_id, 'error':'unknown op %s' % op})
+
+    def send(self, conn, reply):
+        ''' call with the lock held '''
+        try:
+            conn.sendall(json.dumps(reply)+'\n')
+        except socket.error as e:
+            self.lgr.debug('IdaChannel send failed %s' % str(e))
+
+    def post(self, mail):
+        ''' new mailbox content, reply to any waiting requests '''
+        with self.lock:
+            self.mail = mail
+            if self.conn is not None:
+                for req_id in self.waiting:
+                    self.send(self.conn, {'id':req_id, 'mail':mail})
+            self.waiting = []
+
+    def clear(self):
+        with self.lock:
+            self.mail = None
@@ -1,18 +1,97 @@
 import os
 import json
+import bisect
+import hashlib
+import struct
+from array import array
+'''
+Function bounds from IDA .funs files, held as sorted start addresses with parallel
+end addresses and names, and searched with bisect.  Files are not read until a query
+falls within the range of the program or shared object they describe.  Parsed files
+are cached in a compact binary form under FUNS_CACHE_DIR, keyed by a hash of the
+.funs file content.
+'''
+FUNS_CACHE_DIR = './funs_cache'
+CACHE_MAGIC = 'RFUN1'
+HEADER = struct.Struct('<5sII')
+
+def readCache(cache_file):
+    ''' starts, ends and names from a cache file, or None if it is not a complete cache of this format '''
+    with open(cache_file, 'rb') as fh:
+        data = fh.read()
+    if len(data) < HEADER.size:
+        return None
+    magic, itemsize, count = HEADER.unpack_from(data)
+    starts = array('L')
+    ends = array('L')
+    length = count * starts.itemsize
+    if magic != CACHE_MAGIC or itemsize != starts.itemsize or len(data) < HEADER.size + 2 * length:
+        return None
+    offset = HEADER.size
+    starts.fromstring(data[offset:offset+length])
+    ends.fromstring(data[offset+length:offset+2*length])
+    names = data[offset+2*length:].split('\0')
+    if count == 0:
+        names = []
+    if len(names) != count or '' in names:
+        ''' IDA names are never empty, an empty last name is a truncated file '''
+        return None
+    return starts, ends, names
+
+def writeCache(cache_file, starts, ends, names):
+    ''' write to a temporary file renamed into place, so that readers never see a partial cache '''
+    if not os.path.isdir(FUNS_CACHE_DIR):
+        os.makedirs(FUNS_CACHE_DIR)
+    tmp_file = '%s.%d.tmp' % (cache_file, os.getpid())
+    with open(tmp_file, 'wb') as fh:
+        fh.write(HEADER.pack(CACHE_MAGIC, starts.itemsize, len(starts)))
+        fh.write(starts.tostring())
+        fh.write(ends.tostring())
+        fh.write('\0'.join(names))
+    os.rename(tmp_file, cache_file)
+
+def parseFuns(fun_path):
+    ''' return arrays of starts and ends, and list of names, sorted by start, not relocated '''
+    with open(fun_path, 'rb') as fh:
+        content = fh.read()
+    digest = hashlib.sha1(content).hexdigest()
+    cache_file = os.path.join(FUNS_CACHE_DIR, digest)
+    if os.path.isfile(cache_file):
+        cached = readCache(cache_file)
+        if cached is not None:
+            return cached
+    jfuns = json.loads(content)
+    funs = []
+    for f in jfuns:
+        name = jfuns[f]['name']
+        if isinstance(name, unicode):
+            name = name.encode('utf-8')
+        funs.append((int(f), jfuns[f]['end'], name))
+    funs.sort()
+    starts = array('L', [f[0] for f in funs])
+    ends = array('L', [f[1] for f in funs])
+    names = [f[2] for f in funs]
+    try:
+        writeCache(cache_file, starts, ends, names)
+    except (IOError, OSError):
+        pass
+    return starts, ends, names
+
 class IDAFuns():
 
     def __init__(self, path, lgr):
-        self.funs = {}
         self.lgr = lgr
-        self.did_paths = []
+        self.did_paths = set()
+        ''' sorted function starts, with parallel ends and names '''
+        self.starts = []
+        self.ends = []
+        self.names = []
+        ''' .funs files not yet read: (fun_path, offset, start, end) where start/end bound the
+            addresses they describe, end of None means load on the next query '''
+        self.pending = []
         #self.lgr.debug('IDAFuns for path %s' % path)
         if os.path.isfile(path):
-            with open(path) as fh:
-                jfuns = json.load(fh)
-                for sfun in jfuns:
-                    fun = int(sfun)
-                    self.funs[fun] = jfuns[sfun]
+            self.pending.append((path, 0, 0, None))
 
     def getFunPath(self, path):
         fun_path = path+'.funs'
@@ -24,54 +103,75 @@ class IDAFuns():
                 #self.lgr.debug('actual  %s' % actual)
                 fun_path = actual+'.funs'
         return fun_path
-            
-    def add(self, path, offset):
+
+    def add(self, path, offset, end=None):
+        ''' note the functions of a shared object loaded at offset, read when first queried '''
         if path in self.did_paths:
             return
         else:
-            self.did_paths.append(path)
+            self.did_paths.add(path)
         funfile = self.getFunPath(path)
         if os.path.isfile(funfile):
-            with open(funfile) as fh:
-                #self.lgr.debug('IDAFuns add for path %s offset 0x%x' % (path, offset))
-                newfuns = json.load(fh) 
-                for f in newfuns:
-                    fun = int(f)+offset
-                    self.funs[fun] = {}
-                    self.funs[fun]['start'] = fun
-                    self.funs[fun]['end'] = newfuns[f]['end']+offset
-                    self.funs[fun]['name'] = newfuns[f]['name']
-                    #self.lgr.debug('idaFun add %s was %s %x %x   now %x %x %x' % (newfuns[f]['name'], f, newfuns[f]['start'], newfuns[f]['end'], fun, self.funs[fun]['start'], self.funs[fun]['end']))
+            #self.lgr.debug('IDAFuns add for path %s offset 0x%x' % (path, offset))
+            self.pending.append((funfile, offset, offset, end))
         else:
             #self.lgr.debug('IDAFuns NOTHING at %s' % funfile)
             pass
 
- 
+    def load(self, fun_path, offset):
+        try:
+            starts, ends, names = parseFuns(fun_path)
+        except (IOError, ValueError, KeyError) as e:
+            self.lgr.error('IDAFuns failed to read %s: %s' % (fun_path, str(e)))
+            return
+        funs = zip(self.starts, self.ends, self.names)
+        funs.extend(zip([s+offset for s in starts], [e+offset for e in ends], names))
+        funs.sort()
+        self.starts = [f[0] for f in funs]
+        self.ends = [f[1] for f in funs]
+        self.names = [f[2] for f in funs]
+
+    def loadFor(self, ip):
+        ''' read any pending .funs files whose range may include the address '''
+        if len(self.pending) == 0:
+            return
+        still_pending = []
+        for fun_path, offset, start, end in self.pending:
+            if end is None or (ip >= start and ip <= end):
+                self.load(fun_path, offset)
+            else:
+                still_pending.append((fun_path, offset, start, end))
+        self.pending = still_pending
+
+    def findStart(self, fun):
+        ''' index of the function starting at the given address, or None '''
+        self.loadFor(fun)
+        index = bisect.bisect_left(self.starts, fun)
+        if index < len(self.starts) and self.starts[index] == fun:
+            return index
+        return None
+
     def isFun(self, fun):
-        if fun in self.funs:
-            return True
-        else:
-            return False
+        return self.findStart(fun) is not None
 
     def getName(self, fun):
-        if fun in self.funs:
-            return self.funs[fun]['name']
+        index = self.findStart(fun)
+        if index is not None:
+            return self.names[index]
         else:
             return None
 
     def inFun(self, ip, fun):
         #self.lgr.debug('is 0x%x in %x ' % (ip, fun))
-        if fun in self.funs:
-            if ip >= self.funs[fun]['start'] and ip <= self.funs[fun]['end']:
+        index = self.findStart(fun)
+        if index is not None:
+            if ip >= self.starts[index] and ip <= self.ends[index]:
                 return True
-        else:
-            return False 
+        return False
 
     def getFun(self, ip):
-        for fun in self.funs:
-            if ip >= self.funs[fun]['start'] and ip <= self.funs[fun]['end']:
-                return fun
-            #print('ip 0x%x start 0x%x - 0x%x' % (ip, self.funs[fun]['start'], self.funs[fun]['end']))
+        self.loadFor(ip)
+        index = bisect.bisect_right(self.starts, ip) - 1
+        if index >= 0 and ip <= self.ends[index]:
+            return self.starts[index]
         return None
-
-        
@@ -0,0 +1,169 @@
+'''
+Cache of disassembled and decoded instructions, shared by the reverse execution,
+stack trace and exit maze code, which otherwise disassemble and re-parse the same
+instructions many times per search.
+
+Entries are keyed by (cell, physical address, code page generation).  The generation
+of a page is bumped when the monitor writes to it, see codeWritten.  Since the target
+itself may replace code, e.g., a page reused by the loader, or an earlier cycle when
+reversing, the instruction bytes are compared before a cached entry is returned.
+'''
+from simics import *
+import decode
+import decodeArm
+import memUtils
+import pageUtils
+''' entries held before the cache is flushed '''
+INSTRUCT_CACHE_MAX = 100000
+instruct_cache = {}
+''' (cell, page) -> generation, bumped on writes to the page '''
+page_gen = {}
+''' hits, misses, and entries found stale '''
+stats = [0, 0, 0]
+
+class Decoded():
+    def __init__(self, cpu, length, text):
+        self.length = length
+        self.text = text
+        self.data = None
+        ''' cycle at which the instruction bytes were last compared '''
+        self.checked = None
+        if cpu.architecture == 'arm':
+            self.decoder = decodeArm
+        else:
+            self.decoder = decode
+        parts = text.split(None, 1)
+        if len(parts) == 0:
+            self.mn = ''
+        else:
+            self.mn = parts[0]
+        self.op1, self.op0 = self.getOperands(text)
+        ''' operand.Operand models of the destination and source '''
+        self.dst = self.decoder.parseOperand(self.op0)
+        self.src = self.decoder.parseOperand(self.op1)
+        self.op0_kind = self.opKind(self.dst)
+        self.op1_kind = self.opKind(self.src)
+        self.mem_op = None
+        self.ea = None
+        for op in [self.dst, self.src]:
+            if op is not None and op.kind == 'mem':
+                self.mem_op = op.text
+                self.ea = op.ea
+                break
+        ''' register families, see regFamily in the decode modules '''
+        self.regs_written = set()
+        self.regs_read = set()
+        loads_list = self.mn.startswith('pop') or self.mn.startswith('ldm')
+        for op in [self.dst, self.src]:
+            if op is None or (op.kind == 'reglist' and loads_list):
+                continue
+            if op is self.dst and op.kind == 'reg' and self.isPureWrite():
+                continue
+            self.regs_read.update(op.regs)
+        if self.dst is not None and self.dst.kind == 'reg':
+            if self.decoder.modifiesOp0(self.mn):
+                self.regs_written.add(self.dst.reg)
+            if self.dst.writeback:
+                self.regs_written.add(self.dst.reg)
+        if self.mn == 'xchg' and self.src is not None and self.src.kind == 'reg':
+            self.regs_written.add(self.src.reg)
+        if self.ea is not None and self.ea.writeback:
+            self.regs_written.add(self.decoder.regFamily(self.ea.base))
+        if loads_list:
+            for op in [self.dst, self.src]:
+                if op is not None and op.kind == 'reglist':
+                    self.regs_written.update(op.reglist)
+        self.branch_target = None
+        if self.isBranch() and self.dst is not None and self.dst.kind == 'imm':
+            self.branch_target = self.dst.value
+
+    def modifiesReg(self, reg):
+        ''' does the instruction write to the register or any part of it '''
+        return self.decoder.regFamily(reg) in self.regs_written
+
+    def getOperands(self, text):
+        ''' source and destination operands, as returned by the decode modules '''
+        try:
+            return self.decoder.getOperands(text)
+        except (ValueError, IndexError):
+            parts = text.split(None, 1)
+            if len(parts) > 1:
+                return None, parts[1].strip()
+            return None, None
+
+    def opKind(self, op):
+        if op is None:
+            return None
+        return op.kind
+
+    def isPureWrite(self):
+        return self.mn.startswith('mov') or self.mn.startswith('ldr') or self.mn in ['lea', 'pop', 'mvn']
+
+    def isBranch(self):
+        if self.decoder is decodeArm:
+            return self.mn.startswith('b') and not self.mn.startswith('bic')
+        else:
+            return self.mn.startswith('j') or self.mn.startswith('call')
+
+def getPageGen(cell_name, paddr):
+    return page_gen.get((cell_name, paddr & ~(pageUtils.PAGE_SIZE - 1)), 0)
+
+def codeWritten(cpu, paddr, length):
+    ''' call when the monitor writes target memory, cached instructions on the pages are dropped '''
+    cell_name = decode.getTopComponentName(cpu)
+    page = paddr & ~(pageUtils.PAGE_SIZE - 1)
+    while page < paddr + length:
+        key = (cell_name, page)
+        page_gen[key] = page_gen.get(key, 0) + 1
+        page += pageUtils.PAGE_SIZE
+
+def clear():
+    global instruct_cache
+    instruct_cache = {}
+
+def getDecoded(cpu, addr):
+    ''' Return the Decoded instruction at the given virtual address '''
+    paddr = None
+    try:
+        phys_block = cpu.iface.processor_info.logical_to_physical(addr, Sim_Access_Execute)
+        paddr = phys_block.address
+    except:
+        pass
+    if paddr is None or paddr == 0:
+        instruct = SIM_disassemble_address(cpu, addr, 1, 0)
+        return Decoded(cpu, instruct[0], instruct[1])
+    cell_name = decode.getTopComponentName(cpu)
+    key = (cell_name, paddr, getPageGen(cell_name, paddr))
+    decoded = instruct_cache.get(key)
+    if decoded is not None:
+        if decoded.checked == cpu.cycles:
+            stats[0] += 1
+            return decoded
+        try:
+            data = memUtils.readPhysBytes(cpu, paddr, decoded.length)
+        except ValueError:
+            data = None
+        if data == decoded.data:
+            stats[0] += 1
+            decoded.checked = cpu.cycles
+            return decoded
+        stats[2] += 1
+    stats[1] += 1
+    instruct = SIM_disassemble_address(cpu, addr, 1, 0)
+    decoded = Decoded(cpu, instruct[0], instruct[1])
+    ''' instructions that cross a page may not be physically contiguous, do not cache them '''
+    if pageUtils.pageLen(paddr, pageUtils.PAGE_SIZE) >= decoded.length:
+        try:
+            decoded.data = memUtils.readPhysBytes(cpu, paddr, decoded.length)
+        except ValueError:
+            return decoded
+        decoded.checked = cpu.cycles
+        if len(instruct_cache) >= INSTRUCT_CACHE_MAX:
+            clear()
+        instruct_cache[key] = decoded
+    return decoded
+
+def disassemble(cpu, addr):
+    ''' same result as SIM_disassemble_address(cpu, addr, 1, 0), i.e., (length, text) '''
+    decoded = getDecoded(cpu, addr)
+    return decoded.length, decoded.text
@@ -60,6 +60,8 @@ class Kparams():
         self.page_fault = None
         self.syscall_compute = None
         self.syscall_jump = None
+        ''' call number -> handler address read from sys_call_table, resolved once per kernel '''
+        self.syscall_table = None
         self.stack_frame_eip = None
 
 
@@ -67,13 +69,17 @@ class Kparams():
         print('Kernel parameters:')
         for k in self.__dict__.keys():
             v = self.__dict__.__getitem__(k)
-            if v is not None:
+            if isinstance(v, dict):
+                print('\t%-30s  %d entries' % (k, len(v)))
+            elif v is not None:
                 print('\t%-30s  %s' % (k, v))
 
     def getParamString(self):
         retval = 'Kernel parameters:\n'
         for k in self.__dict__.keys():
             v = self.__dict__.__getitem__(k)
-            if v is not None:
+            if isinstance(v, dict):
+                retval = retval + '\t%-30s  %d entries\n' % (k, len(v))
+            elif v is not None:
                 retval = retval + '\t%-30s  %s\n' % (k, v)
         return retval
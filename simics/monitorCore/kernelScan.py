@@ -0,0 +1,109 @@
+import os
+import struct
+import hashlib
+import pickle
+'''
+Memory scanning and kernel fingerprinting used by getKernelParams.  Nothing
+here calls Simics: memory is read through a read function of (paddr, count)
+that returns a string of bytes or raises ValueError, so the same code runs on
+a raw memory dump, see fileReader.
+
+Kernel parameters found by getKernelParams are saved in KPARAM_CACHE_DIR keyed
+by a hash of the first pages of kernel text, and reused when a kernel with the
+same text is seen again.
+'''
+SCAN_CHUNK = 0x10000
+PAGE_SIZE = 0x1000
+FINGERPRINT_PAGES = 16
+KPARAM_CACHE_DIR = './kparam_cache'
+
+def findWords(data, value, word_size=4):
+    ''' offsets of word aligned little-endian occurrences of value within data '''
+    if word_size == 8:
+        pattern = struct.pack('<Q', value)
+    else:
+        pattern = struct.pack('<I', value)
+    retval = []
+    index = data.find(pattern)
+    while index >= 0:
+        if index % word_size == 0:
+            retval.append(index)
+            index = data.find(pattern, index+word_size)
+        else:
+            index = data.find(pattern, index+1)
+    return retval
+
+def readChunk(read_fn, paddr, count):
+    ''' Read count bytes, a page at a time if the whole chunk cannot be read.  Returns
+        what could be read up to the first unreadable page. '''
+    try:
+        return read_fn(paddr, count)
+    except ValueError:
+        pass
+    retval = ''
+    while len(retval) < count:
+        try:
+            retval += read_fn(paddr+len(retval), min(PAGE_SIZE, count-len(retval)))
+        except ValueError:
+            break
+    return retval
+
+def scanMemory(read_fn, start, length, value, word_size=4, max_hits=9999, lgr=None):
+    ''' Return offsets from start of word aligned occurrences of value in length bytes of
+        memory.  Scanning stops at the first unreadable page, or after max_hits. '''
+    retval = []
+    offset = 0
+    while offset < length:
+        count = min(SCAN_CHUNK, length - offset)
+        data = readChunk(read_fn, start+offset, count)
+        for index in findWords(data, value, word_size):
+            retval.append(offset+index)
+            if len(retval) >= max_hits:
+                if lgr is not None:
+                    lgr.error('scanMemory exceeded %d hits' % max_hits)
+                return retval
+        if len(data) < count:
+            if lgr is not None:
+                lgr.debug('scanMemory could not read at 0x%x, stop' % (start+offset+len(data)))
+            break
+        offset += count
+    return retval
+
+def fileReader(path, base=0):
+    ''' read function over a raw dump of physical memory that starts at address base '''
+    def read_fn(paddr, count):
+        with open(path, 'rb') as fh:
+            fh.seek(paddr - base)
+            data = fh.read(count)
+        if len(data) == 0:
+            raise ValueError('failed to read %d bytes from 0x%x' % (count, paddr))
+        return data
+    return read_fn
+
+def fingerprint(read_fn, text_start, arch, word_size, pages=FINGERPRINT_PAGES):
+    ''' hash of the first pages of kernel text, or None if they cannot be read '''
+    length = pages * PAGE_SIZE
+    data = readChunk(read_fn, text_start, length)
+    if len(data) < length or data.count('\0') == length:
+        return None
+    digest = hashlib.sha1()
+    digest.update('%s %d ' % (arch, word_size))
+    digest.update(data)
+    return digest.hexdigest()
+
+def loadCachedParam(digest):
+    cache_file = os.path.join(KPARAM_CACHE_DIR, digest)
+    if os.path.isfile(cache_file):
+        try:
+            return pickle.load( open(cache_file, 'rb') )
+        except (IOError, pickle.UnpicklingError, EOFError, AttributeError):
+            return None
+    return None
+
+def saveCachedParam(digest, param):
+    try:
+        if not os.path.isdir(KPARAM_CACHE_DIR):
+            os.makedirs(KPARAM_CACHE_DIR)
+        pickle.dump( param, open( os.path.join(KPARAM_CACHE_DIR, digest), "wb" ) )
+    except (IOError, OSError):
+        pass
@@ -24,16 +24,20 @@
 '''
 
 import pageUtils
+import instructCache
 import json
 import struct
+import binascii
 from simics import *
 MACHINE_WORD_SIZE = 8
+''' most physical pages held by the page cache before it is flushed '''
+PAGE_CACHE_MAX = 256
 
 def readPhysBytes(cpu, paddr, count):
     try:
         return cpu.iface.processor_info_v2.get_physical_memory().iface.memory_space.read(cpu, paddr, count, 0)
     except:
-        raise valueError('failed to read %d bytes from 0x%x' % (count, paddr))
+        raise ValueError('failed to read %d bytes from 0x%x' % (count, paddr))
 
 def getCPL(cpu):
     #print('arch %s' % cpu.architecture)
@@ -106,7 +110,82 @@ class memUtils():
             self.regs['esp'] = 'sp'
         else: 
             self.lgr.error('memUtils, unknown architecture %s' % arch)
+        ''' physical pages read through a single memory space read, keyed by (cpu, page address).
+            Only valid while the cycle counts of all cpus sharing the memory are unchanged, i.e.,
+            within one hap or one stop, since other cores may write memory within a time quantum. '''
+        self.page_cache = {}
+        self.page_cache_cycle = {}
+        ''' cpu -> cpus sharing its physical memory '''
+        self.memory_cpus = {}
             
+    def invalidatePageCache(self):
+        ''' call after writing target memory or changing simulation state without advancing time '''
+        self.page_cache = {}
+        self.page_cache_cycle = {}
+
+    def getMemoryCpus(self, cpu):
+        if cpu not in self.memory_cpus:
+            cpus = []
+            for proc in SIM_get_all_processors():
+                try:
+                    if proc.physical_memory == cpu.physical_memory:
+                        cpus.append(proc)
+                except AttributeError:
+                    pass
+            if cpu not in cpus:
+                cpus.append(cpu)
+            self.memory_cpus[cpu] = cpus
+        return self.memory_cpus[cpu]
+
+    def getPhysPage(self, cpu, page):
+        cycle = tuple([proc.cycles for proc in self.getMemoryCpus(cpu)])
+        if self.page_cache_cycle.get(cpu) != cycle:
+            for key in [k for k in self.page_cache if k[0] == cpu]:
+                del self.page_cache[key]
+            self.page_cache_cycle[cpu] = cycle
+        key = (cpu, page)
+        if key not in self.page_cache:
+            if len(self.page_cache) >= PAGE_CACHE_MAX:
+                self.page_cache = {}
+            self.page_cache[key] = bytearray(readPhysBytes(cpu, page, pageUtils.PAGE_SIZE))
+        return self.page_cache[key]
+
+    def readPhysBlock(self, cpu, paddr, count):
+        ''' Return a bytearray of count bytes from physical memory, read a page at a time
+            through the page cache.  Falls back to a direct read, e.g., for device memory that
+            cannot be read as whole pages. Raises ValueError if the memory cannot be read. '''
+        retval = bytearray()
+        while count > 0:
+            page = paddr & ~(pageUtils.PAGE_SIZE - 1)
+            offset = paddr - page
+            chunk = min(count, pageUtils.PAGE_SIZE - offset)
+            try:
+                data = self.getPhysPage(cpu, page)
+                retval += data[offset:offset+chunk]
+            except ValueError:
+                retval += bytearray(readPhysBytes(cpu, paddr, chunk))
+            paddr += chunk
+            count -= chunk
+        return retval
+
+    def readBytes(self, cpu, vaddr, count):
+        ''' Return a bytearray of count bytes starting at the given virtual address, translating
+            each page.  Returns what could be read if a page is not mapped. '''
+        retval = bytearray()
+        while count > 0:
+            chunk = min(count, pageUtils.pageLen(vaddr, pageUtils.PAGE_SIZE))
+            paddr = self.v2p(cpu, vaddr)
+            if paddr is None or paddr == 0:
+                break
+            try:
+                retval += self.readPhysBlock(cpu, paddr, chunk)
+            except ValueError:
+                self.lgr.error('memUtils readBytes failed to read %d bytes from phys 0x%x' % (chunk, paddr))
+                break
+            vaddr += chunk
+            count -= chunk
+        return retval
+
     def v2p(self, cpu, v):
         try:
             phys_block = cpu.iface.processor_info.logical_to_physical(v, Sim_Access_Read)
@@ -148,28 +227,50 @@ class memUtils():
         return self.readStringPhys(cpu, phys_block.address, maxlen)
 
     def readStringPhys(self, cpu, paddr, maxlen):
-        s = ''
-        read_data = readPhysBytes(cpu, paddr, maxlen)
-        for v in read_data:
-            if v == 0:
-                del read_data
-                return s
-            s += chr(v)
+        read_data = self.readPhysBlock(cpu, paddr, maxlen)
+        end = read_data.find('\0')
+        if end >= 0:
+            return str(read_data[:end])
+        s = str(read_data)
         if len(s) > 0:
             return s
         else: 
             return None
+
+    def readStringBytes(self, cpu, vaddr, maxlen):
+        ''' as readString, but return a bytearray, or None if the address is not mapped '''
+        try:
+            phys_block = cpu.iface.processor_info.logical_to_physical(vaddr, Sim_Access_Read)
+        except:
+            return None
+        if phys_block.address == 0:
+            return None
+        return self.readStringPhysBytes(cpu, phys_block.address, maxlen)
+
+    def readStringPhysBytes(self, cpu, paddr, maxlen):
+        read_data = self.readPhysBlock(cpu, paddr, maxlen)
+        end = read_data.find('\0')
+        if end >= 0:
+            del read_data[end:]
+        return read_data
     
-    def readWord32(self, cpu, vaddr):
+    def readWord32Bytes(self, cpu, vaddr):
+        ''' the 4 bytes at vaddr as a bytearray, or None '''
         paddr = self.v2p(cpu, vaddr) 
         if paddr is None:
             self.lgr.error('readWord32 phys of 0x%x is none' % vaddr)
+            return None
         try:
-            value = SIM_read_phys_memory(cpu, paddr, 4)
-        except:
+            return self.readPhysBlock(cpu, paddr, 4)
+        except ValueError:
             self.lgr.error('readWord32 could not read content of %s' % str(paddr))
-            value = None
-        return value
+            return None
+
+    def readWord32(self, cpu, vaddr):
+        value = self.readWord32Bytes(cpu, vaddr)
+        if value is None:
+            return None
+        return struct.unpack('<I', str(value))[0]
 
     def readWord16(self, cpu, vaddr):
         return SIM_read_phys_memory(cpu, self.v2p(cpu, vaddr), 2)
@@ -208,19 +309,29 @@ class memUtils():
             self.lgr.error('readPhysPtr fails on address 0x%x' % addr)
             return None
 
-    def readPtr(self, cpu, vaddr):
+    def readPtrBytes(self, cpu, vaddr):
+        ''' the WORD_SIZE bytes at vaddr as a bytearray, or None '''
         size = self.WORD_SIZE
         #if vaddr < self.param.kernel_base:
         #    size = min(size, 6)
         phys = self.v2p(cpu, vaddr)
         if phys is not None:
             try:
-                return self.getUnsigned(SIM_read_phys_memory(cpu, self.v2p(cpu, vaddr), size))
-            except:
+                return self.readPhysBlock(cpu, phys, size)
+            except ValueError:
                 return None
         else:
             return None
 
+    def readPtr(self, cpu, vaddr):
+        value = self.readPtrBytes(cpu, vaddr)
+        if value is None:
+            return None
+        if self.WORD_SIZE == 4:
+            return struct.unpack('<I', str(value))[0]
+        else:
+            return struct.unpack('<Q', str(value))[0]
+
     def readWord(self, cpu, vaddr):
         phys = self.v2p(cpu, vaddr)
         if phys is not None:
@@ -336,48 +447,40 @@ class memUtils():
 
     def getBytes(self, cpu, num_bytes, addr):
         '''
-        Get a hex string of num_bytes from the given address using Simics physical memory reads, which return tuples.
+        Get a hex string of num_bytes from the given address, along with a tuple of the byte values.
+        Use getByteArray to avoid the conversions.
+        '''
+        read_data = self.getByteArray(cpu, num_bytes, addr)
+        retval = binascii.hexlify(read_data)
+        retbytes = tuple(read_data)
+        return retval, retbytes
+
+    def getByteArray(self, cpu, num_bytes, addr):
+        '''
+        Get a bytearray of num_bytes from the given address.  Stops short if a page cannot be read.
         '''
-        done = False
         curr_addr = addr
         bytes_to_go = num_bytes
-        retval = ''
-        retbytes = ()
-        #print 'in getBytes for 0x%x bytes' % (num_bytes)
-        while not done and bytes_to_go > 0:
-            bytes_to_read = bytes_to_go
-            remain_in_page = pageUtils.pageLen(curr_addr, pageUtils.PAGE_SIZE)
-            #print 'remain is 0x%x  bytes to go is 0x%x  cur_addr is 0x%x end of page would be 0x%x' % (remain_in_page, bytes_to_read, curr_addr, end)
-            if remain_in_page < bytes_to_read:
-                bytes_to_read = remain_in_page
-            if bytes_to_read > 1024:
-                bytes_to_read = 1024
+        retval = bytearray()
+        while bytes_to_go > 0:
+            bytes_to_read = min(bytes_to_go, pageUtils.pageLen(curr_addr, pageUtils.PAGE_SIZE))
             phys_block = cpu.iface.processor_info.logical_to_physical(curr_addr, Sim_Access_Read)
-            #print 'read (bytes_to_read) 0x%x bytes from 0x%x phys:%x ' % (bytes_to_read, curr_addr, phys_block.address)
             try:
-                read_data = readPhysBytes(cpu, phys_block.address, bytes_to_read)
-            except valueError:
+                retval += self.readPhysBlock(cpu, phys_block.address, bytes_to_read)
+            except ValueError:
                 print 'trouble reading phys bytes, address %x, num bytes %d end would be %x' % (phys_block.address, bytes_to_read, phys_block.address + bytes_to_read - 1)
                 print 'bytes_to_go %x  bytes_to_read %d' % (bytes_to_go, bytes_to_read)
                 self.lgr.error('bytes_to_go %x  bytes_to_read %d' % (bytes_to_go, bytes_to_read))
                 return retval
-            holder = ''
-            count = 0
-            for v in read_data:
-                count += 1
-                holder = '%s%02x' % (holder, v)
-                #self.lgr.debug('add v of %2x holder now %s' % (v, holder))
-            retbytes = retbytes+read_data
-            del read_data
-            retval = '%s%s' % (retval, holder)
             bytes_to_go = bytes_to_go - bytes_to_read
-            #self.lgr.debug('0x%x bytes of data read from %x bytes_to_go is %d' % (count, curr_addr, bytes_to_go))
             curr_addr = curr_addr + bytes_to_read
-        return retval, retbytes
+        return retval
 
     def writeWord(self, cpu, address, value):
         phys_block = cpu.iface.processor_info.logical_to_physical(address, Sim_Access_Read)
         SIM_write_phys_memory(cpu, phys_block.address, value, self.WORD_SIZE)
+        self.invalidatePageCache()
+        instructCache.codeWritten(cpu, phys_block.address, self.WORD_SIZE)
 
     def getGSCurrent_task_offset(self, cpu):
         gs_base = cpu.ia32_gs_base
@@ -406,5 +509,7 @@ class memUtils():
             sindex +=4
             phys_block = cpu.iface.processor_info.logical_to_physical(address, Sim_Access_Read)
             SIM_write_phys_memory(cpu, phys_block.address, value, count)
+            instructCache.codeWritten(cpu, phys_block.address, count)
             address += 4
+        self.invalidatePageCache()
 
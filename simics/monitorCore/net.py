@@ -1,5 +1,8 @@
 import pickle
 import os
+import snapState
+''' schema version of the state saved with snapshots '''
+STATE_VERSION = 1
 SOCKET      =1 
 BIND        =2
 CONNECT     =3
@@ -42,6 +45,10 @@ FIONBIO = 0x5421
 FIONREAD = 0x541B
 
 F_DUPFD = 0 
+F_SETFD = 2
+F_DUPFD_CLOEXEC = 1030
+FD_CLOEXEC = 1
+CLONE_FILES = 0x00000400
 
 O_NONBLOCK  =   0x00004000
 O_CLOEXEC   =   0x02000000        
@@ -57,26 +64,37 @@ class NetInfo():
         self.label = label 
  
 class NetAddresses():
-    def __init__(self, lgr):
+    def __init__(self, cell_name, lgr):
+        self.cell_name = cell_name
         self.ipv4_addrs = []
         self.net_commands = []
         self.lgr = lgr 
+        ''' snapshot container whose net commands are read when first needed '''
+        self.snap_state = None
     def add(self, ip, mask, broadcast, dev, label):
         info = NetInfo(ip, mask, broadcast, dev, label)
         self.ipv4_addrs.append(info)
     def checkNet(self, prog, args):
         if '/bin/ip addr add' in args:
             self.lgr.debug('NetAddresses checkNet found net info %s' % args) 
-            self.net_commands.append(args)
+            self.getCommands().append(args)
         elif 'ifconfig' in args:
             self.lgr.debug('NetAddresses checkNet found net info %s' % args) 
-            self.net_commands.append(args)
+            self.getCommands().append(args)
 
     def getCommands(self):
+        if self.snap_state is not None:
+            net_commands = self.snap_state.get(snapState.sectionName(self.cell_name, 'net'), STATE_VERSION)
+            self.snap_state = None
+            if net_commands is not None:
+                self.net_commands = net_commands + self.net_commands
         return self.net_commands
 
-    def pickleit(self, net_file):
-        pickle.dump( self.net_commands, open( net_file, "wb" ) )
+    def saveState(self, snap_state):
+        snap_state.put(snapState.sectionName(self.cell_name, 'net'), STATE_VERSION, self.getCommands())
+
+    def loadState(self, snap_state):
+        self.snap_state = snap_state
 
     def loadfile(self, net_file):
         if os.path.isfile(net_file):
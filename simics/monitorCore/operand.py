@@ -0,0 +1,50 @@
+'''
+Operand model shared by decode (x86) and decodeArm.  Operands are parsed once from
+disassembly text by the parseOperand functions of those modules.  Registers are
+named by their family, i.e., the full width register that contains them, see
+regFamily in the decode modules, so that aliases such as al/eax/rax or r13/sp
+compare equal.
+'''
+class EffAddr():
+    ''' effective address expression: base + index*scale + disp, registers as named in the instruction '''
+    def __init__(self, base=None, index=None, scale=1, disp=0, segment=None, writeback=False, post_index=False):
+        self.base = base
+        self.index = index
+        self.scale = scale
+        self.disp = disp
+        self.segment = segment
+        ''' ARM pre-indexed writeback, e.g., [r1, #4]! '''
+        self.writeback = writeback
+        ''' ARM post-indexed, e.g., [r1], #4, the address is just the base '''
+        self.post_index = post_index
+
+    def getAddress(self, cpu):
+        ''' NOTE segment bases are not applied '''
+        address = 0
+        if self.base is not None:
+            address += getRegValue(cpu, self.base)
+        if self.post_index:
+            return address
+        if self.index is not None:
+            address += getRegValue(cpu, self.index) * self.scale
+        return address + self.disp
+
+class Operand():
+    def __init__(self, text, kind):
+        self.text = text
+        ''' reg, mem, imm, reglist or other '''
+        self.kind = kind
+        ''' register family, for reg operands '''
+        self.reg = None
+        self.value = None
+        self.ea = None
+        ''' register families, for reglist operands '''
+        self.reglist = []
+        ''' register families read to get the operand, or its address '''
+        self.regs = set()
+        ''' ARM register writeback, e.g., ldm r0!, {r1, r2} '''
+        self.writeback = False
+
+def getRegValue(cpu, reg):
+    reg_num = cpu.iface.int_register.get_number(reg)
+    return cpu.iface.int_register.read(reg_num)
@@ -60,6 +60,7 @@ class PageFaultGen():
             del self.task_rec_break[pid]
         
     def pdirWriteHap(self, prec, third, forth, memory):
+        pageUtils.pageTableChanged(self.cpu)
         pdir_entry = SIM_get_mem_op_value_le(memory)
         cpu, comm, pid = self.task_utils.curProc() 
         self.lgr.debug('ppageFaultGen dirWriteHap, %d (%s) new entry value 0x%x set by pid %d' % (pid, comm, pdir_entry, prec.pid))
@@ -76,6 +77,7 @@ class PageFaultGen():
         self.pdir_hap = self.context_manager.genHapIndex("Core_Breakpoint_Memop", self.pdirWriteHap, prec, self.pdir_break, name='watchPdir')
 
     def ptableWriteHap(self, prec, third, forth, memory):
+        pageUtils.pageTableChanged(self.cpu)
         ptable_entry = SIM_get_mem_op_value_le(memory)
         cpu, comm, pid = self.task_utils.curProc() 
         self.lgr.debug('pageFaultGen tableWriteHap, %d (%s) new entry value 0x%x was set for pid: %d' % (pid, comm, ptable_entry, prec.pid))
@@ -120,6 +122,7 @@ class PageFaultGen():
         if cpu != hap_cpu:
             self.lgr.debug('pageFaultHap, wrong cpu %s %s' % (cpu.name, hap_cpu.name))
             return
+        pageUtils.pageTableChanged(cpu)
         cpu, comm, pid = self.task_utils.curProc() 
         eip = self.exception_eip
         if cpu.architecture == 'arm':
@@ -188,8 +191,10 @@ class PageFaultGen():
             page_fault = 14
         self.exception_hap = SIM_hap_add_callback_obj_index("Core_Exception", self.cpu, 0,
                  self.pageExceptionHap, self.cpu, page_fault)
+        pageUtils.watchFaults(self.cpu, True)
 
     def stopWatchPageFaults(self, pid = None):
+        pageUtils.watchFaults(self.cpu, False)
         if self.fault_hap is not None:
             self.lgr.debug('stopWatchPageFaults delete fault_hap')
             self.context_manager.genDeleteHap(self.fault_hap)
@@ -240,6 +245,7 @@ class PageFaultGen():
         if self.debugging_pid is not None:
             target_cycles = prec.cycles - 1
             self.lgr.debug('skipAlone skip to 0x%x' % target_cycles)
+            pageUtils.clearPageCache()
             SIM_run_command('skip-to cycle = 0x%x' % target_cycles)
             self.top.setDebugBookmark('SEGV access to 0x%x' % prec.cr2)
         self.stopWatchPageFaults()
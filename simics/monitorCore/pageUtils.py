@@ -25,6 +25,7 @@
 
 #import logging
 from simics import *
+import struct
 import memUtils
 PAGE_SIZE = 4096
 class PtableInfo():
@@ -85,25 +86,81 @@ def pageStart(start, page_size):
        page_start = start - boundary
     return page_start
 
+''' Page table walk cache, (cpu name, table base) -> (cycle, watch epoch, pages).
+    A walk is reused at the same cycle, or at a later cycle if its table is watched for page faults
+    (see watchFaults) and no fault or page table write has been seen since the walk.  A walk is
+    never reused at an earlier cycle, and the cache is cleared before reverse execution or skip-to
+    (see clearPageCache) since page faults are not seen while moving through time that way. '''
+page_base_cache = {}
+''' cpu name -> (watched table base, epoch) while pageFaultGen is watching page faults '''
+fault_watch = {}
+fault_epoch = 0
+
+def watchFaults(cpu, watching):
+    global fault_epoch
+    if watching:
+        fault_epoch += 1
+        fault_watch[cpu.name] = (getTableBase(cpu), fault_epoch)
+    else:
+        fault_watch.pop(cpu.name, None)
+
+def pageTableChanged(cpu):
+    ''' called on page faults and page table writes '''
+    for key in [k for k in page_base_cache if k[0] == cpu.name]:
+        del page_base_cache[key]
+
+def clearPageCache():
+    ''' called before reverse execution or skip-to, and on calls that unmap memory without faulting '''
+    page_base_cache.clear()
+
+def getTableBase(cpu):
+    if cpu.architecture == 'arm':
+        return cpu.translation_table_base0
+    reg_num = cpu.iface.int_register.get_number("cr3")
+    return cpu.iface.int_register.read(reg_num)
+
+def readTable(cpu, addr, count, entry_size):
+    ''' read count page table entries with a single physical memory read '''
+    data = str(bytearray(memUtils.readPhysBytes(cpu, addr, count*entry_size)))
+    if entry_size == 4:
+        return struct.unpack('<%dI' % count, data)
+    else:
+        return struct.unpack('<%dQ' % count, data)
+
 def getPageBases(cpu, lgr, kernel_base):
+    ''' return PageAddrInfo for each present user page, from the cache if still valid '''
+    table_base = getTableBase(cpu)
+    key = (cpu.name, table_base)
+    watch = fault_watch.get(cpu.name)
+    if watch is not None and watch[0] == table_base:
+        epoch = watch[1]
+    else:
+        epoch = None
+    if key in page_base_cache:
+        cycle, cache_epoch, pages = page_base_cache[key]
+        if cycle == cpu.cycles or (epoch is not None and cache_epoch == epoch and cpu.cycles > cycle):
+            return pages
     if cpu.architecture == 'arm':
-        return getPageBasesArm(cpu, lgr, kernel_base)
+        pages = getPageBasesArm(cpu, lgr, kernel_base)
+    else:
+        pages = getPageBases32(cpu, lgr, kernel_base)
+    page_base_cache[key] = (cpu.cycles, epoch, pages)
+    return pages
 
+def getPageBases32(cpu, lgr, kernel_base):
     ENTRIES_PER_TABLE = 1024
     retval = []
     reg_num = cpu.iface.int_register.get_number("cr3")
     cr3 = cpu.iface.int_register.read(reg_num)
-    pdir_entry_addr = cr3
-    pdir_index = 0
-    for i in range(ENTRIES_PER_TABLE):
-        pdir_entry = SIM_read_phys_memory(cpu, pdir_entry_addr, 4)                
+    pdir = readTable(cpu, cr3, ENTRIES_PER_TABLE, 4)
+    for pdir_index in range(ENTRIES_PER_TABLE):
+        pdir_entry = pdir[pdir_index]
         pdir_entry_20 = memUtils.bitRange(pdir_entry, 12, 31)
         ptable_base = pdir_entry_20 * PAGE_SIZE
         if pdir_entry != 0:
-            ptable_entry_addr = ptable_base
-            ptable_index = 0
-            for j in range(ENTRIES_PER_TABLE):
-                ptable_entry = SIM_read_phys_memory(cpu, ptable_entry_addr, 4)
+            ptable = readTable(cpu, ptable_base, ENTRIES_PER_TABLE, 4)
+            for ptable_index in range(ENTRIES_PER_TABLE):
+                ptable_entry = ptable[ptable_index]
                 present = memUtils.testBit(ptable_entry, 0)
                 if present:
                     entry_20 = memUtils.bitRange(ptable_entry, 12, 31)
@@ -117,10 +174,6 @@ def getPageBases(cpu, lgr, kernel_base):
                     #lgr.debug('logical now 0x%x from ptable index %d' % (logical, ptable_index))
                     addr_info = PageAddrInfo(logical, page_base, ptable_entry)
                     retval.append(addr_info)
-                ptable_entry_addr += 4
-                ptable_index += 1
-        pdir_entry_addr += 4
-        pdir_index += 1
     return retval
    
 def getPageBasesArm(cpu, lgr, kernel_base):
@@ -133,22 +186,20 @@ def getPageBasesArm(cpu, lgr, kernel_base):
     #print('base is 0x%x, shifted 0x%x' % (base, base_shifted))
     NUM_FIRST = 4096
     NUM_SECOND = 256
-    first_index = 0
     kernel_base = 0xc0000000
-    for i in range(NUM_FIRST):
-        first_addr = base_shifted | first_index*4
-        fld = SIM_read_phys_memory(cpu, first_addr, 4)
+    first_table = readTable(cpu, base_shifted, NUM_FIRST, 4)
+    for first_index in range(NUM_FIRST):
+        fld = first_table[first_index]
         if fld != 0:
             pta = memUtils.bitRange(fld, 10, 31)
             pta_shifted = pta << 10
-            second_index = 0
-            for j in range(NUM_SECOND):
+            second_table = readTable(cpu, pta_shifted, NUM_SECOND, 4)
+            for second_index in range(NUM_SECOND):
                 va = first_index << 20
                 va = va | (second_index << 12)
                 if va > kernel_base:
                     break
-                second_addr = pta_shifted | second_index*4
-                sld = SIM_read_phys_memory(cpu, second_addr, 4)
+                sld = second_table[second_index]
                 db = memUtils.bitRange(sld, 0, 1)
                 if db != 0:
                     pbase = memUtils.bitRange(sld, 12, 31)
@@ -156,8 +207,6 @@ def getPageBasesArm(cpu, lgr, kernel_base):
                     #print('va: 0x%x page base 0x%x' % (va, pbase_shifted))
                     addr_info = PageAddrInfo(va, pbase_shifted, sld)
                     retval.append(addr_info)
-                second_index += 1
-        first_index += 1
     return retval
 
  
@@ -167,19 +216,19 @@ def getPageBasesExtended(cpu, lgr, kernel_base):
     retval = []
     reg_num = cpu.iface.int_register.get_number("cr3")
     cr3 = cpu.iface.int_register.read(reg_num)
-    page_table_directory = cr3
+    pdpt = readTable(cpu, cr3, 4, WORD_SIZE)
     pdir_index = 0
     for pdir_table_index in range(4):
-      pdir_entry_addr = SIM_read_phys_memory(cpu, page_table_directory, 8)
+      ''' mask off the flags to get the page directory address '''
+      pdir_table = readTable(cpu, pdpt[pdir_table_index] & ~(PAGE_SIZE-1), ENTRIES_PER_TABLE, WORD_SIZE)
       for i in range(ENTRIES_PER_TABLE):
-        pdir_entry = SIM_read_phys_memory(cpu, pdir_entry_addr, WORD_SIZE)                
+        pdir_entry = pdir_table[i]
         pdir_entry_20 = memUtils.bitRange(pdir_entry, 12, 31)
         ptable_base = pdir_entry_20 * PAGE_SIZE
         if pdir_entry != 0:
-            ptable_entry_addr = ptable_base
-            ptable_index = 0
-            for j in range(ENTRIES_PER_TABLE):
-                ptable_entry = SIM_read_phys_memory(cpu, ptable_entry_addr, WORD_SIZE)
+            ptable = readTable(cpu, ptable_base, ENTRIES_PER_TABLE, WORD_SIZE)
+            for ptable_index in range(ENTRIES_PER_TABLE):
+                ptable_entry = ptable[ptable_index]
                 present = memUtils.testBit(ptable_entry, 0)
                 if present:
                     entry_20 = memUtils.bitRange(ptable_entry, 12, 31)
@@ -193,11 +242,7 @@ def getPageBasesExtended(cpu, lgr, kernel_base):
                     #lgr.debug('logical now 0x%x from ptable index %d' % (logical, ptable_index))
                     addr_info = PageAddrInfo(logical, page_base, ptable_entry)
                     retval.append(addr_info)
-                ptable_entry_addr += WORD_SIZE
-                ptable_index += 1
-        pdir_entry_addr += WORD_SIZE
         pdir_index += 1
-      page_table_directory += WORD_SIZE
     return retval
    
 def getPageEntrySize(cpu): 
@@ -0,0 +1,117 @@
+from simics import *
+import bisect
+import instructCache
+'''
+Optional log of writes to selected registers of the debugged process, recorded
+while running forward.  Each user space instruction is decoded (via instructCache)
+as it executes, and the cycle and resulting value are logged for tracked registers
+it writes.  Register changes not explained by an instruction, e.g., the return value
+of a system call, are logged at the first user instruction following the change.
+reverseToCall.cycleRegisterMod uses lastWrite to skip directly to the instruction
+that last modified a register rather than stepping back one cycle at a time.
+'''
+class WriteRec():
+    def __init__(self, cycle, value, explained):
+        self.cycle = cycle
+        self.value = value
+        ''' False if the change was not made by the instruction at this cycle, e.g., made by the kernel '''
+        self.explained = explained
+
+class RegWriteLog():
+    def __init__(self, top, cpu, cell, context_manager, decoder, kernel_base, lgr):
+        self.top = top
+        self.cpu = cpu
+        self.cell = cell
+        self.context_manager = context_manager
+        self.decoder = decoder
+        self.kernel_base = kernel_base
+        self.lgr = lgr
+        ''' register family -> register number of the name given to watch '''
+        self.reg_nums = {}
+        ''' register family -> sorted cycles, and WriteRec for each '''
+        self.cycles = {}
+        self.recs = {}
+        self.last_value = {}
+        self.pending = []
+        self.pending_cycle = None
+        self.start_cycle = None
+        self.last_cycle = None
+        self.break_num = None
+        self.hap = None
+
+    def start(self, regs):
+        if self.hap is not None:
+            self.stop()
+        for reg in regs:
+            family = self.decoder.regFamily(reg)
+            if family is None:
+                self.lgr.error('RegWriteLog unknown register %s' % reg)
+                continue
+            self.reg_nums[family] = self.cpu.iface.int_register.get_number(reg)
+            if family not in self.cycles:
+                self.cycles[family] = []
+                self.recs[family] = []
+            self.last_value[family] = self.cpu.iface.int_register.read(self.reg_nums[family])
+        self.start_cycle = self.cpu.cycles
+        self.last_cycle = self.cpu.cycles
+        self.pending = []
+        self.break_num = self.context_manager.genBreakpoint(self.cell, Sim_Break_Linear, Sim_Access_Execute, 0, self.kernel_base, 0)
+        self.hap = self.context_manager.genHapIndex("Core_Breakpoint_Memop", self.instructHap, None, self.break_num, 'regWriteLog')
+        self.lgr.debug('RegWriteLog start at 0x%x for %s' % (self.start_cycle, str(self.reg_nums.keys())))
+
+    def stop(self):
+        if self.hap is not None:
+            self.context_manager.genDeleteBreakpoint(self.break_num)
+            self.context_manager.genDeleteHap(self.hap)
+            self.hap = None
+            self.break_num = None
+            self.lgr.debug('RegWriteLog stop at 0x%x' % self.cpu.cycles)
+
+    def isRecording(self):
+        return self.hap is not None
+
+    def addRec(self, family, cycle, value, explained):
+        cycles = self.cycles[family]
+        rec = WriteRec(cycle, value, explained)
+        if len(cycles) == 0 or cycle > cycles[-1]:
+            cycles.append(cycle)
+            self.recs[family].append(rec)
+        else:
+            ''' running forward again after a reverse '''
+            index = bisect.bisect_left(cycles, cycle)
+            if index == len(cycles) or cycles[index] != cycle:
+                cycles.insert(index, cycle)
+                self.recs[family].insert(index, rec)
+
+    def instructHap(self, dumb, third, forth, memory):
+        if self.hap is None:
+            return
+        cycle = self.cpu.cycles
+        for family in self.reg_nums:
+            value = self.cpu.iface.int_register.read(self.reg_nums[family])
+            if family in self.pending:
+                self.addRec(family, self.pending_cycle, value, True)
+            elif value != self.last_value[family]:
+                self.addRec(family, cycle, value, False)
+            self.last_value[family] = value
+        decoded = instructCache.getDecoded(self.cpu, memory.logical_address)
+        self.pending = [family for family in decoded.regs_written if family in self.reg_nums]
+        self.pending_cycle = cycle
+        self.last_cycle = cycle
+
+    def lastWrite(self, reg, cycle):
+        ''' Return the WriteRec of the last write to the register prior to the given cycle, or None if
+            the log does not cover that cycle or has no write for the register. '''
+        family = self.decoder.regFamily(reg)
+        if family not in self.cycles or self.start_cycle is None:
+            return None
+        if cycle <= self.start_cycle or cycle > self.last_cycle:
+            return None
+        cycles = self.cycles[family]
+        index = bisect.bisect_left(cycles, cycle)
+        if index == 0:
+            return None
+        rec = self.recs[family][index-1]
+        if rec.cycle < self.start_cycle:
+            return None
+        return rec
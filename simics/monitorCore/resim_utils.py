@@ -1,5 +1,19 @@
 import os
 import logging
+''' Log level of RESim loggers, e.g., INFO to drop the debug output of the haps '''
+LOG_LEVEL_ENV = 'RESIM_LOG_LEVEL'
+
+class Lazy():
+    ''' Log message argument built only if the message is emitted, e.g.,
+            self.lgr.debug('frame %s', resim_utils.Lazy(taskUtils.stringFromFrame, frame))
+        Pass values as logger arguments rather than formatting them with % so that
+        nothing is formatted when the level is disabled. '''
+    def __init__(self, fun, *args):
+        self.fun = fun
+        self.args = args
+    def __str__(self):
+        return str(self.fun(*self.args))
+
 def getLogger(name, logdir, level=None):
     os.umask(000)
     try:
@@ -8,7 +22,9 @@ def getLogger(name, logdir, level=None):
         pass
     lgr = logging.getLogger(name)
     #lhStdout = lgr.handlers[0]
-    lgr.setLevel(logging.DEBUG)
+    if level is None:
+        level = os.getenv(LOG_LEVEL_ENV, 'DEBUG').upper()
+    lgr.setLevel(level)
     fh = logging.FileHandler(logdir+'/%s.log' % name)
     fh.setLevel(logging.DEBUG)
     frmt = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
@@ -24,6 +24,7 @@
 '''
 
 from simics import *
+import pageUtils
 class reverseToAddr():
     def __init__(self, address, context_manager, is_monitor_running, top, cpu, lgr, extra_back=0):
         self.top = top
@@ -45,6 +46,7 @@ class reverseToAddr():
         self.one_stop_hap = None
         self.stop_hap = SIM_hap_add_callback("Core_Simulation_Stopped", 
 	     self.stopHap, cpu)
+        pageUtils.clearPageCache()
         SIM_run_command('reverse')
 
     def stopHap(self, cpu, one, exception, error_string):
@@ -35,6 +35,9 @@ import memUtils
 import pageUtils
 import resim_utils
 import armCond
+import instructCache
+import syscallCycles
+import bisect
 '''
 BEWARE syntax errors are not seen.  TBD make unit test
 '''
@@ -82,11 +85,16 @@ class reverseToCall():
             self.bookmarks = bookmarks
             self.previous_eip = None
             self.step_into = None
-            self.sysenter_cycles = []
+            ''' kernel entry and exit cycles of the debugged process '''
+            self.sys_cycles = syscallCycles.SyscallCycles(self.lgr)
             self.jump_stop_hap = None
             self.sysenter_hap = None
             self.enter_break1 = None
             self.enter_break2 = None
+            self.exit_breaks = []
+            self.exit_hap = None
+            ''' optional regWriteLog.RegWriteLog '''
+            self.reg_write_log = None
             self.start_cycles = None
             self.page_faults = None
             self.frame_ips = []
@@ -101,6 +109,12 @@ class reverseToCall():
             self.context_manager.genDeleteBreakpoint(self.enter_break2)
             self.context_manager.genDeleteHap(self.sysenter_hap, immediate=True)
             self.enter_break1 = None
+            for bp in self.exit_breaks:
+                self.context_manager.genDeleteBreakpoint(bp)
+            if self.exit_hap is not None:
+                self.context_manager.genDeleteHap(self.exit_hap, immediate=True)
+                self.exit_hap = None
+            self.exit_breaks = []
 
     def v2p(self, cpu, v):
         try:
@@ -129,6 +143,36 @@ class reverseToCall():
                 self.enter_break1 = self.context_manager.genBreakpoint(cell, Sim_Break_Linear, Sim_Access_Execute, self.param.sysenter, 1, 0)
                 self.enter_break2 = self.context_manager.genBreakpoint(cell, Sim_Break_Linear, Sim_Access_Execute, self.param.sys_entry, 1, 0)
                 self.sysenter_hap = self.context_manager.genHapRange("Core_Breakpoint_Memop", self.sysenterHap, None, self.enter_break1, self.enter_break2, 'reverseToCall sysenter')
+            self.watchSysexit(cell)
+
+    def watchSysexit(self, cell):
+        ''' record kernel exits of the debugged process, see SyscallCycles '''
+        if self.cpu.architecture == 'arm':
+            exits = [self.param.arm_ret]
+        else:
+            exits = [self.param.sysexit, self.param.iretd]
+        for addr in exits:
+            if addr is not None:
+                self.exit_breaks.append(self.context_manager.genBreakpoint(cell, Sim_Break_Linear, Sim_Access_Execute, addr, 1, 0))
+        if len(self.exit_breaks) > 0:
+            self.lgr.debug('watchSysexit set %d exit breaks' % len(self.exit_breaks))
+            self.exit_hap = self.context_manager.genHapRange("Core_Breakpoint_Memop", self.sysexitHap, None, self.exit_breaks[0], self.exit_breaks[-1], 'reverseToCall sysexit')
+
+    def setRegWriteLog(self, reg_write_log):
+        self.reg_write_log = reg_write_log
+
+    def getSyscallCycles(self):
+        return self.sys_cycles
+
+    def jumpToPrevSyscall(self):
+        ''' skip back to the system call instruction most recently executed by the debugged process,
+            per the cycles recorded by sysenterHap.  Return False if none is recorded. '''
+        entry = self.sys_cycles.prevEntry(self.pid, self.cpu.cycles - 1)
+        if entry is None or entry <= self.start_cycles:
+            return False
+        self.lgr.debug('jumpToPrevSyscall pid:%d from 0x%x to 0x%x' % (self.pid, self.cpu.cycles, entry - 1))
+        SIM_run_alone(self.jumpCycle, entry - 1)
+        return True
 
     def setup(self, cpu, x_pages, bookmarks=None, page_faults = None):
             self.cpu = cpu
@@ -253,6 +297,7 @@ class reverseToCall():
         #for item in self.x_pages:
         #    self.setBreakRange(self.cell_name, pid, item.address, item.length, self.cpu, comm, True)
         self.lgr.debug('doUncall, set break range')
+        pageUtils.clearPageCache()
         SIM_run_alone(SIM_run_command, 'reverse')
         #self.lgr.debug('reverseToCall, did reverse-step-instruction')
         self.lgr.debug('doUncall, did reverse')
@@ -275,6 +320,7 @@ class reverseToCall():
         #self.jump_stop_hap = SIM_hap_add_callback("Core_Simulation_Stopped", 
 	#        self.jumpStopped, None)
         cmd = 'skip-to cycle = %d ' % cycle
+        pageUtils.clearPageCache()
         SIM_run_command(cmd)
         self.top.skipAndMail()
 
@@ -357,7 +403,7 @@ class reverseToCall():
             return
         self.lgr.debug('tryOneStopped, entered at cycle 0x%x' % self.cpu.cycles)
         eip = self.top.getEIP(self.cpu)
-        instruct = SIM_disassemble_address(self.cpu, eip, 1, 0)
+        instruct = instructCache.disassemble(self.cpu, eip)
         self.lgr.debug('tryOneStopped reversed 1, eip: %x  %s' % (eip, instruct[1]))
         cpl = memUtils.getCPL(self.cpu)
         done = False
@@ -369,33 +415,27 @@ class reverseToCall():
                 self.cleanup(self.cpu)
                 self.top.skipAndMail()
                 self.context_manager.setExitBreak(self.cpu)
-        elif len(self.sysenter_cycles) > 0:
+        elif self.sys_cycles.hasEntries(self.pid):
             cur_cycles = self.cpu.cycles
             cur_cpu, comm, pid  = self.task_utils.curProc()
             self.lgr.debug('tryBackOne kernel space pid %d expected %d' % (pid, my_args.pid))
             is_exit = self.isExit(instruct[1], eip)
             if pid == self.pid and is_exit:
                 self.lgr.debug('tryOneStopped is sysexit, cur_cycles is 0x%x' % cur_cycles)
-                prev_cycles = None
-                got_it = None
-                page_cycles = self.sysenter_cycles
+                ''' back up to the latest kernel entry, i.e., syscall or page fault '''
+                prev_cycles = self.sys_cycles.prevEntry(self.pid, cur_cycles)
                 if self.page_faults is not None:
-                    self.lgr.debug('tryBackOne adding %d page faults to cycles' % (len(self.page_faults.getFaultingCycles())))
-                    page_cycles = page_cycles + self.page_faults.getFaultingCycles()
-                for cycles in sorted(page_cycles):
-                    if cycles > cur_cycles:
-                        self.lgr.debug('tryOneStopped found cycle between 0x%x and 0x%x' % (prev_cycles, cycles))
-                        got_it = prev_cycles - 1
-                        break
-                    else:
-                        self.lgr.debug('tryOneStopped is not cycle 0x%x' % (cycles))
-                        prev_cycles = cycles
-
-                if not got_it:
-                    self.lgr.debug('tryOneStopped nothing between, assume last cycle of 0x%x' % prev_cycles)
+                    faults = sorted(self.page_faults.getFaultingCycles())
+                    index = bisect.bisect_right(faults, cur_cycles)
+                    if index > 0 and (prev_cycles is None or faults[index-1] > prev_cycles):
+                        prev_cycles = faults[index-1]
+                if prev_cycles is None:
+                    self.lgr.debug('tryOneStopped no kernel entry recorded before 0x%x' % cur_cycles)
+                else:
+                    self.lgr.debug('tryOneStopped latest kernel entry 0x%x' % prev_cycles)
                     got_it = prev_cycles - 1
-                SIM_run_alone(self.jumpCycle, got_it)
-                done = True
+                    SIM_run_alone(self.jumpCycle, got_it)
+                    done = True
             elif pid == self.pid and not is_exit:
                 self.lgr.debug('tryOneStopped in kernel but not exit? 0x%x  %s' % (eip, instruct[1]))
         
@@ -414,6 +454,7 @@ class reverseToCall():
                 #    self.setBreakRange(self.cell_name, my_args.pid, item.address, item.length, self.cpu, my_args.comm, False)
                 self.pageTableBreaks(False)
                 self.lgr.debug('tryOneStopped, set break range')
+            pageUtils.clearPageCache()
             SIM_run_alone(SIM_run_command, 'reverse')
             #self.lgr.debug('reverseToCall, did reverse-step-instruction')
             self.lgr.debug('tryOneStopped, did reverse')
@@ -471,6 +512,7 @@ class reverseToCall():
                 #    self.setBreakRange(self.cell_name, pid, item.address, item.length, self.cpu, comm, False, reg)
                 self.lgr.debug('doRevToModReg, set break range')
                 #SIM_run_alone(SIM_run_command, 'reverse-step-instruction')
+                pageUtils.clearPageCache()
                 SIM_run_alone(SIM_run_command, 'reverse')
                 #self.lgr.debug('reverseToCall, did reverse-step-instruction')
                 self.lgr.debug('reverseToModReg, did reverse')
@@ -517,11 +559,20 @@ class reverseToCall():
         retval = None
         done = False
         self.lgr.debug('cycleRegisterMod start for %s' % self.reg)
+        if self.reg_write_log is not None:
+            rec = self.reg_write_log.lastWrite(self.reg, self.cpu.cycles)
+            if rec is not None:
+                ''' skip to just after the logged write, the loop below steps back onto it '''
+                self.lgr.debug('cycleRegisterMod logged write to %s at 0x%x explained: %r' % (self.reg, rec.cycle, rec.explained))
+                SIM_run_command('pselect cpu-name = %s' % self.cpu.name)
+                pageUtils.clearPageCache()
+                SIM_run_command('skip-to cycle = %d' % (rec.cycle + 1))
         while not done:
             #current = SIM_cycle_count(self.cpu)
             current = self.cpu.cycles
             previous = current - 1
             SIM_run_command('pselect cpu-name = %s' % self.cpu.name)
+            pageUtils.clearPageCache()
             SIM_run_command('skip-to cycle = %d' % previous)
             self.lgr.debug('cycleRegisterMod skipped to 0x%x  cycle is 0x%x' % (previous, self.cpu.cycles))
             if self.tooFarBack():
@@ -544,31 +595,20 @@ class reverseToCall():
                 '''
                 eip = self.top.getEIP(self.cpu)
                 self.lgr.debug('cycleRegisterMod do disassemble for eip 0x%x' % eip)
-                instruct = SIM_disassemble_address(self.cpu, eip, 1, 0)
+                decoded = instructCache.getDecoded(self.cpu, eip)
+                instruct = (decoded.length, decoded.text)
                 self.lgr.debug('cycleRegisterMod disassemble for eip 0x%x is %s' % (eip, str(instruct)))
-                mn = self.decode.getMn(instruct[1])
+                mn = decoded.mn
                 self.lgr.debug('cycleRegisterMod decode is %s' % mn)
-                if self.conditionalMet(mn):
-                    if self.decode.modifiesOp0(mn):
-                        self.lgr.debug('get operands from %s' % instruct[1])
-                        op1, op0 = self.decode.getOperands(instruct[1])
-                        self.lgr.debug('cycleRegisterMod mn: %s op0: %s  op1: %s  compare <%s> to <%s>' % (mn, op0, op1, op0, self.reg))
-                        if self.decode.isReg(op0) and self.decode.regIsPart(op0, self.reg):
-                            self.lgr.debug('cycleRegisterMod at %x, we are done' % eip)
-                            done = True
-                            retval = RegisterModType(None, RegisterModType.UNKNOWN)
-                    elif self.cpu.architecture == 'arm': 
-                        if ']!' in instruct[1]:
-                            ''' Look for write-back register mod '''
-                            ''' for now just look for [myreg, xxx]! '''
-                            if self.decode.armWriteBack(instruct[1], self.reg):
-                                done = True
-                                retval = RegisterModType(None, RegisterModType.UNKNOWN)
-                        elif mn.startswith('ldm') and self.reg in instruct[1] and '{' in instruct[1]:
-                            addr = self.decode.armLDM(self.cpu, instruct[1], self.reg)
-                            if addr is not None:
-                                done = True
-                                retval = RegisterModType(addr, RegisterModType.ADDR)
+                if self.conditionalMet(mn) and decoded.modifiesReg(self.reg):
+                    self.lgr.debug('cycleRegisterMod mn: %s op0: %s  op1: %s  writes %s' % (mn, decoded.op0, decoded.op1, self.reg))
+                    done = True
+                    retval = RegisterModType(None, RegisterModType.UNKNOWN)
+                    if self.cpu.architecture == 'arm' and mn.startswith('ldm'):
+                        addr = self.decode.armLDM(self.cpu, instruct[1], self.reg)
+                        if addr is not None:
+                            retval = RegisterModType(addr, RegisterModType.ADDR)
+                    self.lgr.debug('cycleRegisterMod at %x, we are done' % eip)
                      
                 
         return retval
@@ -600,7 +640,7 @@ class reverseToCall():
         ''' we believe the instruction at the current ip modifies self.reg 
             Where does its value come from? '''
         eip = self.top.getEIP(self.cpu)
-        instruct = SIM_disassemble_address(self.cpu, eip, 1, 0)
+        instruct = instructCache.disassemble(self.cpu, eip)
         self.lgr.debug('followTaint instruct at 0x%x is %s' % (eip, str(instruct)))
         op1, op0 = self.decode.getOperands(instruct[1])
         mn = self.decode.getMn(instruct[1])
@@ -690,6 +730,7 @@ class reverseToCall():
                 if not self.tooFarBack():
                     ''' stepped back into kernel, rev '''
                     self.lgr.debug('stoppedReverseModReg must have entered kernel, continue to previous place where this process ran')
+                    pageUtils.clearPageCache()
                     SIM_run_alone(SIM_run_command, cmd)
                 else:
                     self.lgr.debug('stoppedReverseModReg must have backed to first cycle 0x%x' % self.start_cycles)
@@ -704,6 +745,7 @@ class reverseToCall():
                         self.lgr.debug('stoppedReverseModReg must backed to first cycle 0x%x' % self.start_cycles)
         else:
             self.lgr.error('stoppedReverseModReg wrong process or in kernel pid is %d expected %d' % (pid, self.pid))
+            pageUtils.clearPageCache()
             SIM_run_alone(SIM_run_command, cmd)
  
     def cleanup(self, cpu):
@@ -746,7 +788,7 @@ class reverseToCall():
         #elif pid == my_args.pid and SIM_processor_privilege_level(cpu) != 0:
         elif pid == self.pid and memUtils.getCPL(cpu) != 0:
             eip = self.top.getEIP(cpu)
-            instruct = SIM_disassemble_address(cpu, eip, 1, 0)
+            instruct = instructCache.disassemble(cpu, eip)
             if self.first_back and self.isSyscall(instruct[1]):
                 self.lgr.debug('stoppedReverseToCall first back is syscall at %x, we are done' % eip)
                 self.cleanup(cpu)
@@ -763,6 +805,7 @@ class reverseToCall():
                     self.cleanup(cpu)
                 else:
                    self.lgr.debug('stoppedReverseToCall 0x%x got call %s   got_calls %d, need %d' % (eip, instruct[1], self.got_calls, self.need_calls))
+                   pageUtils.clearPageCache()
                    SIM_run_alone(SIM_run_command, cmd)
             elif self.isRet(instruct[1]):
                 self.need_calls += 1
@@ -772,12 +815,15 @@ class reverseToCall():
                     ''' TBD fix this? '''
                     for item in self.x_pages:
                         self.setBreakRange(self.cell_name, pid, item.address, item.length, cpu, comm, True)
+                pageUtils.clearPageCache()
                 SIM_run_alone(SIM_run_command, cmd)
             else:
                 self.lgr.debug('stoppedReverseToCall Not call or ret at %x, is %s' % (eip, instruct[1]))
+                pageUtils.clearPageCache()
                 SIM_run_alone(SIM_run_command, cmd)
         else:
             self.lgr.debug('stoppedReverseInstruction in wrong pid (%d) or in kernel, try again' % pid)
+            pageUtils.clearPageCache()
             SIM_run_alone(SIM_run_command, cmd)
         self.first_back = False
    
@@ -862,12 +908,16 @@ class reverseToCall():
             cur_cpu, comm, pid  = self.task_utils.curProc()
             if cur_cpu == self.cpu and pid == self.pid:
                 cycles = self.cpu.cycles
-                if cycles not in self.sysenter_cycles:
-                    #eip = self.top.getEIP(self.cpu)
-                    #reg_num = self.cpu.iface.int_register.get_number('eax')
-                    #eax = self.cpu.iface.int_register.read(reg_num)
-                    #self.lgr.debug('sysenterHap call %d at 0x%x, add cycle 0x%x' % (eax, eip, cycles))
-                    #self.lgr.debug('third: %s  forth: %s' % (str(third), str(forth)))
-                    self.sysenter_cycles.append(cycles)
+                #eip = self.top.getEIP(self.cpu)
+                #reg_num = self.cpu.iface.int_register.get_number('eax')
+                #eax = self.cpu.iface.int_register.read(reg_num)
+                #self.lgr.debug('sysenterHap call %d at 0x%x, add cycle 0x%x' % (eax, eip, cycles))
+                #self.lgr.debug('third: %s  forth: %s' % (str(third), str(forth)))
+                self.sys_cycles.addEntry(pid, cycles)
+
+    def sysexitHap(self, prec, third, forth, memory):
+        cur_cpu, comm, pid  = self.task_utils.curProc()
+        if cur_cpu == self.cpu and pid == self.pid:
+            self.sys_cycles.addExit(pid, self.cpu.cycles)
             
 
@@ -49,6 +49,7 @@ class ReverseToUser():
         stop_action = hapCleaner.StopAction(hap_clean, [break_num])
         self.stop_hap = SIM_hap_add_callback("Core_Simulation_Stopped", 
         	     self.stopHap, stop_action)
+        pageUtils.clearPageCache()
         SIM_run_command('reverse') 
 
     def stopHap(self, stop_action, one, exception, error_string):
@@ -3,6 +3,8 @@ import pageUtils
 import memUtils
 import net
 import ipc
+import resim_utils
+import syscall
 '''
 Handle returns to user space from system calls.  May result in call_params matching.  NOTE: stop actions (stop_action) for matched parameters
 are handled by the stopHap in the syscall module that handled the call.
@@ -20,10 +22,16 @@ class SharedSyscall():
         self.mem_utils = mem_utils
         self.context_manager = context_manager
         self.traceProcs = traceProcs
+        ''' pid -> ExitInfo of its pending call '''
         self.exit_info = {}
-        self.exit_pids = {}
-        self.trace_procs = []
+        ''' pid -> exit eips at which its pending call may return '''
+        self.exit_eips = {}
+        ''' eip -> number of pids waiting there, and the hap of its breakpoint '''
+        self.exit_refs = {}
         self.exit_hap = {}
+        ''' pids whose pending call is clone '''
+        self.clone_pids = set()
+        self.trace_procs = set()
         self.exit_names = {} 
         self.debugging = False
         self.traceMgr = traceMgr
@@ -31,6 +39,9 @@ class SharedSyscall():
         self.soMap = soMap
         self.dataWatch = dataWatch
         self.top = top
+        ''' sockets watched by selective traces of this cell, shared by all of its Syscall modules
+            so that dup, fork and execve caught by one trace update the sockets bound in another '''
+        self.sockwatch = syscall.SockWatch()
 
 
     def setDebugging(self, debugging):
@@ -47,83 +58,82 @@ class SharedSyscall():
         self.lgr.debug('sharedSyscall stopTrace')
         for eip in self.exit_hap:
             self.context_manager.genDeleteHap(self.exit_hap[eip])
-        self.exit_pids = {}
+        self.exit_hap = {}
+        self.exit_refs = {}
+        self.exit_eips = {}
 
     def showExitHaps(self):
-        for eip in self.exit_pids:
+        pids = {}
+        for pid in self.exit_eips:
+            for eip in self.exit_eips[pid]:
+                if eip not in pids:
+                    pids[eip] = []
+                pids[eip].append(pid)
+        for eip in sorted(pids):
             print('eip: 0x%x' % eip)
-            for pid in self.exit_pids[eip]:
+            for pid in sorted(pids[eip]):
                 prog = self.task_utils.getProgName(pid)
                 if prog is not None:
                     print('\t%d %s' % (pid, prog))
                 else:
                     print('\t%d' % (pid))
 
+    def releaseExitEips(self, eips):
+        ''' drop a reference to each exit eip, deleting the breakpoints of those with no other waiters '''
+        for eip in eips:
+            self.exit_refs[eip] -= 1
+            if self.exit_refs[eip] == 0:
+                del self.exit_refs[eip]
+                self.context_manager.genDeleteHap(self.exit_hap.pop(eip))
+
     def rmExitHap(self, pid):
         if pid is not None:
             #self.lgr.debug('rmExitHap for pid %d' % pid)
-            for eip in self.exit_pids:
-                if pid in self.exit_pids[eip]:
-                    self.exit_pids[eip].remove(pid)
-                    if len(self.exit_pids[eip]) == 0:
-                        self.context_manager.genDeleteHap(self.exit_hap[eip])
+            self.releaseExitEips(self.exit_eips.pop(pid, []))
             self.exit_info.pop(pid, None)
+            self.clone_pids.discard(pid)
 
         else:
             ''' assume the exitHap was for a one-off syscall such as execve that
                 broke the simulation. '''
             ''' TBD NOTE procs returning from blocked syscalls will not be caught! '''
-            for eip in self.exit_pids:
-                del self.exit_pids[eip][:]
+            for eip in self.exit_hap:
                 self.context_manager.genDeleteHap(self.exit_hap[eip])
-                self.lgr.debug('sharedSyscall rmExitHap, assume one-off syscall, cleared exit hap')
-
+            self.exit_hap = {}
+            self.exit_refs = {}
+            self.exit_eips = {}
+            self.lgr.debug('sharedSyscall rmExitHap, assume one-off syscall, cleared exit hap')
 
     def addExitHap(self, pid, exit_eip1, exit_eip2, exit_eip3, callnum, exit_info, traceProcs, name):
+        ''' Note the pid's pending call and have it caught at any of the given exit eips.  Each eip has
+            one breakpoint, set for its first waiting pid and removed when its last waiter leaves. '''
         self.exit_info[pid] = exit_info
         if traceProcs is not None:
-            self.trace_procs.append(pid)
+            self.trace_procs.add(pid)
         self.exit_names[pid] = name
-
-        if exit_eip1 not in self.exit_pids:
-            self.exit_pids[exit_eip1] = []
-
-        if len(self.exit_pids[exit_eip1]) == 0:
-            #self.lgr.debug('addExitHap new exit EIP1 0x%x for pid %d' % (exit_eip1, pid))
-            exit_break = self.context_manager.genBreakpoint(self.cell, 
-                                Sim_Break_Linear, Sim_Access_Execute, exit_eip1, 1, 0)
-            self.exit_hap[exit_eip1] = self.context_manager.genHapIndex("Core_Breakpoint_Memop", self.exitHap, 
-                               None, exit_break, 'exit hap')
-            #self.lgr.debug('sharedSyscall added exit hap %d' % self.exit_hap[exit_eip1])
-        self.exit_pids[exit_eip1].append(pid)
-
-        if exit_eip2 is not None:
-            if exit_eip2 not in self.exit_pids:
-                self.exit_pids[exit_eip2] = []
-
-            if len(self.exit_pids[exit_eip2]) == 0:
-                #self.lgr.debug('addExitHap new exit EIP2 0x%x for pid %d' % (exit_eip2, pid))
-                exit_break = self.context_manager.genBreakpoint(self.cell, 
-                                    Sim_Break_Linear, Sim_Access_Execute, exit_eip2, 1, 0)
-                self.exit_hap[exit_eip2] = self.context_manager.genHapIndex("Core_Breakpoint_Memop", self.exitHap, 
-                                   None, exit_break, 'exit hap2')
-                #self.lgr.debug('sharedSyscall added exit hap2 %d' % self.exit_hap[exit_eip2])
-            self.exit_pids[exit_eip2].append(pid)
-
-        if exit_eip3 is not None:
-            if exit_eip3 not in self.exit_pids:
-                self.exit_pids[exit_eip3] = []
-
-            if len(self.exit_pids[exit_eip3]) == 0:
-                #self.lgr.debug('addExitHap new exit EIP3 0x%x for pid %d' % (exit_eip3, pid))
-                exit_break = self.context_manager.genBreakpoint(self.cell, 
-                                    Sim_Break_Linear, Sim_Access_Execute, exit_eip3, 1, 0)
-                self.exit_hap[exit_eip3] = self.context_manager.genHapIndex("Core_Breakpoint_Memop", self.exitHap, 
-                                   None, exit_break, 'exit hap3')
-                #self.lgr.debug('sharedSyscall added exit hap3 %d' % self.exit_hap[exit_eip3])
-            self.exit_pids[exit_eip3].append(pid)
-
-
+        if callnum == self.task_utils.syscallNumber('clone'):
+            self.clone_pids.add(pid)
+        else:
+            self.clone_pids.discard(pid)
+
+        ''' a pid has one pending call, replace any left over from a call that did not return '''
+        old_eips = self.exit_eips.pop(pid, [])
+        eips = []
+        for exit_eip in (exit_eip1, exit_eip2, exit_eip3):
+            if exit_eip is None or exit_eip in eips:
+                continue
+            eips.append(exit_eip)
+            if exit_eip not in self.exit_refs:
+                #self.lgr.debug('addExitHap new exit EIP 0x%x for pid %d' % (exit_eip, pid))
+                exit_break = self.context_manager.genBreakpoint(self.cell,
+                                    Sim_Break_Linear, Sim_Access_Execute, exit_eip, 1, 0)
+                self.exit_hap[exit_eip] = self.context_manager.genHapIndex("Core_Breakpoint_Memop", self.exitHap,
+                                   None, exit_break, 'exit hap')
+                self.exit_refs[exit_eip] = 0
+                #self.lgr.debug('sharedSyscall added exit hap %d' % self.exit_hap[exit_eip])
+            self.exit_refs[exit_eip] += 1
+        self.exit_eips[pid] = eips
+        self.releaseExitEips(old_eips)
 
         #self.lgr.debug('sharedSyscall addExitHap return pid %d' % pid)
 
@@ -145,6 +155,12 @@ class SharedSyscall():
         else:
             return False
 
+    def getSockWatch(self, exit_info):
+        ''' SockWatch of the syscall module that caught the call, normally that of this cell '''
+        if exit_info.syscall_module is not None:
+            return exit_info.syscall_module.sockwatch
+        return self.sockwatch
+
     def getEIP(self):
         eip = self.mem_utils.getRegValue(self.cpu, 'eip')
         return eip
@@ -304,6 +320,8 @@ class SharedSyscall():
             #self.lgr.debug('exitHap no exit_info for pid %d' % pid)
             pass
         trace_msg = ''
+        ''' data read or written by the call, kept in binary traces '''
+        trace_buf = None
         if pid == 0:
             self.lgr.debug('exitHap cell %s pid is zero' % (self.cell_name))
             return
@@ -312,9 +330,8 @@ class SharedSyscall():
             ''' no pending syscall for this pid '''
             if not self.traceProcs.pidExists(pid):
                 ''' new PID, add it without parent for now? ''' 
-                clonenum = self.task_utils.syscallNumber('clone')
-                for ppid in self.exit_info:
-                    if self.exit_info[ppid].callnum == clonenum:
+                for ppid in self.clone_pids:
+                    if ppid in self.exit_info:
                         if self.exit_info[ppid].call_param is not None:
                             self.lgr.debug('clone returning in child %d parent maybe %d' % (pid, ppid))
                             SIM_break_simulation('clone returning in child %d parent maybe %d' % (pid, ppid))
@@ -325,6 +342,7 @@ class SharedSyscall():
             if self.isPendingExecve(pid):
                 self.lgr.debug('exitHap cell %s call reschedule from execve?  for pid %d  Remove pending' % (self.cell_name, pid))
                 self.rmPendingExecve(pid)
+                self.task_utils.commChanged()
                 return 
             else:
                 ''' pid exists, but no syscall pending, assume reschedule? '''
@@ -356,11 +374,17 @@ class SharedSyscall():
         #self.lgr.debug('exitHap pid %d eax %d third:%s forth:%s ' % (pid, eax, str(third), str(forth)))
         callname = self.task_utils.syscallName(exit_info.callnum)
         #self.lgr.debug('exitHap cell %s callnum %d name %s  pid %d ' % (self.cell_name, exit_info.callnum, callname, pid))
+        sockwatch = self.getSockWatch(exit_info)
+        if callname in ['munmap', 'mremap', 'mprotect', 'brk', 'execve'] and eax >= 0:
+            ''' may change page tables without a page fault '''
+            pageUtils.pageTableChanged(cpu)
         if callname == 'clone':
             #self.lgr.debug('is clone pid %d  eax %d' % (pid, eax))
             if eax == 120:
                 SIM_break_simulation('clone faux return?')
                 return
+            if sockwatch is not None and eax > 0 and exit_info.flags is not None:
+                sockwatch.clone(pid, eax, exit_info.flags & net.CLONE_FILES)
             if  pid in self.trace_procs and self.traceProcs.addProc(eax, pid, clone=True):
                 trace_msg = ('\treturn from clone (tracing), new pid:%d  calling pid:%d\n' % (eax, pid))
                 #self.lgr.debug('exitHap clone called addProc for pid:%d parent %d' % (eax, pid))
@@ -397,8 +421,8 @@ class SharedSyscall():
                 exit_info.fname = 'unknown'
             trace_msg = ('\treturn from open pid:%d FD: %d file: %s flags: 0x%x mode: 0x%x eax: 0x%x\n' % (pid, eax, 
                    exit_info.fname, exit_info.flags, exit_info.mode, eax))
-            self.lgr.debug('return from open pid:%d (%s) FD: %d file: %s flags: 0x%x mode: 0x%x eax: 0x%x' % (pid, comm, 
-                   eax, exit_info.fname, exit_info.flags, exit_info.mode, eax))
+            self.lgr.debug('return from open pid:%d (%s) FD: %d file: %s flags: 0x%x mode: 0x%x eax: 0x%x', pid, comm, 
+                   eax, exit_info.fname, exit_info.flags, exit_info.mode, eax)
             if eax >= 0:
                 if pid in self.trace_procs:
                     self.traceProcs.open(pid, comm, exit_info.fname, eax)
@@ -431,7 +455,7 @@ class SharedSyscall():
             #self.lgr.debug('is read eax 0x%x' % eax)
             if eax >= 0 and exit_info.retval_addr is not None:
                 limit = min(eax, 10)
-                byte_string, dumb = self.mem_utils.getBytes(cpu, limit, exit_info.retval_addr)
+                byte_string, trace_buf = self.mem_utils.getBytes(cpu, limit, exit_info.retval_addr)
                 trace_msg = ('\treturn from read pid:%d FD: %d count: %d into 0x%x\n\t%s\n' % (pid, exit_info.old_fd, 
                               eax, exit_info.retval_addr, byte_string))
                 if exit_info.call_params is not None and exit_info.call_params.break_simulation and self.dataWatch is not None \
@@ -458,6 +482,7 @@ class SharedSyscall():
                 if eax < 1024:
                     byte_string, byte_array = self.mem_utils.getBytes(cpu, eax, exit_info.retval_addr)
                     s = ''.join(map(chr,byte_array))
+                    trace_buf = byte_array
                     #trace_msg = ('\treturn from write pid:%d FD: %d count: %d\n\t%s\n' % (pid, exit_info.old_fd, eax, byte_string))
                     trace_msg = ('\treturn from write pid:%d FD: %d count: %d\n\t%s\n' % (pid, exit_info.old_fd, eax, s))
                     if self.traceFiles is not None:
@@ -522,11 +547,15 @@ class SharedSyscall():
                     self.traceFiles.close(exit_info.old_fd)
             
         elif callname == 'fcntl64':        
-            if eax >= 0 and exit_info.cmd == net.F_DUPFD:
+            if eax >= 0 and (exit_info.cmd == net.F_DUPFD or exit_info.cmd == net.F_DUPFD_CLOEXEC):
                 if pid in self.trace_procs:
                     self.traceProcs.dup(pid, exit_info.old_fd, eax)
+                if sockwatch is not None:
+                    sockwatch.dup(pid, exit_info.old_fd, eax, cloexec=(exit_info.cmd == net.F_DUPFD_CLOEXEC))
                 trace_msg = ('\treturn from fcntl64 F_DUPFD pid %d, old_fd: %d new: %d\n' % (pid, exit_info.old_fd, eax))
             else:
+                if eax >= 0 and exit_info.cmd == net.F_SETFD and sockwatch is not None:
+                    sockwatch.setCloexec(pid, exit_info.old_fd, (exit_info.flags & net.FD_CLOEXEC) != 0)
                 trace_msg = ('\treturn from fcntl64  pid %d, old_fd: %d retval: %d\n' % (pid, exit_info.old_fd, eax))
 
         elif callname == 'dup':
@@ -534,6 +563,8 @@ class SharedSyscall():
             if eax >= 0:
                 if pid in self.trace_procs:
                     self.traceProcs.dup(pid, exit_info.old_fd, eax)
+                if sockwatch is not None:
+                    sockwatch.dup(pid, exit_info.old_fd, eax)
                 trace_msg = ('\treturn from dup pid %d, old_fd: %d new: %d\n' % (pid, exit_info.old_fd, eax))
         elif callname == 'dup2':
             #self.lgr.debug('return from dup2 pid %d eax %x, old_fd is %d new_fd %d' % (pid, eax, exit_info.old_fd, exit_info.new_fd))
@@ -541,6 +572,8 @@ class SharedSyscall():
                 if exit_info.old_fd != exit_info.new_fd:
                     if pid in self.trace_procs:
                         self.traceProcs.dup(pid, exit_info.old_fd, exit_info.new_fd)
+                    if sockwatch is not None:
+                        sockwatch.dup(pid, exit_info.old_fd, exit_info.new_fd)
                     trace_msg = ('\treturn from dup2 pid:%d, old_fd: %d new: %d\n' % (pid, exit_info.old_fd, eax))
                 else:
                     trace_msg = ('\treturn from dup2 pid:%d, old_fd: and new both %d   Eh?\n' % (pid, eax))
@@ -572,10 +605,25 @@ class SharedSyscall():
             if pid in self.trace_procs:
                 self.traceProcs.addProc(ueax, pid)
                 self.traceProcs.copyOpen(pid, eax)
+            if sockwatch is not None and eax > 0:
+                sockwatch.clone(pid, eax, False)
+        elif callname == 'fork':
+            trace_msg = ('\treturn from fork in parent %d child pid:%d\n' % (pid, ueax))
+            if pid in self.trace_procs:
+                self.traceProcs.addProc(ueax, pid)
+                self.traceProcs.copyOpen(pid, eax)
+            if sockwatch is not None and eax > 0:
+                sockwatch.clone(pid, eax, False)
         elif callname == 'execve':
             #self.lgr.debug('exitHap from execve pid:%d  remove from pending_execve' % pid)
+            if sockwatch is not None and eax == 0:
+                sockwatch.execve(pid)
             if self.isPendingExecve(pid):
                 self.rmPendingExecve(pid)
+            self.task_utils.commChanged()
+        elif callname == 'prctl':
+            self.task_utils.commChanged()
+            trace_msg = ('\treturn from call %s code: 0x%x  pid:%d\n' % (callname, ueax, pid))
         elif callname == 'socketcall' or callname.upper() in net.callname:
             trace_msg = self.doSockets(exit_info, eax, pid)
         else:
@@ -611,6 +659,8 @@ class SharedSyscall():
                 SIM_run_alone(my_syscall.stopAlone, 'found matching call parameters')
     
         if trace_msg is not None and len(trace_msg.strip())>0:
-            self.lgr.debug('cell %s %s'  % (self.cell_name, trace_msg.strip()))
-            self.traceMgr.write(trace_msg) 
+            self.lgr.debug('cell %s %s', self.cell_name, resim_utils.Lazy(trace_msg.strip))
+            if trace_buf is not None:
+                trace_buf = bytearray(trace_buf)
+            self.traceMgr.writeRecord(trace_msg, pid=pid, callnum=exit_info.callnum, args=(ueax,), buf=trace_buf)
 
@@ -0,0 +1,111 @@
+import os
+import struct
+import pickle
+'''
+Versioned container for the monitor state saved with a snapshot.  Each component
+(e.g., a cell's soMap or traceProcs) is stored as its own section, pickled separately
+and tagged with the schema version of the component that wrote it.  The file is:
+
+    header: magic, container version, length of the table of contents
+    table of contents: pickled dict of section name -> (schema version, offset, length)
+    section data, offsets relative to the end of the table of contents
+
+Opening a container reads only the header and table of contents.  A section is read
+and unpickled the first time it is requested, and only if its schema version matches
+the version expected by the caller, otherwise the component starts with empty state.
+Snapshots written before the container existed have no STATE_FILE, and components
+fall back to their individual pickle files.
+'''
+STATE_FILE = 'resim_state.bin'
+STATE_MAGIC = 'RSNAP'
+CONTAINER_VERSION = 1
+HEADER = struct.Struct('<5sII')
+
+''' snapshot name -> SnapState opened for reading '''
+snap_states = {}
+
+class SnapState():
+    def __init__(self, lgr):
+        self.lgr = lgr
+        self.path = None
+        ''' sections to be written: name -> (schema version, pickled data) '''
+        self.pending = {}
+        ''' sections in the file read: name -> (schema version, offset, length) '''
+        self.toc = {}
+        self.data_start = None
+        ''' sections already unpickled '''
+        self.loaded = {}
+
+    def put(self, name, version, data):
+        self.pending[name] = (version, pickle.dumps(data, pickle.HIGHEST_PROTOCOL))
+
+    def write(self, snap_name):
+        self.path = os.path.join('./', snap_name, STATE_FILE)
+        toc = {}
+        offset = 0
+        names = sorted(self.pending)
+        for name in names:
+            version, blob = self.pending[name]
+            toc[name] = (version, offset, len(blob))
+            offset += len(blob)
+        toc_blob = pickle.dumps(toc, pickle.HIGHEST_PROTOCOL)
+        with open(self.path, 'wb') as fh:
+            fh.write(HEADER.pack(STATE_MAGIC, CONTAINER_VERSION, len(toc_blob)))
+            fh.write(toc_blob)
+            for name in names:
+                fh.write(self.pending[name][1])
+        self.lgr.debug('SnapState wrote %d sections to %s' % (len(names), self.path))
+
+    def read(self, snap_name):
+        ''' read the table of contents, return False if there is no usable container '''
+        path = os.path.join('./', snap_name, STATE_FILE)
+        if not os.path.isfile(path):
+            return False
+        with open(path, 'rb') as fh:
+            header = fh.read(HEADER.size)
+            if len(header) != HEADER.size:
+                self.lgr.error('SnapState %s is truncated' % path)
+                return False
+            magic, version, toc_len = HEADER.unpack(header)
+            if magic != STATE_MAGIC or version != CONTAINER_VERSION:
+                self.lgr.error('SnapState %s is not a version %d state file' % (path, CONTAINER_VERSION))
+                return False
+            self.toc = pickle.loads(fh.read(toc_len))
+        self.path = path
+        self.data_start = HEADER.size + toc_len
+        self.lgr.debug('SnapState read %d section names from %s' % (len(self.toc), path))
+        return True
+
+    def has(self, name):
+        return name in self.toc
+
+    def get(self, name, version):
+        ''' Return the data of the named section, unpickling it on first use.  None if the
+            section is missing or was written with another schema version. '''
+        if name in self.loaded:
+            return self.loaded[name]
+        if name not in self.toc:
+            return None
+        saved_version, offset, length = self.toc[name]
+        if saved_version != version:
+            self.lgr.error('SnapState section %s is schema version %d, expected %d, ignoring it' % (name, saved_version, version))
+            return None
+        with open(self.path, 'rb') as fh:
+            fh.seek(self.data_start + offset)
+            data = pickle.loads(fh.read(length))
+        self.loaded[name] = data
+        #self.lgr.debug('SnapState loaded section %s, %d bytes' % (name, length))
+        return data
+
+def getSnapState(snap_name, lgr):
+    ''' the container of the named snapshot, opened once, or None if the snapshot predates it '''
+    if snap_name not in snap_states:
+        state = SnapState(lgr)
+        if state.read(snap_name):
+            snap_states[snap_name] = state
+        else:
+            snap_states[snap_name] = None
+    return snap_states[snap_name]
+
+def sectionName(cell_name, component):
+    return '%s/%s' % (cell_name, component)
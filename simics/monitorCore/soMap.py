@@ -1,31 +1,88 @@
 import os
 import pickle
+import bisect
 import elfText
+import snapState
 '''
 Manage maps of shared object libraries
 Also track text segment.
 NOTE: does not catch introduction of new code other than so libraries
 '''
+''' schema version of the state saved with snapshots '''
+STATE_VERSION = 1
+''' attributes restored from a snapshot, see SOMap.__getattr__ '''
+SNAP_STATE = ['so_addr_map', 'so_file_map', 'text_start', 'text_end', 'text_prog']
+class SOIndex():
+    ''' SO text segments of one pid sorted by load address, for bisect lookups '''
+    def __init__(self, file_map):
+        self.file_map = file_map
+        self.count = len(file_map)
+        segs = sorted(file_map, key=lambda text_seg: text_seg.locate)
+        self.starts = [text_seg.locate for text_seg in segs]
+        self.ends = [text_seg.locate + text_seg.size for text_seg in segs]
+        self.fnames = [file_map[text_seg] for text_seg in segs]
+        ''' largest end of any segment up to each index, in case segments overlap '''
+        self.max_ends = []
+        max_end = None
+        for end in self.ends:
+            if max_end is None or end > max_end:
+                max_end = end
+            self.max_ends.append(max_end)
+
+    def isCurrent(self, file_map):
+        return file_map is self.file_map and len(file_map) == self.count
+
+    def find(self, address):
+        ''' index of the segment containing the address, or None '''
+        i = bisect.bisect_right(self.starts, address) - 1
+        while i >= 0 and self.max_ends[i] >= address:
+            if address <= self.ends[i]:
+                return i
+            i -= 1
+        return None
+
 class SOMap():
     def __init__(self, cell_name, context_manager, task_utils, targetFS, run_from_snap, lgr):
         self.context_manager = context_manager
         self.task_utils = task_utils
         self.targetFS = targetFS
         self.cell_name = cell_name
+        self.lgr = lgr
+        ''' pid -> SOIndex, built on demand from so_file_map '''
+        self.so_index = {}
+        ''' snapshot whose state is not unpickled until first used '''
+        self.pending_snap = run_from_snap
+        if run_from_snap is None:
+            self.initState()
+
+    def initState(self):
         self.so_addr_map = {}
         self.so_file_map = {}
-        self.lgr = lgr
         self.text_start = {}
         self.text_end = {}
         self.text_prog = {}
-        if run_from_snap is not None:
-            self.loadPickle(run_from_snap)
+
+    def __getattr__(self, name):
+        ''' only called for attributes not yet set, i.e., the snapshot state has not been loaded '''
+        if name in SNAP_STATE and self.__dict__.get('pending_snap') is not None:
+            snap_name = self.pending_snap
+            self.pending_snap = None
+            self.loadPickle(snap_name)
+            return getattr(self, name)
+        raise AttributeError(name)
 
     def loadPickle(self, name):
-        somap_file = os.path.join('./', name, self.cell_name, 'soMap.pickle')
-        if os.path.isfile(somap_file):
-            self.lgr.debug('SOMap pickle from %s' % somap_file)
-            so_pickle = pickle.load( open(somap_file, 'rb') ) 
+        self.initState()
+        so_pickle = None
+        snap_state = snapState.getSnapState(name, self.lgr)
+        if snap_state is not None:
+            so_pickle = snap_state.get(snapState.sectionName(self.cell_name, 'soMap'), STATE_VERSION)
+        else:
+            somap_file = os.path.join('./', name, self.cell_name, 'soMap.pickle')
+            if os.path.isfile(somap_file):
+                self.lgr.debug('SOMap pickle from %s' % somap_file)
+                so_pickle = pickle.load( open(somap_file, 'rb') ) 
+        if so_pickle is not None:
             #print('start %s' % str(so_pickle['text_start']))
             self.so_addr_map = so_pickle['so_addr_map']
             self.so_file_map = so_pickle['so_file_map']
@@ -40,23 +97,20 @@ class SOMap():
             
             #self.lgr.debug('SOMap  loadPickle text 0x%x 0x%x' % (self.text_start, self.text_end))
 
-    def pickleit(self, name):
-        somap_file = os.path.join('./', name, self.cell_name, 'soMap.pickle')
+    def saveState(self, snap_state):
         so_pickle = {}
         so_pickle['so_addr_map'] = self.so_addr_map
         so_pickle['so_file_map'] = self.so_file_map
         so_pickle['text_start'] = self.text_start
         so_pickle['text_end'] = self.text_end
         so_pickle['text_prog'] = self.text_prog
-        fd = open( somap_file, "wb") 
-        pickle.dump( so_pickle, fd)
-        self.lgr.debug('SOMap pickleit to %s ' % (somap_file))
+        snap_state.put(snapState.sectionName(self.cell_name, 'soMap'), STATE_VERSION, so_pickle)
 
-    def isCode(self, address):
-        ''' is the given address within the text segment or those of SO libraries? '''
+    def isCode(self, address, pid=None):
+        ''' is the given address within the text segment or those of SO libraries? 
+            Pass the pid, if known, to avoid reading the current process. '''
         #self.lgr.debug('compare 0x%x to 0x%x - 0x%x' % (address, self.text_start, self.text_end))
-        cpu, comm, pid = self.task_utils.curProc() 
-        pid = self.getSOPid(pid)
+        pid = self.getPid(pid)
         if pid is None:
             cpu, comm, pid = self.task_utils.curProc() 
             self.lgr.debug('SOMap isCode, pid:%d missing from so_file_map' % pid)
@@ -68,16 +122,23 @@ class SOMap():
         if pid not in self.so_file_map:
             self.lgr.debug('SOMap isCode, pid:%d missing from so_file_map' % pid)
             return False
-        for text_seg in self.so_file_map[pid]:
-            start = text_seg.locate 
-            end = start + text_seg.size
-            if address >= start and address <= end:
-                return True
-        return False
+        return self.getSOIndex(pid).find(address) is not None
 
-    def isMainText(self, address):
-        cpu, comm, pid = self.task_utils.curProc() 
-        pid = self.getSOPid(pid)
+    def getPid(self, pid):
+        ''' pid whose so map applies to the given pid, or to the current process if None '''
+        if pid is None:
+            cpu, comm, pid = self.task_utils.curProc() 
+        return self.getSOPid(pid)
+
+    def getSOIndex(self, pid):
+        index = self.so_index.get(pid)
+        if index is None or not index.isCurrent(self.so_file_map[pid]):
+            index = SOIndex(self.so_file_map[pid])
+            self.so_index[pid] = index
+        return index
+
+    def isMainText(self, address, pid=None):
+        pid = self.getPid(pid)
         if pid is None:
             return False
         if pid in self.text_start:
@@ -93,6 +154,7 @@ class SOMap():
         self.text_start[pid] = start
         self.text_end[pid] = start+size
         self.text_prog[pid] = prog
+        self.so_index.pop(pid, None)
        
     def addSO(self, pid_in, fpath, addr, count):
         pid = self.getThreadPid(pid_in, quiet=True)
@@ -113,6 +175,7 @@ class SOMap():
 
         self.so_addr_map[pid][fpath] = text_seg
         self.so_file_map[pid][text_seg] = fpath
+        self.so_index.pop(pid, None)
         self.lgr.debug('soMap addSO pid:%d, full: %s size: 0x%x given count: 0x%x, locate: 0x%x addr: 0x%x off 0x%x  len so_map %d' % (pid, 
                full_path, text_seg.size, count, addr, text_seg.address, text_seg.offset, len(self.so_addr_map[pid])))
 
@@ -166,6 +229,7 @@ class SOMap():
             self.lgr.debug('SOMap handleExit pid %d NOT in pidlist' % pid)
         del self.so_addr_map[pid]
         del self.so_file_map[pid]
+        self.so_index.pop(pid, None)
         if pid in self.text_start:
            del self.text_start[pid]
            del self.text_end[pid]
@@ -208,15 +272,14 @@ class SOMap():
                     retval = None
         return retval
 
-    def getSOFile(self, addr_in):
+    def getSOFile(self, addr_in, pid=None):
         retval = None
         #pid = self.getThreadPid(pid_in)
         #if pid is None:
         #    self.lgr.error('getSOFile, no such pid in threads %d' % pid_in)
         #    return
         #self.lgr.debug('getSOFile for pid %d addr 0x%x' % (pid, addr_in))
-        cpu, comm, pid = self.task_utils.curProc() 
-        pid = self.getSOPid(pid)
+        pid = self.getPid(pid)
         if pid is None:
             return None
         if pid in self.so_file_map:
@@ -226,34 +289,28 @@ class SOMap():
             if addr_in >= self.text_start[pid] and addr_in <= self.text_end[pid]:
                 retval = self.text_prog[pid]
             else:
-                for text_seg in sorted(self.so_file_map[pid]):
-                    start = text_seg.locate 
-                    end = start + text_seg.size
-                    if start <= addr_in and addr_in <= end:
-                        retval = self.so_file_map[pid][text_seg]
-                        break
+                index = self.getSOIndex(pid)
+                i = index.find(addr_in)
+                if i is not None:
+                    retval = index.fnames[i]
             
         else:
             self.lgr.debug('getSOFile no so map for %d' % pid)
         return retval
 
-    def getSOInfo(self, addr_in):
+    def getSOInfo(self, addr_in, pid=None):
         retval = None, None, None
-        cpu, comm, pid = self.task_utils.curProc() 
-        pid = self.getSOPid(pid)
+        pid = self.getPid(pid)
         if pid is None:
             return None
         if pid in self.so_file_map:
             if addr_in >= self.text_start[pid] and addr_in <= self.text_end[pid]:
                 retval = self.text_prog[pid], self.text_start[pid], self.text_end[pid]
             else:
-                for text_seg in sorted(self.so_file_map[pid]):
-                    #start = text_seg.locate + text_seg.offset
-                    start = text_seg.locate 
-                    end = start + text_seg.size
-                    if start <= addr_in and addr_in <= end:
-                        retval = self.so_file_map[pid][text_seg], start, end
-                        break
+                index = self.getSOIndex(pid)
+                i = index.find(addr_in)
+                if i is not None:
+                    retval = index.fnames[i], index.starts[i], index.ends[i]
             
         else:
             self.lgr.debug('getSOInfo no so map for %d' % pid)
@@ -1,6 +1,19 @@
 from simics import *
 import json
 import os
+import time
+import instructCache
+import decode
+''' (cell, physical code page, page generation) -> {page offset of a return address candidate: 
+    distance back to its call instruction, or None if not preceded by a call} '''
+call_site_memo = {}
+''' default per-trace budgets, traces that exceed them report what was found '''
+MAX_WORDS = 9000
+MAX_SECONDS = 5
+''' stack words scanned between checks of the time budget '''
+TIME_CHECK = 64
+''' functions that begin a stack, nothing of interest is above their frames '''
+OUTER_FUNS = ['_start', '__libc_start_main', 'start_thread', '__clone', 'clone']
 class StackTrace():
     class FrameEntry():
         def __init__(self, ip, fname, instruct):
@@ -8,7 +21,7 @@ class StackTrace():
             self.fname = fname
             self.instruct = instruct
 
-    def __init__(self, top, cpu, pid, soMap, mem_utils, task_utils, stack_base, ida_funs, targetFS, lgr):
+    def __init__(self, top, cpu, pid, soMap, mem_utils, task_utils, stack_base, ida_funs, targetFS, lgr, max_words=MAX_WORDS, max_seconds=MAX_SECONDS):
         self.top = top
         self.cpu = cpu
         self.pid = pid
@@ -20,6 +33,10 @@ class StackTrace():
         self.task_utils = task_utils
         self.stack_base = stack_base
         self.ida_funs = ida_funs
+        self.max_words = max_words
+        self.max_seconds = max_seconds
+        ''' True if the trace stopped on a budget rather than reaching the top of the stack '''
+        self.partial = False
         if cpu.architecture == 'arm':
             self.callnm = 'bl'
             self.jmpnm = 'bx'
@@ -29,11 +46,44 @@ class StackTrace():
 
         self.doTrace()
 
+    def memoKey(self, return_to):
+        try:
+            phys_block = self.cpu.iface.processor_info.logical_to_physical(return_to, Sim_Access_Execute)
+        except:
+            return None, None
+        if phys_block.address == 0:
+            return None, None
+        cell_name = decode.getTopComponentName(self.cpu)
+        page = phys_block.address & ~0xfff
+        return (cell_name, page, instructCache.getPageGen(cell_name, page)), phys_block.address - page
+
     def followCall(self, return_to):
+        ''' Return the address of the call instruction that precedes the given return address, or None.
+            Call sites found are memoized per code page.  Misses are not, since a reused page
+            could then hide real frames. '''
+        key, offset = self.memoKey(return_to)
+        if key is None:
+            return self.findCall(return_to)
+        memo = call_site_memo.get(key)
+        if memo is not None and offset in memo:
+            call_ip = return_to - memo[offset]
+            ''' page may have been reused for other code '''
+            if instructCache.disassemble(self.cpu, call_ip)[1].startswith(self.callnm):
+                return call_ip
+            del memo[offset]
+        retval = self.findCall(return_to)
+        if retval is not None:
+            if memo is None:
+                memo = {}
+                call_site_memo[key] = memo
+            memo[offset] = return_to - retval
+        return retval
+
+    def findCall(self, return_to):
         retval = None
         if self.cpu.architecture == 'arm':
             eip = return_to - 4
-            instruct = SIM_disassemble_address(self.cpu, eip, 1, 0)
+            instruct = instructCache.disassemble(self.cpu, eip)
             if instruct[1].startswith(self.callnm):
                 parts = instruct[1].split()
                 if len(parts) == 2:
@@ -42,7 +92,7 @@ class StackTrace():
                     except:
                         retval = eip
                         return retval
-                    if self.soMap.isCode(dst):
+                    if self.soMap.isCode(dst, pid=self.pid):
                         retval = eip
                 else:        
                     retval = eip
@@ -51,7 +101,7 @@ class StackTrace():
             # TBD use instruction length to confirm it is a true call
             # not always 2* word size?
             while retval is None and eip < return_to:
-                instruct = SIM_disassemble_address(self.cpu, eip, 1, 0)
+                instruct = instructCache.disassemble(self.cpu, eip)
                 #self.lgr.debug('stackTrace followCall instruct %s' % instruct[1])
                 if instruct[1].startswith(self.callnm):
                     parts = instruct[1].split()
@@ -61,7 +111,7 @@ class StackTrace():
                         except:
                             retval = eip
                             continue
-                        if self.soMap.isCode(dst):
+                        if self.soMap.isCode(dst, pid=self.pid):
                             retval = eip
                         else:
                             #self.lgr.debug('stackTrace dst not code 0x%x' % dst)
@@ -117,12 +167,43 @@ class StackTrace():
                     print('0x%08x %s %s' % (frame.ip, fname, frame.instruct))
             else:
                 print('0x%08x %s %s' % (frame.ip, fname, frame.instruct))
+        if self.partial:
+            print('stack trace is partial, stopped on its word or time budget')
+
+    def frameChainEnd(self, esp):
+        ''' If the frame pointer chain from ebp is well formed, return the address of the return
+            address of the outermost frame, above which nothing need be scanned.  Otherwise None. '''
+        if self.cpu.architecture == 'arm':
+            return None
+        ebp = self.mem_utils.getRegValue(self.cpu, 'ebp')
+        for i in range(256):
+            if ebp < esp or (self.stack_base is not None and ebp > self.stack_base):
+                return None
+            next_ebp = self.mem_utils.readPtr(self.cpu, ebp)
+            if next_ebp is None:
+                return None
+            ret_addr = self.mem_utils.readPtr(self.cpu, ebp + self.mem_utils.WORD_SIZE)
+            if ret_addr is None or not self.soMap.isCode(ret_addr, pid=self.pid):
+                return None
+            if next_ebp == 0:
+                return ebp + self.mem_utils.WORD_SIZE
+            if next_ebp <= ebp:
+                return None
+            ebp = next_ebp
+        return None
+
+    def isOuterFun(self, ip):
+        if self.ida_funs is None:
+            return False
+        fun = self.ida_funs.getFun(ip)
+        return fun is not None and self.ida_funs.getName(fun) in OUTER_FUNS
 
     def doTrace(self):
+        start_time = time.time()
         esp = self.mem_utils.getRegValue(self.cpu, 'esp')
         self.lgr.debug('stackTrace doTrace esp is 0x%x' % esp)
         eip = self.top.getEIP(self.cpu)
-        fname = self.soMap.getSOFile(eip)
+        fname = self.soMap.getSOFile(eip, pid=self.pid)
         #print('0x%08x  %-s' % (eip, fname))
         frame = self.FrameEntry(eip, fname, '')
         self.frames.append(frame)
@@ -134,7 +215,7 @@ class StackTrace():
         been_in_main = False
         prev_ip = None
         so_checked = []
-        if self.soMap.isMainText(eip):
+        if self.soMap.isMainText(eip, pid=self.pid):
             self.lgr.debug('stackTrace starting in main text')
             been_in_main = True
             prev_ip = eip
@@ -143,8 +224,8 @@ class StackTrace():
             self.lgr.warning('stackTrace has no ida functions')
 
         ''' record info about current IP '''
-        instruct = SIM_disassemble_address(self.cpu, eip, 1, 0)[1]
-        fname = self.soMap.getSOFile(eip)
+        instruct = instructCache.disassemble(self.cpu, eip)[1]
+        fname = self.soMap.getSOFile(eip, pid=self.pid)
         self.lgr.debug('cur eip 0x%x instruct %s  fname %s' % (eip, instruct, fname))
         if fname is None:
             frame = self.FrameEntry(eip, 'unknown', instruct)
@@ -153,14 +234,21 @@ class StackTrace():
             frame = self.FrameEntry(eip, fname, instruct)
             self.frames.append(frame)
 
-        while not done and (count < 9000): 
+        chain_end = self.frameChainEnd(esp)
+        if chain_end is not None:
+            self.lgr.debug('stackTrace frame pointer chain ends at 0x%x' % chain_end)
+        while not done and (count < self.max_words): 
+            if count % TIME_CHECK == 0 and count > 0 and (time.time() - start_time) > self.max_seconds:
+                self.lgr.debug('stackTrace time budget of %d seconds exceeded after %d words' % (self.max_seconds, count))
+                self.partial = True
+                break
             val = self.mem_utils.readPtr(self.cpu, ptr)
             # TBD should be part of readPtr?
             if self.mem_utils.WORD_SIZE == 8:
                 val = val & 0x0000ffffffffffff
             skip_this = False
                 
-            if self.soMap.isCode(val):
+            if self.soMap.isCode(val, pid=self.pid):
                 call_ip = self.followCall(val)
                 if call_ip is not None:
                    #self.lgr.debug('is code: 0x%x from ptr 0x%x   call_ip 0x%x' % (val, ptr, call_ip))
@@ -169,13 +257,13 @@ class StackTrace():
                    #self.lgr.debug('is code not follow call: 0x%x from ptr 0x%x   ' % (val, ptr))
                    pass
                    
-                if been_in_main and not self.soMap.isMainText(val):
+                if been_in_main and not self.soMap.isMainText(val, pid=self.pid):
                     ''' once in main text assume we never leave? what about callbacks?'''
                     skip_this = True
                     
                 if been_in_main and self.ida_funs is not None and call_ip is not None and prev_ip is not None:
                 #if self.ida_funs is not None and call_ip is not None and prev_ip is not None:
-                    instruct = SIM_disassemble_address(self.cpu, call_ip, 1, 0)[1]
+                    instruct = instructCache.disassemble(self.cpu, call_ip)[1]
                     call_to_s = instruct.split()[1]
                     call_to = None
                     #self.lgr.debug('stackTrace check call to %s' % call_to_s)
@@ -188,18 +276,18 @@ class StackTrace():
                         if call_to not in so_checked:
                             ''' should we add ida function analysys? '''
                             if not self.ida_funs.isFun(call_to):
-                                fname, start, end = self.soMap.getSOInfo(call_to)
+                                fname, start, end = self.soMap.getSOInfo(call_to, pid=self.pid)
                                 #self.lgr.debug('so checj of %s' % fname)
                                 if fname is not None:
                                     full_path = self.targetFS.getFull(fname)
-                                    self.ida_funs.add(full_path, start)
+                                    self.ida_funs.add(full_path, start, end)
                             so_checked.append(call_to) 
                         if self.ida_funs.isFun(call_to):
                             if not self.ida_funs.inFun(prev_ip, call_to):
                                 skip_this = True
                                 #self.lgr.debug('StackTrace addr 0x%x not in fun 0x%x, skip it' % (prev_ip, call_to))
                         else:
-                            tmp_instruct = SIM_disassemble_address(self.cpu, call_to, 1, 0)[1]
+                            tmp_instruct = instructCache.disassemble(self.cpu, call_to)[1]
                             if tmp_instruct.startswith(self.jmpnm):
                                 skip_this = True
                                 #self.lgr.debug('stackTrace 0x%x is jump table?' % call_to)
@@ -209,9 +297,9 @@ class StackTrace():
  
                 if call_ip is not None and not skip_this:
                     skip_this = False
-                    instruct = SIM_disassemble_address(self.cpu, call_ip, 1, 0)[1]
+                    instruct = instructCache.disassemble(self.cpu, call_ip)[1]
                     #self.lgr.debug('followCall call_ip 0x%x %s' % (call_ip, instruct))
-                    fname = self.soMap.getSOFile(val)
+                    fname = self.soMap.getSOFile(val, pid=self.pid)
                     if fname is None:
                         #print('0x%08x  %-s' % (call_ip, 'unknown'))
                         frame = self.FrameEntry(call_ip, 'unknown', instruct)
@@ -230,9 +318,12 @@ class StackTrace():
                             self.soCheck(call_to)
 
                     prev_ip = call_ip
-                    if self.soMap.isMainText(call_ip):
+                    if self.soMap.isMainText(call_ip, pid=self.pid):
                         been_in_main = True
                         #self.lgr.debug('stackTrace been in main')
+                    if self.isOuterFun(call_ip):
+                        self.lgr.debug('stackTrace reached outer function at 0x%x' % call_ip)
+                        done = True
                 else:
                     #self.lgr.debug('nothing from followCall')
                     pass
@@ -244,17 +335,23 @@ class StackTrace():
             if self.stack_base is not None and ptr > self.stack_base:
                 self.lgr.debug('stackTrace ptr 0x%x > stack_base 0x%x' % (ptr, self.stack_base)) 
                 done = True
+            elif chain_end is not None and ptr > chain_end:
+                self.lgr.debug('stackTrace ptr 0x%x beyond outermost frame' % ptr)
+                done = True
+        if not done and count >= self.max_words and self.stack_base is not None:
+            self.lgr.debug('stackTrace word budget of %d exceeded' % self.max_words)
+            self.partial = True
 
 
     def soCheck(self, eip):
 
         ''' should we add ida function analysis? '''
         if self.ida_funs is not None and not self.ida_funs.isFun(eip):
-            fname, start, end = self.soMap.getSOInfo(eip)
+            fname, start, end = self.soMap.getSOInfo(eip, pid=self.pid)
             if fname is not None:
                 full = self.targetFS.getFull(fname)
                 self.lgr.debug('stackTrace soCheck eip 0x%x not a fun? fname %s full %s start 0x%x' % (eip, fname,full, start))
-                self.ida_funs.add(full, start)
+                self.ida_funs.add(full, start, end)
 
 
     def countFrames(self):
@@ -10,6 +10,7 @@ import stopFunction
 import pageUtils
 import elfText
 import diddler
+import resim_utils
 '''
     Trace syscalls.  Used for process tracing and debug, e.g., runToConnect.
     When used in debugging, or tracing a single process, we assume that
@@ -27,37 +28,67 @@ def is_ascii(s):
     return all(ord(c) < 128 for c in s)
 
 class SockWatch():
-    ''' track selected socket activity '''
+    ''' track selected socket activity.  Watched descriptors are kept in a table per pid, indexed
+        by fd.  Pids that share descriptors, i.e., clone with CLONE_FILES, share the same table. '''
     def __init__(self):
+        ''' pid -> {fd: sockFD} '''
         self.watches = {}
     class sockFD():
-        def __init__(self, fd, call_param):
+        def __init__(self, fd, call_param, cloexec=False):
             self.fd = fd
             self.call_param = call_param
+            self.cloexec = cloexec
 
     def bind(self, pid, fd, call_param):
         if pid not in self.watches:
-            self.watches[pid] = []
-        self.watches[pid].append(self.sockFD(fd, call_param))
+            self.watches[pid] = {}
+        self.watches[pid][fd] = self.sockFD(fd, call_param)
 
     def getParam(self, pid, fd):
-        retval = None
-        if pid in self.watches:
-            for watch in self.watches[pid]:
-                if watch.fd == fd:
-                    return watch.call_param
-        return retval 
+        if pid in self.watches and fd in self.watches[pid]:
+            return self.watches[pid][fd].call_param
+        return None
 
     def close(self, pid, fd):
-        if pid in self.watches:
-            got_it = None
-            for watch in self.watches[pid]:
-                if watch.fd == fd:
-                    print('close %d for %d' % (fd, pid))
-                    got_it = watch
-                    break
-            if got_it is not None:
-                self.watches[pid].remove(got_it) 
+        if pid in self.watches and fd in self.watches[pid]:
+            print('close %d for %d' % (fd, pid))
+            del self.watches[pid][fd]
+
+    def dup(self, pid, old_fd, new_fd, cloexec=False):
+        ''' new_fd now refers to whatever old_fd does, a watched new_fd is implicitly closed, e.g., by dup2 '''
+        if pid not in self.watches:
+            return
+        table = self.watches[pid]
+        if old_fd in table:
+            table[new_fd] = self.sockFD(new_fd, table[old_fd].call_param, cloexec)
+        else:
+            table.pop(new_fd, None)
+
+    def setCloexec(self, pid, fd, cloexec):
+        if pid in self.watches and fd in self.watches[pid]:
+            self.watches[pid][fd].cloexec = cloexec
+
+    def clone(self, pid, child_pid, share):
+        ''' the child of fork or clone inherits watched descriptors, shared if CLONE_FILES '''
+        if pid not in self.watches:
+            return
+        if share:
+            self.watches[child_pid] = self.watches[pid]
+        else:
+            table = {}
+            for fd, watch in self.watches[pid].items():
+                table[fd] = self.sockFD(fd, watch.call_param, watch.cloexec)
+            self.watches[child_pid] = table
+
+    def execve(self, pid):
+        ''' execve unshares the descriptor table and closes those marked close-on-exec '''
+        if pid not in self.watches:
+            return
+        table = {}
+        for fd, watch in self.watches[pid].items():
+            if not watch.cloexec:
+                table[fd] = watch
+        self.watches[pid] = table
 
 class SyscallInfo():
     def __init__(self, cpu, pid, callnum, calculated, trace, call_params = []):
@@ -71,6 +102,8 @@ class SyscallInfo():
         self.fd = None
         ''' list of criteria to narrow search to information about the call '''
         self.call_params = call_params
+        ''' parser for the call, selected when its breakpoint is set.  None when tracing all calls '''
+        self.parser = None
 
 class SelectInfo():
     def readit(self, addr, mem_utils, cpu):
@@ -133,6 +166,13 @@ class CallParams():
     def __init__(self, subcall, match_param, break_simulation=False):
         self.subcall = subcall
         self.match_param = match_param
+        ''' string match parameters are patterns, compile them once '''
+        self.match_re = None
+        if type(match_param) is str:
+            try:
+                self.match_re = re.compile(match_param, re.M|re.I)
+            except re.error:
+                pass
         self.param_flags = []
         self.break_simulation = break_simulation
         self.nth = None
@@ -173,8 +213,11 @@ class Syscall():
         self.proc_hap = []
         self.binders = binders
         self.connectors = connectors
-        ''' lists of sockets by pid that we are watching for selected tracing '''
-        self.sockwatch = SockWatch()
+        ''' lists of sockets by pid that we are watching for selected tracing, one per cell '''
+        if sharedSyscall is not None:
+            self.sockwatch = sharedSyscall.sockwatch
+        else:
+            self.sockwatch = SockWatch()
         ''' experimental watch for reads of data read from interfaces '''
         self.timeofday_count = {}
         self.timeofday_start_cycle = {}
@@ -186,6 +229,7 @@ class Syscall():
         self.bang_you_are_dead = False
         self.stop_maze_hap = None
         self.targetFS = targetFS
+        self.buildParsers()
 
         if trace is None and self.traceMgr is not None:
             tf = '/tmp/syscall_trace.txt'
@@ -243,7 +287,7 @@ class Syscall():
                 #proc_break = self.context_manager.genBreakpoint(self.cpu.physical_memory, Sim_Break_Physical, Sim_Access_Execute, phys, 1, 0)
                 break_addrs.append(self.param.arm_entry)
                 syscall_info = SyscallInfo(self.cpu, None, None, None, self.trace)
-                self.proc_hap.append(self.context_manager.genHapIndex("Core_Breakpoint_Memop", self.syscallHap, syscall_info, proc_break, 'syscall'))
+                self.proc_hap.append(self.context_manager.genHapIndex("Core_Breakpoint_Memop", self.syscallHap, syscall_info, proc_break, 'syscall', owner=self))
             else:
                 syscall_info = SyscallInfo(self.cpu, None, None, None, self.trace)
                 self.lgr.debug('Syscall no callnum, set break at 0x%x & 0x%x' % (self.param.sysenter, self.param.sys_entry))
@@ -255,16 +299,20 @@ class Syscall():
                     proc_break1 = self.context_manager.genBreakpoint(self.cell, Sim_Break_Linear, Sim_Access_Execute, self.param.sys_entry, 1, 0)
                     break_addrs.append(self.param.sys_entry)
                     break_list.append(proc_break1)
-                    self.proc_hap.append(self.context_manager.genHapRange("Core_Breakpoint_Memop", self.syscallHap, syscall_info, proc_break, proc_break1, 'syscall'))
+                    self.proc_hap.append(self.context_manager.genHapRange("Core_Breakpoint_Memop", self.syscallHap, syscall_info, proc_break, proc_break1, 'syscall', owner=self))
                 else:
-                    self.proc_hap.append(self.context_manager.genHapIndex("Core_Breakpoint_Memop", self.syscallHap, syscall_info, proc_break, 'syscall'))
+                    self.proc_hap.append(self.context_manager.genHapIndex("Core_Breakpoint_Memop", self.syscallHap, syscall_info, proc_break, 'syscall', owner=self))
         else:
-            ''' will stop within the kernel at the computed entry point '''
+            ''' will stop within the kernel at the handler of each call, read from the sys_call_table
+                entries resolved once per kernel, see taskUtils.getSyscallEntries '''
             for callnum in self.callnum_list:
                 if callnum is not None and callnum < 0:
                     self.lgr.error('Syscall bad call number %d' % callnum)
                     return None, None
                 entry = self.task_utils.getSyscallEntry(callnum)
+                if entry is None or entry == 0:
+                    self.lgr.error('Syscall no handler found for call number %d, not breaking on it' % callnum)
+                    continue
                 #phys = self.mem_utils.v2p(cpu, entry)
                 #proc_break = self.context_manager.genBreakpoint(self.cpu.physical_memory, Sim_Break_Physical, Sim_Access_Execute, phys, 1, 0)
                 name = self.task_utils.syscallName(callnum) 
@@ -274,7 +322,8 @@ class Syscall():
                 break_list.append(proc_break)
                 break_addrs.append(entry)
                 syscall_info = SyscallInfo(self.cpu, None, callnum, entry, self.trace, self.call_params)
-                self.proc_hap.append(self.context_manager.genHapIndex("Core_Breakpoint_Memop", self.syscallHap, syscall_info, proc_break, name))
+                syscall_info.parser = self.getParser(name)
+                self.proc_hap.append(self.context_manager.genHapIndex("Core_Breakpoint_Memop", self.syscallHap, syscall_info, proc_break, name, owner=self))
         return break_list, break_addrs
         
     def frameFromStackSyscall(self):
@@ -287,19 +336,12 @@ class Syscall():
 
     def stopTrace(self, immediate=False):
         self.lgr.debug('syscall stopTrace callnum_list %s' % str(self.callnum_list))
-        proc_copy = list(self.proc_hap)
-        for ph in proc_copy:
-            self.lgr.debug('syscall stopTrace, delete self.proc_hap %d' % ph)
-            self.context_manager.genDeleteHap(ph, immediate=immediate)
-            self.proc_hap.remove(ph)
+        ''' proc_hap and first_mmap_hap entries were all created with this instance as the owner '''
+        self.context_manager.genDeleteOwner(self, immediate=immediate)
+        self.proc_hap = []
 
         self.sharedSyscall.stopTrace()
 
-        mmap_copy = list(self.first_mmap_hap)
-        for pid in mmap_copy:
-            self.lgr.debug('syscall stopTrace, delete mmap hap pid %d' % pid)
-            self.context_manager.genDeleteHap(self.first_mmap_hap[pid], immediate=immediate)
-            del self.first_mmap_hap[pid]
         self.first_mmap_hap = {}
 
         if self.stop_hap is not None:
@@ -380,7 +422,7 @@ class Syscall():
         if pid in self.first_mmap_hap:
             self.context_manager.genDeleteHap(self.first_mmap_hap[pid])
             del self.first_mmap_hap[pid]
-        self.first_mmap_hap[pid] = self.context_manager.genHapIndex("Core_Breakpoint_Memop", self.firstMmapHap, syscall_info, proc_break, 'watchFirstMmap')
+        self.first_mmap_hap[pid] = self.context_manager.genHapIndex("Core_Breakpoint_Memop", self.firstMmapHap, syscall_info, proc_break, 'watchFirstMmap', owner=self)
         
     def parseOpen(self, frame, callname):
         fname_addr = frame['param1']
@@ -643,7 +685,7 @@ class Syscall():
                          s = ss.dottedPort()
                          pat = call_param.match_param
                          self.lgr.debug('syscallParse look for match %s %s' % (pat, s))
-                         go = re.search(pat, s, re.M|re.I)
+                         go = call_param.match_re is not None and call_param.match_re.search(s)
                          
                          if len(call_param.match_param.strip()) == 0 or go: 
                              self.lgr.debug('syscallParse found match %s %s' % (pat, s))
@@ -674,7 +716,7 @@ class Syscall():
                          ''' look to see if this address matches a given pattern '''
                          s = ss.dottedPort()
                          pat = call_param.match_param
-                         go = re.search(pat, s, re.M|re.I)
+                         go = call_param.match_re is not None and call_param.match_re.search(s)
                          
                          #self.lgr.debug('syscallParse look for match %s %s' % (pat, s))
                          if len(call_param.match_param.strip()) == 0 or go: 
@@ -788,239 +830,299 @@ class Syscall():
 
         return ida_msg
 
+    def buildParsers(self):
+        ''' callname -> parser method.  Each parser fills in the exit_info from the frame
+            and returns the ida message, if any. '''
+        self.parsers = {}
+        self.parsers['open'] = self.parseOpenCall
+        self.parsers['mkdir'] = self.parseMkdirCall
+        self.parsers['execve'] = self.parseExecveCall
+        self.parsers['close'] = self.parseCloseCall
+        self.parsers['dup'] = self.parseDupCall
+        self.parsers['dup2'] = self.parseDup2Call
+        self.parsers['clone'] = self.parseCloneCall
+        self.parsers['pipe'] = self.parsePipeCall
+        self.parsers['pipe2'] = self.parsePipeCall
+        self.parsers['ipc'] = self.parseIpcCall
+        self.parsers['ioctl'] = self.parseIoctlCall
+        self.parsers['gettimeofday'] = self.parseGettimeofdayCall
+        self.parsers['nanosleep'] = self.parseNanosleepCall
+        self.parsers['fcntl64'] = self.parseFcntl64Call
+        self.parsers['_llseek'] = self.parseLlseekCall
+        self.parsers['read'] = self.parseReadCall
+        self.parsers['write'] = self.parseWriteCall
+        self.parsers['mmap'] = self.parseMmapCall
+        self.parsers['mmap2'] = self.parseMmapCall
+        self.parsers['select'] = self.parseSelectCall
+        self.parsers['_newselect'] = self.parseSelectCall
+        self.parsers['socketcall'] = self.socketParse
+        for name in net.callname[1:]:
+            self.parsers[name.lower()] = self.socketParse
+
+    def getParser(self, callname):
+        return self.parsers.get(callname, self.parseOtherCall)
+
     def syscallParse(self, callnum, frame, cpu, pid, syscall_info):
         callname = self.task_utils.syscallName(callnum) 
         exit_info = ExitInfo(self, cpu, pid, callnum)
         exit_info.syscall_entry = self.mem_utils.getRegValue(self.cpu, 'pc')
-        ida_msg = None
-        if callname == 'open':        
-            exit_info.fname, exit_info.fname_addr, exit_info.flags, exit_info.mode, ida_msg = self.parseOpen(frame, callname)
-            if exit_info.fname is None:
-                ''' filename not yet present in ram, do the two step '''
-                ''' TBD think we are triggering off kernel's own read of the fname, then again someitme it seems corrupted...'''
-                ''' Do not use context manager on superstition that filename could be read in some other task context.'''
-                
-                if self.mem_utils.WORD_SIZE == 4:
-                    self.lgr.debug('syscallParse, open pid %d filename not yet here... set break at 0x%x ' % (pid, exit_info.fname_addr))
-                    self.finish_break[pid] = SIM_breakpoint(cpu.current_context, Sim_Break_Linear, Sim_Access_Read, exit_info.fname_addr, 1, 0)
-                    self.finish_hap[pid] = SIM_hap_add_callback_index("Core_Breakpoint_Memop", self.finishParseOpen, exit_info, self.finish_break[pid])
-                else:
-                    if pageUtils.isIA32E(cpu):
-                        ptable_info = pageUtils.findPageTableIA32E(cpu, exit_info.fname_addr, self.lgr)
-                        if not ptable_info.ptable_exists:
-                            self.lgr.debug('syscallParse, open pid %d filename not yet here... set ptable break at 0x%x ' % (pid, ptable_info.table_addr))
-                            self.finish_break[pid] = SIM_breakpoint(cpu.physical_memory, Sim_Break_Physical, Sim_Access_Write, ptable_info.table_addr, 1, 0)
-                            self.finish_hap_table[pid] = SIM_hap_add_callback_index("Core_Breakpoint_Memop", self.fnameTable, exit_info, self.finish_break[pid])
-                        elif not ptable_info.page_exists:
-                            self.lgr.debug('syscallParse, open pid %d filename not yet here... set page break at 0x%x ' % (pid, ptable_info.page_addr))
-                            self.finish_break[pid] = SIM_breakpoint(cpu.physical_memory, Sim_Break_Physical, Sim_Access_Write, ptable_info.page_addr, 1, 0)
-                            self.finish_hap_page[pid] = SIM_hap_add_callback_index("Core_Breakpoint_Memop", self.fnamePage, exit_info, self.finish_break[pid])
-                        
-                #SIM_break_simulation('fname is none...')
-            else:
-                for call_param in syscall_info.call_params:
-                    if type(call_param.match_param) is str:
-                        exit_info.call_params = call_param
-                        break
-
-        if callname == 'mkdir':        
-            exit_info.fname, exit_info.fname_addr, exit_info.flags, exit_info.mode, ida_msg = self.parseOpen(frame, callname)
-            if exit_info.fname is None:
-                ''' filename not yet present in ram, do the two step '''
-                ''' TBD think we are triggering off kernel's own read of the fname, then again someitme it seems corrupted...'''
-                ''' Do not use context manager on superstition that filename could be read in some other task context.'''
-                self.lgr.debug('syscallParse, mkdir pid %d filename not yet here... set break at 0x%x ' % (pid, exit_info.fname_addr))
+        if syscall_info.parser is not None:
+            parser = syscall_info.parser
+        else:
+            parser = self.getParser(callname)
+        ida_msg = parser(callname, syscall_info, frame, exit_info, pid)
+        if ida_msg is not None:
+            self.lgr.debug('%s', resim_utils.Lazy(ida_msg.strip))
+            ''' trace syscall exit unless call_params narrowed a search failed to find a match '''
+            if self.traceMgr is not None and (len(syscall_info.call_params) == 0 or exit_info.call_params is not None):
+                if len(ida_msg.strip()) > 0:
+                    args = tuple(frame.get('param%d' % i, 0) or 0 for i in range(1, 7))
+                    self.traceMgr.writeRecord(ida_msg+'\n', pid=pid, callnum=callnum, args=args)
+        return exit_info
+
+    def parseOpenCall(self, callname, syscall_info, frame, exit_info, pid):
+        cpu = exit_info.cpu
+        exit_info.fname, exit_info.fname_addr, exit_info.flags, exit_info.mode, ida_msg = self.parseOpen(frame, callname)
+        if exit_info.fname is None:
+            ''' filename not yet present in ram, do the two step '''
+            ''' TBD think we are triggering off kernel's own read of the fname, then again someitme it seems corrupted...'''
+            ''' Do not use context manager on superstition that filename could be read in some other task context.'''
+            
+            if self.mem_utils.WORD_SIZE == 4:
+                self.lgr.debug('syscallParse, open pid %d filename not yet here... set break at 0x%x ' % (pid, exit_info.fname_addr))
                 self.finish_break[pid] = SIM_breakpoint(cpu.current_context, Sim_Break_Linear, Sim_Access_Read, exit_info.fname_addr, 1, 0)
                 self.finish_hap[pid] = SIM_hap_add_callback_index("Core_Breakpoint_Memop", self.finishParseOpen, exit_info, self.finish_break[pid])
-
-        elif callname == 'execve':        
-            retval = self.parseExecve(syscall_info)
-        elif callname == 'close':        
-            fd = frame['param1']
-            if self.traceProcs is not None:
-                #self.lgr.debug('syscallparse for close pid %d' % pid)
-                self.traceProcs.close(pid, fd)
-            exit_info.old_fd = fd
-            exit_info.call_params = self.sockwatch.getParam(pid, fd)
-            self.sockwatch.close(pid, fd)
-
+            else:
+                if pageUtils.isIA32E(cpu):
+                    ptable_info = pageUtils.findPageTableIA32E(cpu, exit_info.fname_addr, self.lgr)
+                    if not ptable_info.ptable_exists:
+                        self.lgr.debug('syscallParse, open pid %d filename not yet here... set ptable break at 0x%x ' % (pid, ptable_info.table_addr))
+                        self.finish_break[pid] = SIM_breakpoint(cpu.physical_memory, Sim_Break_Physical, Sim_Access_Write, ptable_info.table_addr, 1, 0)
+                        self.finish_hap_table[pid] = SIM_hap_add_callback_index("Core_Breakpoint_Memop", self.fnameTable, exit_info, self.finish_break[pid])
+                    elif not ptable_info.page_exists:
+                        self.lgr.debug('syscallParse, open pid %d filename not yet here... set page break at 0x%x ' % (pid, ptable_info.page_addr))
+                        self.finish_break[pid] = SIM_breakpoint(cpu.physical_memory, Sim_Break_Physical, Sim_Access_Write, ptable_info.page_addr, 1, 0)
+                        self.finish_hap_page[pid] = SIM_hap_add_callback_index("Core_Breakpoint_Memop", self.fnamePage, exit_info, self.finish_break[pid])
+                    
+            #SIM_break_simulation('fname is none...')
+        else:
             for call_param in syscall_info.call_params:
-                if call_param.match_param == frame['param1']:
-                    self.lgr.debug('closed fd %d, stop trace' % fd)
-                    self.stopTrace()
-                    ida_msg = 'Closed FD %d' % fd
+                if type(call_param.match_param) is str:
                     exit_info.call_params = call_param
-                    break 
+                    break
+        return ida_msg
 
-        elif callname == 'dup':        
-            exit_info.old_fd = frame['param1']
-        elif callname == 'dup2':        
-            exit_info.old_fd = frame['param1']
-            exit_info.new_fd = frame['param2']
-        elif callname == 'clone':        
+    def parseMkdirCall(self, callname, syscall_info, frame, exit_info, pid):
+        cpu = exit_info.cpu
+        exit_info.fname, exit_info.fname_addr, exit_info.flags, exit_info.mode, ida_msg = self.parseOpen(frame, callname)
+        if exit_info.fname is None:
+            ''' filename not yet present in ram, do the two step '''
+            ''' TBD think we are triggering off kernel's own read of the fname, then again someitme it seems corrupted...'''
+            ''' Do not use context manager on superstition that filename could be read in some other task context.'''
+            self.lgr.debug('syscallParse, mkdir pid %d filename not yet here... set break at 0x%x ' % (pid, exit_info.fname_addr))
+            self.finish_break[pid] = SIM_breakpoint(cpu.current_context, Sim_Break_Linear, Sim_Access_Read, exit_info.fname_addr, 1, 0)
+            self.finish_hap[pid] = SIM_hap_add_callback_index("Core_Breakpoint_Memop", self.finishParseOpen, exit_info, self.finish_break[pid])
+        return ida_msg
 
-            flags = frame['param1']
-            child_stack = frame['param2']
-            ida_msg = '%s pid:%d flags:0x%x child_stack: 0x%x ptid: 0x%x ctid: 0x%x iregs: 0x%x' % (callname, pid, flags, 
-                child_stack, frame['param3'], frame['param4'], frame['param5'])
-              
-            self.context_manager.setIdaMessage(ida_msg)
-            for call_param in syscall_info.call_params:
+    def parseExecveCall(self, callname, syscall_info, frame, exit_info, pid):
+        retval = self.parseExecve(syscall_info)
+        return None
+
+    def parseCloseCall(self, callname, syscall_info, frame, exit_info, pid):
+        ida_msg = None
+        fd = frame['param1']
+        if self.traceProcs is not None:
+            #self.lgr.debug('syscallparse for close pid %d' % pid)
+            self.traceProcs.close(pid, fd)
+        exit_info.old_fd = fd
+        exit_info.call_params = self.sockwatch.getParam(pid, fd)
+        self.sockwatch.close(pid, fd)
+
+        for call_param in syscall_info.call_params:
+            if call_param.match_param == frame['param1']:
+                self.lgr.debug('closed fd %d, stop trace' % fd)
+                self.stopTrace()
+                ida_msg = 'Closed FD %d' % fd
                 exit_info.call_params = call_param
-                break
-            #self.traceProcs.close(pid, fd)
-        elif callname == 'pipe' or callname == 'pipe2':        
-            exit_info.retval_addr = frame['param1']
-            
+                break 
+        return ida_msg
 
-        elif callname == 'ipc':        
-            call = frame['param1']
-            callname = ipc.call[call]
-            exit_info.socket_callname = callname
-            if call == ipc.MSGGET or call == ipc.SHMGET:
-                key = frame['param2']
-                exit_info.fname = key
-                ida_msg = 'ipc %s pid:%d key: 0x%x size: %d  flags: 0x%x\n %s' % (callname, pid, key, frame['param3'], frame['param4'],
-                       taskUtils.stringFromFrame(frame)) 
-            elif call == ipc.MSGSND or call == ipc.MSGRCV:
-                ida_msg = 'ipc %s pid:%d quid: 0x%x size: %d addr: 0x%x' % (callname, pid, frame['param4'], frame['param3'], frame['param5'])
-            else:
-                ida_msg = 'ipc %s pid:%d %s' % (callname, pid, taskUtils.stringFromFrame(frame) )
+    def parseDupCall(self, callname, syscall_info, frame, exit_info, pid):
+        exit_info.old_fd = frame['param1']
+        return None
+
+    def parseDup2Call(self, callname, syscall_info, frame, exit_info, pid):
+        exit_info.old_fd = frame['param1']
+        exit_info.new_fd = frame['param2']
+        return None
+
+    def parseCloneCall(self, callname, syscall_info, frame, exit_info, pid):
+        flags = frame['param1']
+        child_stack = frame['param2']
+        ida_msg = '%s pid:%d flags:0x%x child_stack: 0x%x ptid: 0x%x ctid: 0x%x iregs: 0x%x' % (callname, pid, flags, 
+            child_stack, frame['param3'], frame['param4'], frame['param5'])
+        exit_info.flags = flags
+          
+        self.context_manager.setIdaMessage(ida_msg)
+        for call_param in syscall_info.call_params:
+            exit_info.call_params = call_param
+            break
+        #self.traceProcs.close(pid, fd)
+        return ida_msg
 
-        elif callname == 'ioctl':        
-            fd = frame['param1']
-            cmd = frame['param2']
-            param = frame['param3']
-            exit_info.cmd = cmd
-            exit_info.old_fd = fd
-            if cmd == net.FIONBIO:
-                value = self.mem_utils.readWord32(cpu, param)
-                ida_msg = 'ioctl pid:%d FD: %d FIONBIO: %d' % (pid, fd, value) 
-            elif cmd == net.FIONREAD:
-                ida_msg = 'ioctl pid:%d FD: %d FIONREAD ptr: 0x%x' % (pid, fd, param) 
-                exit_info.retval_addr = param
-            else:
-                ida_msg = 'ioctl pid:%d FD: %d cmd: 0x%x' % (pid, fd, cmd) 
-            for call_param in syscall_info.call_params:
-                if call_param.match_param == fd:
-                    exit_info.call_params = call_param
-                    break
+    def parsePipeCall(self, callname, syscall_info, frame, exit_info, pid):
+        exit_info.retval_addr = frame['param1']
+        return None
+
+    def parseIpcCall(self, callname, syscall_info, frame, exit_info, pid):
+        call = frame['param1']
+        callname = ipc.call[call]
+        exit_info.socket_callname = callname
+        if call == ipc.MSGGET or call == ipc.SHMGET:
+            key = frame['param2']
+            exit_info.fname = key
+            ida_msg = 'ipc %s pid:%d key: 0x%x size: %d  flags: 0x%x\n %s' % (callname, pid, key, frame['param3'], frame['param4'],
+                   taskUtils.stringFromFrame(frame)) 
+        elif call == ipc.MSGSND or call == ipc.MSGRCV:
+            ida_msg = 'ipc %s pid:%d quid: 0x%x size: %d addr: 0x%x' % (callname, pid, frame['param4'], frame['param3'], frame['param5'])
+        else:
+            ida_msg = 'ipc %s pid:%d %s' % (callname, pid, taskUtils.stringFromFrame(frame) )
+        return ida_msg
+
+    def parseIoctlCall(self, callname, syscall_info, frame, exit_info, pid):
+        fd = frame['param1']
+        cmd = frame['param2']
+        param = frame['param3']
+        exit_info.cmd = cmd
+        exit_info.old_fd = fd
+        if cmd == net.FIONBIO:
+            value = self.mem_utils.readWord32(exit_info.cpu, param)
+            ida_msg = 'ioctl pid:%d FD: %d FIONBIO: %d' % (pid, fd, value) 
+        elif cmd == net.FIONREAD:
+            ida_msg = 'ioctl pid:%d FD: %d FIONREAD ptr: 0x%x' % (pid, fd, param) 
+            exit_info.retval_addr = param
+        else:
+            ida_msg = 'ioctl pid:%d FD: %d cmd: 0x%x' % (pid, fd, cmd) 
+        for call_param in syscall_info.call_params:
+            if call_param.match_param == fd:
+                exit_info.call_params = call_param
+                break
+        return ida_msg
 
-        elif callname == 'gettimeofday':        
-            timeval_ptr = frame['param1']
-            ida_msg = 'gettimeofday pid:%d timeval_ptr: 0x%x' % (pid, timeval_ptr)
-            exit_info.retval_addr = timeval_ptr
+    def parseGettimeofdayCall(self, callname, syscall_info, frame, exit_info, pid):
+        timeval_ptr = frame['param1']
+        ida_msg = 'gettimeofday pid:%d timeval_ptr: 0x%x' % (pid, timeval_ptr)
+        exit_info.retval_addr = timeval_ptr
+        return ida_msg
  
-        elif callname == 'nanosleep':        
-            time_spec = frame['param1']
-            seconds = self.mem_utils.readWord32(cpu, time_spec)
-            nano = self.mem_utils.readWord32(cpu, time_spec+self.mem_utils.WORD_SIZE)
-            ida_msg = 'nanosleep pid:%d time_spec: 0x%x seconds: %d nano: %d' % (pid, time_spec, seconds, nano)
-            #SIM_break_simulation(ida_msg)
-
-        elif callname == 'fcntl64':        
+    def parseNanosleepCall(self, callname, syscall_info, frame, exit_info, pid):
+        cpu = exit_info.cpu
+        time_spec = frame['param1']
+        seconds = self.mem_utils.readWord32(cpu, time_spec)
+        nano = self.mem_utils.readWord32(cpu, time_spec+self.mem_utils.WORD_SIZE)
+        ida_msg = 'nanosleep pid:%d time_spec: 0x%x seconds: %d nano: %d' % (pid, time_spec, seconds, nano)
+        #SIM_break_simulation(ida_msg)
+        return ida_msg
+
+    def parseFcntl64Call(self, callname, syscall_info, frame, exit_info, pid):
+        fd = frame['param1']
+        cmd = frame['param2']
+        arg = frame['param3']
+        ida_msg = 'fcntl64 pid:%d FD: %d command: %d arg: %d\n\t%s' % (pid, fd, cmd, arg, taskUtils.stringFromFrame(frame)) 
+        exit_info.old_fd = fd
+        exit_info.cmd = cmd
+        exit_info.flags = arg
+        
+        for call_param in syscall_info.call_params:
+            if call_param.match_param == fd:
+                exit_info.call_params = call_param
+                break
+        return ida_msg
+
+    def parseLlseekCall(self, callname, syscall_info, frame, exit_info, pid):
+        if self.mem_utils.WORD_SIZE == 4:
             fd = frame['param1']
-            cmd = frame['param2']
-            arg = frame['param3']
-            ida_msg = 'fcntl64 pid:%d FD: %d command: %d arg: %d\n\t%s' % (pid, fd, cmd, arg, taskUtils.stringFromFrame(frame)) 
-            exit_info.old_fd = fd
-            exit_info.cmd = cmd
-            
-            for call_param in syscall_info.call_params:
-                if call_param.match_param == fd:
-                    exit_info.call_params = call_param
-                    break
+            high = frame['param2']
+            low = frame['param3']
+            result =  frame['param4']
+            whence = frame['param5']
+            ida_msg = '_llseek pid:%d FD: %d high: 0x%x low: 0x%x result: 0x%x whence: 0x%x \n%s' % (pid, fd, high, low, 
+                    result, whence, taskUtils.stringFromFrame(frame))
+            exit_info.retval_addr = result
+        else:
+            fd = frame['param1']
+            offset = frame['param2']
+            origin = frame['param3']
+            ida_msg = 'lseek pid:%d FD: %d offset: 0x%x origin: 0x%x' % (pid, fd, offset, origin)
 
-        elif callname == '_llseek':        
-            if self.mem_utils.WORD_SIZE == 4:
-                fd = frame['param1']
-                high = frame['param2']
-                low = frame['param3']
-                result =  frame['param4']
-                whence = frame['param5']
-                ida_msg = '_llseek pid:%d FD: %d high: 0x%x low: 0x%x result: 0x%x whence: 0x%x \n%s' % (pid, fd, high, low, 
-                        result, whence, taskUtils.stringFromFrame(frame))
-                exit_info.retval_addr = result
-            else:
-                fd = frame['param1']
-                offset = frame['param2']
-                origin = frame['param3']
-                ida_msg = 'lseek pid:%d FD: %d offset: 0x%x origin: 0x%x' % (pid, fd, offset, origin)
+        exit_info.old_fd = fd
+        for call_param in syscall_info.call_params:
+            if call_param.match_param == frame['param1']:
+                exit_info.call_params = call_param
+                break
+        return ida_msg
 
-            exit_info.old_fd = fd
-            for call_param in syscall_info.call_params:
+    def parseReadCall(self, callname, syscall_info, frame, exit_info, pid):
+        exit_info.old_fd = frame['param1']
+        ida_msg = 'read pid:%d FD: %d buf: 0x%x count: %d' % (pid, frame['param1'], frame['param2'], frame['param3'])
+        exit_info.retval_addr = frame['param2']
+        ''' check runToIO '''
+        for call_param in syscall_info.call_params:
+            ''' look for matching FD '''
+            if type(call_param.match_param) is int:
                 if call_param.match_param == frame['param1']:
                     exit_info.call_params = call_param
                     break
+            elif call_param.match_param.__class__.__name__ == 'Diddler':
+                exit_info.call_params = call_param
+                break
+        return ida_msg
 
-        elif callname == 'read':        
-            exit_info.old_fd = frame['param1']
-            ida_msg = 'read pid:%d FD: %d buf: 0x%x count: %d' % (pid, frame['param1'], frame['param2'], frame['param3'])
-            exit_info.retval_addr = frame['param2']
-            ''' check runToIO '''
-            for call_param in syscall_info.call_params:
-                ''' look for matching FD '''
-                if type(call_param.match_param) is int:
-                    if call_param.match_param == frame['param1']:
-                        exit_info.call_params = call_param
-                        break
-                elif call_param.match_param.__class__.__name__ == 'Diddler':
-                    exit_info.call_params = call_param
-                    break
-
-        elif callname == 'write':        
-            exit_info.old_fd = frame['param1']
-            count = frame['param3']
-            ida_msg = 'write pid:%d FD: %d buf: 0x%x count: %d' % (pid, frame['param1'], frame['param2'], count)
-            exit_info.retval_addr = frame['param2']
-            ''' check runToIO '''
-            for call_param in syscall_info.call_params:
-                if type(call_param.match_param) is int and call_param.match_param == frame['param1']:
-                    self.lgr.debug('call param found %d, matches %d' % (call_param.match_param, frame['param1']))
-                    exit_info.call_params = call_param
-                    break
-                elif type(call_param.match_param) is str:
-                    exit_info.call_params = call_param
-                    break
-                elif call_param.match_param.__class__.__name__ == 'Diddler':
-                    if count < 4028:
-                        self.lgr.debug('syscall write check diddler count %d' % count)
-                        if call_param.match_param.checkString(self.cpu, frame['param2'], count):
-                            self.lgr.debug('syscall write found final diddler')
-                            self.stopTrace()
-                            if SIM_simics_is_running():
-                                SIM_break_simulation('diddle done on cell %s file: %s' % (self.cell_name, call_param.match_param.getPath()))
-                else:
-                    self.lgr.debug('syscall write call_param match_param is type %s' % (call_param.match_param.__class__.__name__))
- 
-        elif callname == 'mmap' or callname == 'mmap2':        
-            exit_info.count = frame['param2']
-            if self.mem_utils.WORD_SIZE == 4: 
-                ida_msg = '%s pid:%d FD: %d buf: 0x%x len: %d' % (callname, pid, frame['param3'], frame['param1'], frame['param2'])
+    def parseWriteCall(self, callname, syscall_info, frame, exit_info, pid):
+        exit_info.old_fd = frame['param1']
+        count = frame['param3']
+        ida_msg = 'write pid:%d FD: %d buf: 0x%x count: %d' % (pid, frame['param1'], frame['param2'], count)
+        exit_info.retval_addr = frame['param2']
+        ''' check runToIO '''
+        for call_param in syscall_info.call_params:
+            if type(call_param.match_param) is int and call_param.match_param == frame['param1']:
+                self.lgr.debug('call param found %d, matches %d' % (call_param.match_param, frame['param1']))
+                exit_info.call_params = call_param
+                break
+            elif type(call_param.match_param) is str:
+                exit_info.call_params = call_param
+                break
+            elif call_param.match_param.__class__.__name__ == 'Diddler':
+                if count < 4028:
+                    self.lgr.debug('syscall write check diddler count %d' % count)
+                    if call_param.match_param.checkString(self.cpu, frame['param2'], count):
+                        self.lgr.debug('syscall write found final diddler')
+                        self.stopTrace()
+                        if SIM_simics_is_running():
+                            SIM_break_simulation('diddle done on cell %s file: %s' % (self.cell_name, call_param.match_param.getPath()))
             else:
-                ida_msg = '%s pid:%d FD: %d buf: 0x%x len: %d prot: 0x%x  flags: 0x%x offset: 0x%x' % (callname, pid, 
-                   frame['param5'], frame['param1'], frame['param2'], frame['param3'], frame['param4'], frame['param6'])
-                self.lgr.debug(taskUtils.stringFromFrame(frame))
-
-        elif callname == 'select' or callname == '_newselect':        
-            exit_info.select_info = SelectInfo(frame['param1'], frame['param2'], frame['param3'], frame['param4'], frame['param5'])
-
-            ida_msg = '%s %s\n' % (callname, exit_info.select_info.getString(self.mem_utils, cpu))
-            
+                self.lgr.debug('syscall write call_param match_param is type %s' % (call_param.match_param.__class__.__name__))
+        return ida_msg
+ 
+    def parseMmapCall(self, callname, syscall_info, frame, exit_info, pid):
+        exit_info.count = frame['param2']
+        if self.mem_utils.WORD_SIZE == 4: 
+            ida_msg = '%s pid:%d FD: %d buf: 0x%x len: %d' % (callname, pid, frame['param3'], frame['param1'], frame['param2'])
+        else:
+            ida_msg = '%s pid:%d FD: %d buf: 0x%x len: %d prot: 0x%x  flags: 0x%x offset: 0x%x' % (callname, pid, 
+               frame['param5'], frame['param1'], frame['param2'], frame['param3'], frame['param4'], frame['param6'])
+            self.lgr.debug(taskUtils.stringFromFrame(frame))
+        return ida_msg
 
-        elif callname == 'socketcall' or callname.upper() in net.callname:
-            ida_msg = self.socketParse(callname, syscall_info, frame, exit_info, pid)
+    def parseSelectCall(self, callname, syscall_info, frame, exit_info, pid):
+        exit_info.select_info = SelectInfo(frame['param1'], frame['param2'], frame['param3'], frame['param4'], frame['param5'])
+        ida_msg = '%s %s\n' % (callname, exit_info.select_info.getString(self.mem_utils, exit_info.cpu))
+        return ida_msg
 
-        else:
-            ida_msg = '%s %s   pid:%d' % (callname, taskUtils.stringFromFrame(frame), pid)
-            self.context_manager.setIdaMessage(ida_msg)
-        if ida_msg is not None:
-            self.lgr.debug(ida_msg.strip()) 
-            ''' trace syscall exit unless call_params narrowed a search failed to find a match '''
-            if ida_msg is not None and self.traceMgr is not None and (len(syscall_info.call_params) == 0 or exit_info.call_params is not None):
-                if len(ida_msg.strip()) > 0:
-                    self.traceMgr.write(ida_msg+'\n')
-        return exit_info
+    def parseOtherCall(self, callname, syscall_info, frame, exit_info, pid):
+        ida_msg = '%s %s   pid:%d' % (callname, taskUtils.stringFromFrame(frame), pid)
+        self.context_manager.setIdaMessage(ida_msg)
+        return ida_msg
 
 
     def stopHap(self, stop_action, one, exception, error_string):
@@ -1071,10 +1173,10 @@ class Syscall():
         #if callnum == 0:
             self.lgr.debug('syscallHap callnum is zero')
             return
+        if callnum == self.task_utils.syscallNumber('execve') or callnum == self.task_utils.syscallNumber('prctl'):
+            ''' comm may change before we see the return '''
+            self.task_utils.commChanging()
         #self.lgr.debug('syscallhap cell %s for pid %s at 0x%x callnum %d expected %s' % (self.cell_name, pid, break_eip, callnum, str(syscall_info.callnum)))
-        stack_frame = self.task_utils.frameFromRegs(cpu)
-        frame_string = taskUtils.stringFromFrame(stack_frame)
-        #self.lgr.debug(frame_string)
             
         if comm == 'swapper/0' and pid == 1:
             self.lgr.debug('syscallHap, skipping call from init/swapper')
@@ -1110,7 +1212,6 @@ class Syscall():
             ''' caller frame will be in regs'''
             ''' NOTE eip is unknown '''
             stack_frame = self.task_utils.frameFromRegs(cpu)
-            frame_string = taskUtils.stringFromFrame(stack_frame)
             exit_eip1 = self.param.sysexit
             ''' catch interrupt returns such as wait4 '''
             exit_eip2 = self.param.iretd
@@ -1127,14 +1228,12 @@ class Syscall():
             esp = self.cpu.iface.int_register.read(reg_num)
             stack_frame['eip'] = self.mem_utils.readPtr(cpu, esp)
             stack_frame['esp'] = self.mem_utils.readPtr(cpu, esp+12)
-            frame_string = taskUtils.stringFromFrame(stack_frame)
             #self.lgr.debug('sys_entry frame %s' % frame_string)
             exit_eip1 = self.param.iretd
         elif break_eip == self.param.arm_entry:
             #self.lgr.debug('sys_entry frame %s' % frame_string)
             exit_eip1 = self.param.arm_ret
             stack_frame = self.task_utils.frameFromRegs(cpu)
-            frame_string = taskUtils.stringFromFrame(stack_frame)
             #SIM_break_simulation(frame_string)
         elif break_eip == syscall_info.calculated:
             ''' Note EIP in stack frame is unknown '''
@@ -1154,8 +1253,7 @@ class Syscall():
                 exit_eip1 = self.param.sysexit
                 exit_eip2 = self.param.iretd
             #self.lgr.debug('syscallHap calculated')
-            #frame_string = taskUtils.stringFromFrame(stack_frame)
-            self.lgr.debug('frame string %s' % frame_string)
+            self.lgr.debug('frame string %s', resim_utils.Lazy(taskUtils.stringFromFrame, stack_frame))
             
         else:
             value = memory.logical_address
@@ -1201,12 +1299,13 @@ class Syscall():
                         return
                 else:
                     self.lgr.error('syscallHap pid %d call %d,  still has exit break???' % (pid, callnum))
-                    self.lgr.debug('syscallHap frame: %s' % frame_string)
+                    self.lgr.debug('syscallHap frame: %s', resim_utils.Lazy(taskUtils.stringFromFrame, stack_frame))
                     SIM_break_simulation('syscallHap pid %d call %d,  still has exit break???' % (pid, callnum))
                     return
 
         if callnum == self.task_utils.syscallNumber('exit_group') or callnum == self.task_utils.syscallNumber('exit'):
             self.lgr.debug('syscallHap exit of pid:%d' % pid)
+            self.task_utils.taskExit()
             if self.traceProcs is not None:
                 self.traceProcs.exit(pid)
             callname = self.task_utils.syscallName(callnum) 
@@ -1234,8 +1333,6 @@ class Syscall():
         ''' Set exit breaks '''
         #self.lgr.debug('syscallHap in proc %d (%s), callnum: 0x%x  EIP: 0x%x' % (pid, comm, callnum, break_eip))
         #self.lgr.debug('syscallHap frame: %s' % frame_string)
-        frame_string = taskUtils.stringFromFrame(stack_frame)
-        #self.lgr.debug('syscallHap frame: %s' % frame_string)
         if syscall_info.callnum is not None:
             #self.lgr.debug('syscallHap cell %s callnum %d syscall_info.callnum %d stop_on_call %r' % (self.cell_name, 
             #     callnum, syscall_info.callnum, self.stop_on_call))
@@ -1266,7 +1363,7 @@ class Syscall():
                     self.lgr.debug('syscallHap skipping %s, no exit' % comm)
                 
             else:
-                self.lgr.debug('syscallHap looked for call %d, got %d, calculated 0x%x do nothing' % (syscall_info.callnum, callnum, syscall_info.calculated))
+                self.lgr.debug('syscallHap looked for call %d, got %d, calculated 0x%x do nothing', syscall_info.callnum, callnum, syscall_info.calculated)
                 pass
         else:
             ''' tracing all syscalls, or watching for any syscall, e.g., during debug '''
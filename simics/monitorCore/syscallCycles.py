@@ -0,0 +1,75 @@
+import bisect
+'''
+Per-pid index of the cycles at which a process entered and left the kernel,
+recorded while running forward.  Reverse operations bisect into it to find the
+previous system call, or the return from the current one, and skip directly
+to that cycle rather than stepping or reversing to breakpoints.
+'''
+class SyscallCycles():
+    def __init__(self, lgr):
+        self.lgr = lgr
+        ''' pid -> sorted list of cycles '''
+        self.entries = {}
+        self.exits = {}
+
+    def addCycle(self, cycle_dict, pid, cycle):
+        if pid not in cycle_dict:
+            cycle_dict[pid] = []
+        cycles = cycle_dict[pid]
+        if len(cycles) == 0 or cycle > cycles[-1]:
+            cycles.append(cycle)
+        else:
+            ''' running forward again after a reverse, only add cycles not yet seen '''
+            index = bisect.bisect_left(cycles, cycle)
+            if index == len(cycles) or cycles[index] != cycle:
+                cycles.insert(index, cycle)
+
+    def addEntry(self, pid, cycle):
+        self.addCycle(self.entries, pid, cycle)
+
+    def addExit(self, pid, cycle):
+        self.addCycle(self.exits, pid, cycle)
+
+    def hasEntries(self, pid):
+        return pid in self.entries and len(self.entries[pid]) > 0
+
+    def getEntries(self, pid):
+        if pid in self.entries:
+            return self.entries[pid]
+        return []
+
+    def prevEntry(self, pid, cycle):
+        ''' latest kernel entry at or before the given cycle, or None '''
+        cycles = self.getEntries(pid)
+        index = bisect.bisect_right(cycles, cycle)
+        if index == 0:
+            return None
+        return cycles[index-1]
+
+    def nextEntry(self, pid, cycle):
+        ''' first kernel entry after the given cycle, or None '''
+        cycles = self.getEntries(pid)
+        index = bisect.bisect_right(cycles, cycle)
+        if index == len(cycles):
+            return None
+        return cycles[index]
+
+    def nextExit(self, pid, cycle):
+        ''' Return the cycle at which the system call in progress at the given cycle returns,
+            or None if it was not recorded, i.e., if a later entry is seen first. '''
+        if pid not in self.exits:
+            return None
+        cycles = self.exits[pid]
+        index = bisect.bisect_right(cycles, cycle)
+        if index == len(cycles):
+            return None
+        exit_cycle = cycles[index]
+        next_entry = self.nextEntry(pid, cycle)
+        if next_entry is not None and next_entry < exit_cycle:
+            self.lgr.debug('SyscallCycles nextExit pid:%d entry 0x%x precedes exit 0x%x, not recorded' % (pid, next_entry, exit_cycle))
+            return None
+        return exit_cycle
+
+    def clear(self):
+        self.entries = {}
+        self.exits = {}
@@ -1,41 +1,254 @@
+#!/usr/bin/env python
+'''
+Syscall number <-> name tables.  The kernel unistd header is parsed once and
+compiled into a table stored next to the kernel params, e.g., mytarget.param has
+mytarget.syscalls, which is then loaded with a single read when a monitor starts.
+A table holds one mapping per ABI: native, and optionally compat, i.e., the 32-bit
+calls of a 64-bit kernel.  The table file is:
+
+    header: magic, table version  (<5sI)
+    pickled dict of abi -> (unistd header path, sha1 of the header, [(name, callnum), ...])
+
+Names and numbers are kept in header order so aliases resolve as they would from
+the header.  When the header is present, the table is cross-checked against it:
+a header whose digest changed is reparsed, and if its calls differ from the table,
+the table is stale and is recompiled from the header.
+
+Usage:
+    syscallNumbers.py compile <unistd> <table> [--compat unistd_32]
+    syscallNumbers.py validate <table> [--unistd unistd] [--compat unistd_32]
+'''
 import os
-class SyscallNumbers():
-    def __init__(self, fpath, lgr):
-        self.syscalls = {}
-        self.callnums = {}
-        hackvals = {}
-        if not os.path.isfile:
-            print('Could not find unistd file at %s' % fpath)
-            return
-        with open(fpath) as fh:
-            for line in fh:
-                if '__NR_' in line:
-                    parts = line.split()
-                    if parts[0] != '#define':
-                        continue
-                    if '__NR_syscall_max' in line:
-                        continue
-                    nr = parts[1][5:]
+import sys
+import struct
+import pickle
+import hashlib
+import argparse
+TABLE_MAGIC = 'RSYSC'
+TABLE_VERSION = 1
+TABLE_HEADER = struct.Struct('<5sI')
+TABLE_SUFFIX = '.syscalls'
+NATIVE = 'native'
+COMPAT = 'compat'
+
+def parseHeader(fpath, lgr=None):
+    ''' list of (name, callnum) in header order, or None if the header cannot be read '''
+    if fpath is None or not os.path.isfile(fpath):
+        return None
+    retval = []
+    hackvals = {}
+    with open(fpath) as fh:
+        for line in fh:
+            if '__NR_' in line:
+                parts = line.split()
+                if parts[0] != '#define':
+                    continue
+                if '__NR_syscall_max' in line:
+                    continue
+                nr = parts[1][5:]
+                try:
+                    callnum = int(parts[2])
+                    hackvals[parts[1]] = callnum
+                except:
+                    #print('failed to handle %s' % line)
+                    #s = parts[2]
+                    express = line[line.find("(")+1:line.find(")")]
                     try:
-                        callnum = int(parts[2])
-                        hackvals[parts[1]] = callnum
+                        sym, offset = express.split('+')
                     except:
-                        #print('failed to handle %s' % line)
-                        #s = parts[2]
-                        express = line[line.find("(")+1:line.find(")")]
-                        try:
-                            sym, offset = express.split('+')
-                        except:
+                        if lgr is not None:
                             lgr.debug('No + in %s from \n%s' % (express, line))
-                            continue
-                        base = hackvals[sym]
-                        try:
-                            callnum = base + int(offset)
-                        except:
+                        continue
+                    base = hackvals[sym]
+                    try:
+                        callnum = base + int(offset)
+                    except:
+                        if lgr is not None:
                             lgr.debug('expected base10 int in %s' % line)
-                            continue
-                    #lgr.debug('assign call # %d to %s' % (callnum, nr))
-                    self.syscalls[callnum] = nr
-                    self.callnums[nr] = callnum
-                     
+                        continue
+                #lgr.debug('assign call # %d to %s' % (callnum, nr))
+                retval.append((nr, callnum))
+    return retval
+
+def headerDigest(fpath):
+    with open(fpath, 'rb') as fh:
+        return hashlib.sha1(fh.read()).hexdigest()
+
+def tablePath(param_file):
+    ''' the compiled table kept next to the given kernel param file '''
+    return os.path.splitext(param_file)[0] + TABLE_SUFFIX
+
+def compileHeaders(headers, lgr=None):
+    ''' Return a table of abi -> (header, digest, calls) for the given abi -> header path.
+        ABIs whose header cannot be read are left out. '''
+    retval = {}
+    for abi in headers:
+        calls = parseHeader(headers[abi], lgr)
+        if calls is None:
+            continue
+        retval[abi] = (headers[abi], headerDigest(headers[abi]), calls)
+    return retval
+
+def writeTable(path, table):
+    with open(path, 'wb') as fh:
+        fh.write(TABLE_HEADER.pack(TABLE_MAGIC, TABLE_VERSION) + pickle.dumps(table, pickle.HIGHEST_PROTOCOL))
+
+def loadTable(path):
+    ''' the table compiled to path, or None if it is missing or of another version '''
+    if not os.path.isfile(path):
+        return None
+    with open(path, 'rb') as fh:
+        data = fh.read()
+    if len(data) < TABLE_HEADER.size:
+        return None
+    magic, version = TABLE_HEADER.unpack_from(data)
+    if magic != TABLE_MAGIC or version != TABLE_VERSION:
+        return None
+    return pickle.loads(data[TABLE_HEADER.size:])
+
+def validateTable(table, headers=None, lgr=None):
+    ''' Cross-check the table against the unistd headers, by default those it was compiled from.
+        Returns a list of differences, empty if the table is current.  Headers that cannot
+        be found are not checked. '''
+    retval = []
+    if headers is None:
+        headers = {}
+        for abi in table:
+            headers[abi] = table[abi][0]
+    for abi in headers:
+        header = headers[abi]
+        if header is None or not os.path.isfile(header):
+            continue
+        if abi not in table:
+            retval.append('%s: no %s calls in the table' % (header, abi))
+            continue
+        if headerDigest(header) == table[abi][1]:
+            continue
+        calls = parseHeader(header, lgr)
+        if calls == table[abi][2]:
+            continue
+        compiled = dict(table[abi][2])
+        current = dict(calls)
+        for name in sorted(set(compiled) | set(current)):
+            if name not in current:
+                retval.append('%s: %s %s is in the table but not the header' % (header, abi, name))
+            elif name not in compiled:
+                retval.append('%s: %s %s is in the header but not the table' % (header, abi, name))
+            elif compiled[name] != current[name]:
+                retval.append('%s: %s %s is %d in the table and %d in the header' % (header, abi, name, compiled[name], current[name]))
+        if len(retval) == 0:
+            retval.append('%s: %s calls are out of order' % (header, abi))
+    return retval
+
+def refreshDigests(table, headers):
+    ''' After validateTable found no differences, record the current digest of each header so that
+        later loads need not parse it.  Returns True if the table was changed. '''
+    retval = False
+    for abi in headers:
+        header = headers[abi]
+        if header is None or abi not in table or not os.path.isfile(header):
+            continue
+        digest = headerDigest(header)
+        if digest != table[abi][1] or header != table[abi][0]:
+            table[abi] = (header, digest, table[abi][2])
+            retval = True
+    return retval
+
+class SyscallNumbers():
+    def __init__(self, fpath, lgr, table_file=None, compat=None):
+        ''' fpath is the unistd header of the kernel and compat that of its 32-bit calls, if any.
+            If table_file is given, the table compiled there is used unless stale, and it is
+            compiled from the headers if missing or stale. '''
+        self.syscalls = {}
+        self.callnums = {}
+        self.compat_syscalls = {}
+        self.compat_callnums = {}
+        headers = {NATIVE:fpath}
+        if compat is not None:
+            headers[COMPAT] = compat
+        table = None
+        if table_file is not None:
+            table = loadTable(table_file)
+            if table is not None:
+                problems = validateTable(table, headers, lgr)
+                if len(problems) > 0:
+                    for problem in problems:
+                        lgr.debug('SyscallNumbers stale table %s %s' % (table_file, problem))
+                    print('Syscall table %s does not match %s, recompiling it' % (table_file, fpath))
+                    table = None
+                elif refreshDigests(table, headers):
+                    ''' header changed without changing its calls, e.g., a comment '''
+                    try:
+                        writeTable(table_file, table)
+                        lgr.debug('SyscallNumbers updated header digests in %s' % table_file)
+                    except IOError as e:
+                        lgr.debug('SyscallNumbers could not write %s: %s' % (table_file, str(e)))
+        if table is None:
+            table = compileHeaders(headers, lgr)
+            if NATIVE not in table:
+                print('Could not find unistd file at %s' % fpath)
+                return
+            if table_file is not None:
+                try:
+                    writeTable(table_file, table)
+                    lgr.debug('SyscallNumbers compiled %s to %s' % (fpath, table_file))
+                except IOError as e:
+                    lgr.debug('SyscallNumbers could not write %s: %s' % (table_file, str(e)))
+        if NATIVE in table:
+            self.syscalls, self.callnums = self.mapCalls(table[NATIVE][2])
+        if COMPAT in table:
+            self.compat_syscalls, self.compat_callnums = self.mapCalls(table[COMPAT][2])
+
+    def mapCalls(self, calls):
+        syscalls = {}
+        callnums = {}
+        for nr, callnum in calls:
+            syscalls[callnum] = nr
+            callnums[nr] = callnum
+        return syscalls, callnums
+
+def main():
+    parser = argparse.ArgumentParser(description='Compile or validate a RESim syscall number table')
+    sub = parser.add_subparsers(dest='command')
+    comp = sub.add_parser('compile', help='compile unistd headers into a table')
+    comp.add_argument('unistd', help='unistd header of the kernel')
+    comp.add_argument('table', help='table file to write, e.g., mytarget.syscalls')
+    comp.add_argument('--compat', help='unistd header of 32-bit calls on a 64-bit kernel')
+    val = sub.add_parser('validate', help='cross-check a table against unistd headers')
+    val.add_argument('table', help='table file')
+    val.add_argument('--unistd', help='unistd header, default is the one the table was compiled from')
+    val.add_argument('--compat', help='compat unistd header, default is the one the table was compiled from')
+    args = parser.parse_args()
+    if args.command == 'compile':
+        headers = {NATIVE:args.unistd}
+        if args.compat is not None:
+            headers[COMPAT] = args.compat
+        table = compileHeaders(headers)
+        for abi in headers:
+            if abi not in table:
+                print('Could not read %s' % headers[abi])
+                sys.exit(1)
+        writeTable(args.table, table)
+        for abi in sorted(table):
+            print('%s: %d calls from %s' % (abi, len(table[abi][2]), table[abi][0]))
+    else:
+        table = loadTable(args.table)
+        if table is None:
+            print('%s is not a version %d syscall table' % (args.table, TABLE_VERSION))
+            sys.exit(1)
+        headers = {}
+        for abi in table:
+            headers[abi] = table[abi][0]
+        if args.unistd is not None:
+            headers[NATIVE] = args.unistd
+        if args.compat is not None:
+            headers[COMPAT] = args.compat
+        problems = validateTable(table, headers)
+        for problem in problems:
+            print(problem)
+        if len(problems) > 0:
+            sys.exit(1)
+        print('%s is current' % args.table)
 
+if __name__ == '__main__':
+    main()
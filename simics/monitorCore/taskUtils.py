@@ -1,9 +1,38 @@
 from simics import *
 import os
 import pickle
+import struct
 import osUtils
+import snapState
 import syscallNumbers
 LIST_POISON2 = object()
+''' schema version of the state saved with snapshots '''
+STATE_VERSION = 1
+''' upper bound on the size of sys_call_table when the call numbers are not known '''
+MAX_SYSCALLS = 1024
+def readSyscallTable(cpu, param, mem_utils, count=MAX_SYSCALLS):
+    ''' Return a dict of call number -> handler address read from sys_call_table in one pass.
+        The table address comes from the jump constant found by getKernelParams, which is added
+        to the scaled call number on ARM and subtracted from it on x86-32 and IA32E.  Reading stops
+        at the first word that does not point into the kernel, i.e., the end of the table. '''
+    if param.syscall_jump is None:
+        return None
+    if cpu.architecture == 'arm':
+        table = mem_utils.getUnsigned(param.syscall_jump)
+    else:
+        table = mem_utils.getUnsigned(-param.syscall_jump)
+    data = mem_utils.readBytes(cpu, table, count * mem_utils.WORD_SIZE)
+    if mem_utils.WORD_SIZE == 8:
+        fmt = '<%dQ'
+    else:
+        fmt = '<%dI'
+    words = struct.unpack(fmt % (len(data) / mem_utils.WORD_SIZE), str(data[:len(data) - len(data) % mem_utils.WORD_SIZE]))
+    retval = {}
+    for callnum in range(len(words)):
+        if words[callnum] < param.kernel_base:
+            break
+        retval[callnum] = words[callnum]
+    return retval
 def stringFromFrame(frame):
     if frame is not None:
         return 'param1:0x%x param2:0x%x param3:0x%x param4:0x%x param5:0x%x param6:0x%x ' % (frame['param1'], 
@@ -71,7 +100,7 @@ class TaskStruct(object):
 
 class TaskUtils():
     COMM_SIZE = 16
-    def __init__(self, cpu, cell_name, param, mem_utils, unistd, RUN_FROM_SNAP, lgr):
+    def __init__(self, cpu, cell_name, param, mem_utils, unistd, RUN_FROM_SNAP, lgr, syscall_table=None, unistd32=None):
         self.cpu = cpu
         self.cell_name = cell_name
         self.lgr = lgr
@@ -81,14 +110,38 @@ class TaskUtils():
         self.exit_cycles = 0
         self.exit_pid = 0
         self.exec_addrs = {}
+        ''' call number -> syscall handler address, see getSyscallEntries '''
+        self.syscall_entries = None
+        ''' curProc cache, keyed on the current_task pointer value and the cycle it was filled.  See curProc '''
+        self.cur_proc_rec = None
+        self.cur_proc_cycle = None
+        self.cur_proc_comm = None
+        self.cur_proc_pid = None
+        ''' task records whose comm may change under us, e.g., within execve or prctl '''
+        self.comm_changing = set()
+        self.cur_proc_hits = 0
+        self.cur_proc_misses = 0
+        ''' pid -> task record index and its inverse, built by getTaskStructs and maintained by
+            clone and exit haps.  None means the index must be rebuilt with a full walk. '''
+        self.pid_index = None
+        self.rec_index = {}
+        self.swapper_addr = None
 
         if RUN_FROM_SNAP is not None:
-            phys_current_task_file = os.path.join('./', RUN_FROM_SNAP, cell_name, 'phys_current_task.pickle')
-            if os.path.isfile(phys_current_task_file):
-                self.phys_current_task = pickle.load( open(phys_current_task_file, 'rb') ) 
-            exec_addrs_file = os.path.join('./', RUN_FROM_SNAP, 'exec_addrs.pickle')
-            if os.path.isfile(exec_addrs_file):
-                self.exec_addrs = pickle.load( open(exec_addrs_file, 'rb') ) 
+            snap_state = snapState.getSnapState(RUN_FROM_SNAP, lgr)
+            if snap_state is not None:
+                task_state = snap_state.get(snapState.sectionName(cell_name, 'taskUtils'), STATE_VERSION)
+                if task_state is not None:
+                    self.phys_current_task = task_state['phys_current_task']
+                    self.exec_addrs = task_state['exec_addrs']
+                    self.syscall_entries = task_state.get('syscall_entries')
+            else:
+                phys_current_task_file = os.path.join('./', RUN_FROM_SNAP, cell_name, 'phys_current_task.pickle')
+                if os.path.isfile(phys_current_task_file):
+                    self.phys_current_task = pickle.load( open(phys_current_task_file, 'rb') ) 
+                exec_addrs_file = os.path.join('./', RUN_FROM_SNAP, cell_name, 'exec_addrs.pickle')
+                if os.path.isfile(exec_addrs_file):
+                    self.exec_addrs = pickle.load( open(exec_addrs_file, 'rb') ) 
         if self.phys_current_task is None:
             ''' address of current_task symbol, pointer at this address points to the current task record '''
             ''' use physical address because some are relative to FS segment '''
@@ -110,7 +163,7 @@ class TaskUtils():
             #    self.lgr.debug('TaskUtils init failed to get phys addr of 0x%x' % (param.current_task))
             #    return None
         self.lgr.debug('TaskUtils init cell %s with current_task of 0x%x, phys: 0x%x' % (cell_name, param.current_task, self.phys_current_task))
-        self.syscall_numbers = syscallNumbers.SyscallNumbers(unistd, self.lgr)
+        self.syscall_numbers = syscallNumbers.SyscallNumbers(unistd, self.lgr, table_file=syscall_table, compat=unistd32)
 
     def getPhysCurrentTask(self):
         return self.phys_current_task
@@ -121,24 +174,72 @@ class TaskUtils():
         cur_task_rec = self.mem_utils.readPhysPtr(self.cpu, self.phys_current_task)
         return cur_task_rec
 
-    def pickleit(self, fname):
-        phys_current_task_file = os.path.join('./', fname, self.cell_name, 'phys_current_task.pickle')
-        try:
-            os.mkdir(os.path.dirname(phys_current_task_file))
-        except:
-            pass
-        pickle.dump( self.phys_current_task, open( phys_current_task_file, "wb" ) )
-        exec_addrs_file = os.path.join('./', fname, self.cell_name, 'exec_addrs.pickle')
-        pickle.dump( self.exec_addrs, open( exec_addrs_file, "wb" ) )
+    def saveState(self, snap_state):
+        task_state = {}
+        task_state['phys_current_task'] = self.phys_current_task
+        task_state['exec_addrs'] = self.exec_addrs
+        task_state['syscall_entries'] = self.syscall_entries
+        snap_state.put(snapState.sectionName(self.cell_name, 'taskUtils'), STATE_VERSION, task_state)
 
     def curProc(self):
+        ''' Return cpu, comm and pid of the current task.  The comm and pid are cached
+            against the current_task pointer value, so repeated calls between task
+            switches only cost the read of current_task.  The cache is invalidated
+            by the context manager's changedThread hap, and around comm changes made
+            by execve and prctl.  It is only used at or after the cycle it was filled,
+            so a reverse or skip-to to an earlier cycle, where the task record may have
+            belonged to another pid, rereads the task. '''
         cur_task_rec = self.getCurTaskRec()
+        cycle = self.cpu.cycles
+        if cur_task_rec == self.cur_proc_rec and cur_task_rec not in self.comm_changing and cycle >= self.cur_proc_cycle:
+            self.cur_proc_hits += 1
+            return self.cpu, self.cur_proc_comm, self.cur_proc_pid
+        self.cur_proc_misses += 1
         comm = self.mem_utils.readString(self.cpu, cur_task_rec + self.param.ts_comm, 16)
         pid = self.mem_utils.readWord32(self.cpu, cur_task_rec + self.param.ts_pid)
-        phys = self.mem_utils.v2p(self.cpu, cur_task_rec)
-        #self.lgr.debug('taskProc cur_task 0x%x phys 0x%x  pid %d comm: %s  phys_current_task 0x%x' % (cur_task_rec, phys, pid, comm, self.phys_current_task))
+        #self.lgr.debug('taskProc cur_task 0x%x pid %d comm: %s  phys_current_task 0x%x' % (cur_task_rec, pid, comm, self.phys_current_task))
+        self.cur_proc_rec = cur_task_rec
+        self.cur_proc_cycle = cycle
+        self.cur_proc_comm = comm
+        self.cur_proc_pid = pid
         return self.cpu, comm, pid 
 
+    def invalidateCurProc(self):
+        self.cur_proc_rec = None
+
+    def commChanging(self):
+        ''' current task is entering a syscall that may change its comm, e.g., execve.
+            Bypass the curProc cache for the task until commChanged is called '''
+        cur_task_rec = self.getCurTaskRec()
+        self.comm_changing.add(cur_task_rec)
+        if cur_task_rec == self.cur_proc_rec:
+            self.cur_proc_rec = None
+
+    def commChanged(self):
+        ''' current task has returned from a syscall that may have changed its comm '''
+        cur_task_rec = self.getCurTaskRec()
+        self.comm_changing.discard(cur_task_rec)
+        if cur_task_rec == self.cur_proc_rec:
+            self.cur_proc_rec = None
+
+    def taskExit(self):
+        ''' current task is exiting, its task record may be reused by some other pid '''
+        cur_task_rec = self.getCurTaskRec()
+        self.comm_changing.discard(cur_task_rec)
+        self.cur_proc_rec = None
+        if cur_task_rec in self.rec_index:
+            pid = self.rec_index.pop(cur_task_rec)
+            if self.pid_index is not None:
+                self.pid_index.pop(pid, None)
+
+    def curProcStats(self):
+        total = self.cur_proc_hits + self.cur_proc_misses
+        if total == 0:
+            rate = 0.0
+        else:
+            rate = (self.cur_proc_hits * 100.0) / total
+        return self.cur_proc_hits, self.cur_proc_misses, rate
+
     def findSwapper(self):
             #task = SIM_read_phys_memory(cpu, current_task, self.mem_utils.WORD_SIZE)
             task = self.getCurTaskRec()
@@ -332,8 +433,112 @@ class TaskUtils():
         if task_rec_addr not in tasks:
             task = self.readTaskStruct(task_rec_addr, cpu)
             tasks[task_rec_addr] = task
+        self.indexTasks(tasks, swapper_addr)
         return tasks
 
+    def indexTasks(self, tasks, swapper_addr):
+        ''' rebuild the pid index from the results of a full task walk '''
+        self.pid_index = {}
+        self.rec_index = {}
+        for rec in tasks:
+            pid = tasks[rec].pid
+            if pid is not None:
+                self.pid_index[pid] = rec
+                self.rec_index[rec] = pid
+        self.swapper_addr = swapper_addr
+
+    def addTaskIndex(self, pid, rec):
+        if self.pid_index is None:
+            return
+        old_rec = self.pid_index.get(pid)
+        if old_rec is not None:
+            self.rec_index.pop(old_rec, None)
+        old_pid = self.rec_index.get(rec)
+        if old_pid is not None:
+            self.pid_index.pop(old_pid, None)
+        self.pid_index[pid] = rec
+        self.rec_index[rec] = pid
+
+    def indexCurTask(self):
+        ''' add the current task to the pid index, e.g., on return to a clone child '''
+        rec = self.getCurTaskRec()
+        pid = self.mem_utils.readWord32(self.cpu, rec + self.param.ts_pid)
+        if pid is not None:
+            self.addTaskIndex(pid, rec)
+
+    def noteClone(self, child_pid):
+        ''' Called in the parent on return from clone.  A new process is added to the tail of the
+            task list, and a new thread to the tail of its leader's thread group, so look
+            there for the child.  If not found, force a full walk on the next lookup. '''
+        if self.pid_index is None:
+            return
+        candidates = [self.lastTaskRec()]
+        leader = self.mem_utils.readPtr(self.cpu, self.getCurTaskRec() + self.param.ts_group_leader)
+        if leader is not None:
+            candidates.append(self.lastThreadRec(leader))
+        for rec in candidates:
+            if rec is not None and self.mem_utils.readWord32(self.cpu, rec + self.param.ts_pid) == child_pid:
+                self.addTaskIndex(child_pid, rec)
+                return
+        self.lgr.debug('taskUtils noteClone did not find record for child %d, index is stale' % child_pid)
+        self.pid_index = None
+
+    def lastTaskRec(self):
+        ''' task record at the tail of the task list, i.e., the most recently created process '''
+        if self.swapper_addr is None or self.param.ts_next is None:
+            return None
+        if self.param.ts_next_relative:
+            head = self.read_list_head(self.cpu, self.swapper_addr, self.param.ts_next)
+            if head is None:
+                return None
+            return head.prev
+        else:
+            return self.mem_utils.readPtr(self.cpu, self.swapper_addr + self.param.ts_prev)
+
+    def lastThreadRec(self, leader_rec):
+        ''' task record at the tail of the leader's thread group, i.e., its most recent thread '''
+        if self.param.ts_thread_group_list_head in (None, -1):
+            return None
+        head = self.read_list_head(self.cpu, leader_rec, self.param.ts_thread_group_list_head)
+        if head is None:
+            return None
+        return head.prev
+
+    def isIndexed(self, rec):
+        ''' is the given task record in the index with its current pid? '''
+        if rec is None or rec not in self.rec_index:
+            return False
+        return self.mem_utils.readWord32(self.cpu, rec + self.param.ts_pid) == self.rec_index[rec]
+
+    def taskIndexCurrent(self):
+        ''' True if the index exists and the most recently created process is in it.  The task
+            list is in creation order, so a newer process would leave an unindexed record at the
+            tail.  This does not show the index is complete, e.g., an untraced clone followed by
+            a traced one leaves an unindexed record before the tail, so only use the index to
+            find a given pid, whose record is then checked. '''
+        if self.pid_index is None:
+            return False
+        last = self.lastTaskRec()
+        if last is None:
+            return False
+        if last == self.swapper_addr or self.isIndexed(last):
+            return True
+        #self.lgr.debug('taskUtils taskIndexCurrent tail 0x%x not indexed' % last)
+        return False
+
+    def getIndexedRec(self, pid):
+        ''' task record for the pid from the index, or None if the index cannot vouch for it '''
+        if not self.taskIndexCurrent():
+            return None
+        rec = self.pid_index.get(pid)
+        if rec is None:
+            return None
+        if self.mem_utils.readWord32(self.cpu, rec + self.param.ts_pid) != pid:
+            self.lgr.debug('taskUtils getIndexedRec stale record 0x%x for pid %d' % (rec, pid))
+            self.pid_index = None
+            return None
+        return rec
+
     def getExitPid(self):
         return self.exit_pid
 
@@ -343,33 +548,30 @@ class TaskUtils():
 
     def getGroupLeaderPid(self, pid):
         retval = None
-        ts_list = self.getTaskStructs()
-        for ts in ts_list:
-            if ts_list[ts].pid == pid:
-                group_leader = self.mem_utils.readPtr(self.cpu, ts + self.param.ts_group_leader)
-                retval = self.mem_utils.readWord32(self.cpu, group_leader + self.param.ts_pid)
-                break
+        ts = self.getRecAddrForPid(pid)
+        if ts is not None:
+            group_leader = self.mem_utils.readPtr(self.cpu, ts + self.param.ts_group_leader)
+            retval = self.mem_utils.readWord32(self.cpu, group_leader + self.param.ts_pid)
         return retval
 
     def getGroupPids(self, leader_pid):
         retval = []
         self.lgr.debug('getGroupPids for %d' % leader_pid)
-        ts_list = self.getTaskStructs()
-        leader_rec = None
-        for ts in ts_list:
-            if ts_list[ts].pid == leader_pid:
-                leader_rec = ts
-                break
+        leader_rec = self.getRecAddrForPid(leader_pid)
         if leader_rec is None:
             self.lgr.debug('taskUtils getGroupPids did not find record for leader pid %d' % leader_pid)
             return None 
-        for ts in ts_list:
+        last = self.lastThreadRec(leader_rec)
+        if last is None or (last != leader_rec and not self.isIndexed(last)):
+            ''' no way to know if threads were added since the index was built '''
+            self.getTaskStructs()
+        for ts in list(self.rec_index):
             group_leader = self.mem_utils.readPtr(self.cpu, ts + self.param.ts_group_leader)
-            if group_leader == leader_rec:
+            if group_leader == leader_rec and self.isIndexed(ts):
                 pid = self.mem_utils.readWord32(self.cpu, group_leader + self.param.ts_pid)
                 ''' skip if exiting as recorded by syscall '''
                 if pid != self.exit_pid or self.cpu.cycles != self.exit_cycles:
-                    retval.append(ts_list[ts].pid)
+                    retval.append(self.rec_index[ts])
         return retval
 
     def getPidsForComm(self, comm_in):
@@ -393,7 +595,10 @@ class TaskUtils():
         return retval
 
     def getRecAddrForPid(self, pid):
-        self.lgr.debug('getRecAddrForPid %d' % pid)
+        rec = self.getIndexedRec(pid)
+        if rec is not None:
+            return rec
+        self.lgr.debug('getRecAddrForPid %d not indexed, walk task list' % pid)
         ts_list = self.getTaskStructs()
         for ts in ts_list:
            if ts_list[ts].pid == pid:
@@ -621,7 +826,24 @@ class TaskUtils():
         else: 
             return None, None
  
+    def getSyscallEntries(self):
+        ''' call number -> handler address, from the kernel parameters if getKernelParams resolved
+            the table, else read from sys_call_table the first time it is needed '''
+        if self.syscall_entries is None:
+            self.syscall_entries = getattr(self.param, 'syscall_table', None)
+        if self.syscall_entries is None:
+            count = max(self.syscall_numbers.syscalls) + 1 if len(self.syscall_numbers.syscalls) > 0 else MAX_SYSCALLS
+            self.syscall_entries = readSyscallTable(self.cpu, self.param, self.mem_utils, count)
+            if self.syscall_entries is None:
+                self.syscall_entries = {}
+            self.lgr.debug('getSyscallEntries cell %s read %d sys_call_table entries' % (self.cell_name, len(self.syscall_entries)))
+        return self.syscall_entries
+
     def getSyscallEntry(self, callnum):
+        entries = self.getSyscallEntries()
+        if callnum in entries:
+            return entries[callnum]
+        ''' not in the table read, e.g., the table was not mapped, compute the one entry '''
         if self.cpu.architecture == 'arm':
             val = callnum * self.mem_utils.WORD_SIZE + self.param.syscall_jump
             val = self.mem_utils.getUnsigned(val)
@@ -631,6 +853,8 @@ class TaskUtils():
             val = callnum * self.mem_utils.WORD_SIZE - self.param.syscall_jump
             val = self.mem_utils.getUnsigned(val)
             entry = self.mem_utils.readPtr(self.cpu, val)
+        if entry is not None and entry >= self.param.kernel_base:
+            entries[callnum] = entry
         return entry
 
     def frameFromStackSyscall(self):
@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+'''
+Write the ARM fixtures, arm.elf and armeb.elf, for test_elfText.  There is no ARM
+toolchain on the build hosts, so the ELF header, one PT_LOAD program header and
+the sections are packed here:  .text, .data and .shstrtab.
+'''
+import os
+import struct
+
+BASE = 0x10000
+''' mov r0, #1; add r0, r0, r0; b . '''
+TEXT = [0xe3a00001, 0xe0800000, 0xeafffffe]
+DATA = b'resim\0\0\0'
+
+def mkElf(order, data_enc):
+    names = b'\0.text\0.data\0.shstrtab\0'
+    ehsize = 52
+    phentsize = 32
+    shentsize = 40
+    text = b''.join([struct.pack(order+'I', word) for word in TEXT])
+    text_off = ehsize + phentsize
+    data_off = text_off + len(text)
+    names_off = data_off + len(DATA)
+    shoff = (names_off + len(names) + 3) & ~3
+    ident = b'\x7fELF' + struct.pack('BBBB', 1, data_enc, 1, 0) + b'\0' * 8
+    ''' type, machine, version, entry, phoff, shoff, flags, ehsize, phentsize, phnum, shentsize, shnum, shstrndx '''
+    header = ident + struct.pack(order+'HHIIIIIHHHHHH', 2, 40, 1, BASE + text_off, ehsize, shoff, 0x05000000,
+                                 ehsize, phentsize, 1, shentsize, 4, 3)
+    load_size = names_off
+    phdr = struct.pack(order+'IIIIIIII', 1, 0, BASE, BASE, load_size, load_size, 7, 0x1000)
+    ''' name, type, flags, addr, offset, size, link, info, addralign, entsize '''
+    shdrs = [struct.pack(order+'IIIIIIIIII', 0, 0, 0, 0, 0, 0, 0, 0, 0, 0),
+             struct.pack(order+'IIIIIIIIII', 1, 1, 6, BASE + text_off, text_off, len(text), 0, 0, 4, 0),
+             struct.pack(order+'IIIIIIIIII', 7, 1, 3, BASE + data_off, data_off, len(DATA), 0, 0, 4, 0),
+             struct.pack(order+'IIIIIIIIII', 13, 3, 0, 0, names_off, len(names), 0, 0, 1, 0)]
+    image = header + phdr + text + DATA + names
+    image += b'\0' * (shoff - len(image))
+    return image + b''.join(shdrs)
+
+if __name__ == '__main__':
+    here = os.path.dirname(os.path.abspath(__file__))
+    with open(os.path.join(here, 'arm.elf'), 'wb') as fh:
+        fh.write(mkElf('<', 1))
+    with open(os.path.join(here, 'armeb.elf'), 'wb') as fh:
+        fh.write(mkElf('>', 2))
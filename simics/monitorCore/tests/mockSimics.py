@@ -0,0 +1,173 @@
+'''
+Stand-ins for the parts of the Simics API used by the tests and benchmarks, which count
+calls rather than simulate anything.  install puts the SIM_ functions and constants into
+the namespace of a module that did "from simics import *", e.g.,
+
+    sim = mockSimics.MockSimics()
+    sim.install(genContextMgr)
+    ...
+    sim.calls['SIM_breakpoint']
+
+Physical memory is a bytearray at a base address, and virtual addresses map to the same
+physical address.
+'''
+import struct
+
+Sim_Break_Physical = 0
+Sim_Break_Virtual = 1
+Sim_Break_Linear = 2
+Sim_Access_Read = 1
+Sim_Access_Write = 2
+Sim_Access_Execute = 4
+
+class Attrs():
+    ''' an object whose attributes are given as keywords '''
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+class MockMemory():
+    def __init__(self, size, base=0):
+        self.data = bytearray(size)
+        self.base = base
+        self.reads = 0
+        self.bytes_read = 0
+        self.iface = Attrs(memory_space=Attrs(read=self.read))
+
+    def read(self, cpu, paddr, count, inquiry):
+        offset = paddr - self.base
+        if offset < 0 or offset + count > len(self.data):
+            raise Exception('read of %d bytes at 0x%x is outside memory' % (count, paddr))
+        self.reads += 1
+        self.bytes_read += count
+        return tuple(self.data[offset:offset+count])
+
+    def write(self, paddr, data):
+        offset = paddr - self.base
+        self.data[offset:offset+len(data)] = data
+
+    def readValue(self, paddr, count):
+        ''' little-endian value as read by SIM_read_phys_memory '''
+        data = self.read(None, paddr, count, 0)
+        retval = 0
+        for index in range(count-1, -1, -1):
+            retval = (retval << 8) | data[index]
+        return retval
+
+class MockCpu():
+    def __init__(self, name, memory, architecture='x86-64', regs=None):
+        self.name = name
+        self.architecture = architecture
+        self.cycles = 0
+        self.physical_memory = memory
+        self.current_context = None
+        if regs is None:
+            regs = {}
+        self.regs = regs
+        reg_names = sorted(regs)
+        int_register = Attrs(get_number=lambda name: reg_names.index(name),
+                             read=lambda num: self.regs[reg_names[num]])
+        self.iface = Attrs(processor_info_v2=Attrs(get_physical_memory=lambda: memory),
+                           processor_info=Attrs(logical_to_physical=lambda addr, access: Attrs(address=addr)),
+                           int_register=int_register)
+
+class MockSimics():
+    def __init__(self, cpus=None):
+        ''' SIM_ function name -> number of calls '''
+        self.calls = {}
+        if cpus is None:
+            cpus = []
+        self.cpus = cpus
+        self.next_num = 0
+        ''' breakpoint and hap numbers that have been created and not deleted '''
+        self.live_breaks = set()
+        self.live_haps = set()
+        self.disabled = set()
+
+    def count(self, name):
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    def reset(self):
+        self.calls = {}
+
+    def total(self):
+        return sum(self.calls.values())
+
+    def newNum(self):
+        self.next_num += 1
+        return self.next_num
+
+    def SIM_breakpoint(self, obj, addr_type, mode, addr, length, flags):
+        self.count('SIM_breakpoint')
+        num = self.newNum()
+        self.live_breaks.add(num)
+        return num
+
+    def SIM_delete_breakpoint(self, num):
+        self.count('SIM_delete_breakpoint')
+        self.live_breaks.remove(num)
+        self.disabled.discard(num)
+
+    def SIM_enable_breakpoint(self, num):
+        self.count('SIM_enable_breakpoint')
+        self.disabled.discard(num)
+
+    def SIM_disable_breakpoint(self, num):
+        self.count('SIM_disable_breakpoint')
+        self.disabled.add(num)
+
+    def SIM_hap_add_callback_index(self, hap_type, callback, parameter, index):
+        self.count('SIM_hap_add_callback_index')
+        num = self.newNum()
+        self.live_haps.add(num)
+        return num
+
+    def SIM_hap_add_callback_range(self, hap_type, callback, parameter, start, end):
+        self.count('SIM_hap_add_callback_range')
+        num = self.newNum()
+        self.live_haps.add(num)
+        return num
+
+    def SIM_hap_add_callback_obj(self, hap_type, obj, flags, callback, parameter):
+        self.count('SIM_hap_add_callback_obj')
+        num = self.newNum()
+        self.live_haps.add(num)
+        return num
+
+    def SIM_hap_delete_callback_id(self, hap_type, num):
+        self.count('SIM_hap_delete_callback_id')
+        self.live_haps.remove(num)
+
+    def SIM_run_alone(self, fun, arg):
+        ''' Simics runs these once the current hap returns, which is before the next hap '''
+        self.count('SIM_run_alone')
+        fun(arg)
+
+    def SIM_run_command(self, cmd):
+        self.count('SIM_run_command')
+
+    def SIM_get_object(self, name):
+        self.count('SIM_get_object')
+        return name
+
+    def SIM_get_mem_op_value_le(self, memory):
+        ''' the tests pass the value written as the memory operation '''
+        return memory
+
+    def SIM_read_phys_memory(self, cpu, paddr, count):
+        self.count('SIM_read_phys_memory')
+        return cpu.physical_memory.readValue(paddr, count)
+
+    def SIM_write_phys_memory(self, cpu, paddr, value, count):
+        self.count('SIM_write_phys_memory')
+        cpu.physical_memory.write(paddr, bytearray(struct.pack('<Q', value)[:count]))
+
+    def SIM_get_all_processors(self):
+        return self.cpus
+
+    def install(self, module):
+        for name in dir(self):
+            if name.startswith('SIM_'):
+                setattr(module, name, getattr(self, name))
+        for name, value in globals().items():
+            if name.startswith('Sim_'):
+                setattr(module, name, value)
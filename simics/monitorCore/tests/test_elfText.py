@@ -0,0 +1,75 @@
+'''
+Tests of elfText.findSection against the fixtures in tests/elf, whose expected values
+are from readelf -SW.  elfText does not use Simics,
+run with:  python -m unittest discover -s simics/monitorCore/tests
+'''
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import elfText
+
+ELF_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'elf')
+
+''' fixture -> section -> (address, offset, size) as shown by readelf '''
+SECTIONS = {'i386.elf':{'.text':(0x08048074, 0x74, 0x2), '.rodata':(0x08048078, 0x78, 0x6),
+                        '.data':(0x08048080, 0x80, 0x4), '.shstrtab':(0, 0x84, 0x1f)},
+            'x86_64.elf':{'.text':(0x4000b0, 0xb0, 0x2), '.rodata':(0x4000b2, 0xb2, 0x6),
+                          '.data':(0x4000b8, 0xb8, 0x4), '.shstrtab':(0, 0xbc, 0x1f)},
+            'arm.elf':{'.text':(0x10054, 0x54, 0xc), '.data':(0x10060, 0x60, 0x8),
+                       '.shstrtab':(0, 0x68, 0x17)},
+            'armeb.elf':{'.text':(0x10054, 0x54, 0xc), '.data':(0x10060, 0x60, 0x8),
+                         '.shstrtab':(0, 0x68, 0x17)}}
+
+class TestFindSection(unittest.TestCase):
+    def testReadelfValues(self):
+        for fixture in sorted(SECTIONS):
+            path = os.path.join(ELF_DIR, fixture)
+            for section in SECTIONS[fixture]:
+                self.assertEqual(elfText.findSection(path, section), SECTIONS[fixture][section],
+                                 '%s %s' % (fixture, section))
+
+    def testMissingSection(self):
+        for fixture in sorted(SECTIONS):
+            path = os.path.join(ELF_DIR, fixture)
+            self.assertEqual(elfText.findSection(path, '.bss'), (None, None, None))
+            ''' a prefix of a section name is not a match '''
+            self.assertEqual(elfText.findSection(path, '.tex'), (None, None, None))
+
+    def testNotElf(self):
+        self.assertEqual(elfText.findSection(os.path.join(ELF_DIR, 'README'), '.text'), (None, None, None))
+
+class TestGetText(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        elfText.text_cache.clear()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+        elfText.text_cache.clear()
+
+    def testCached(self):
+        path = os.path.join(self.tmp, 'prog')
+        shutil.copy(os.path.join(ELF_DIR, 'arm.elf'), path)
+        text = elfText.getText(path)
+        self.assertEqual((text.address, text.offset, text.size), (0x10054, 0x54, 0xc))
+        self.assertEqual(len(elfText.text_cache), 1)
+        elfText.getText(path)
+        self.assertEqual(len(elfText.text_cache), 1)
+
+    def testTruncated(self):
+        path = os.path.join(self.tmp, 'prog')
+        with open(os.path.join(ELF_DIR, 'x86_64.elf'), 'rb') as fh:
+            data = fh.read()
+        with open(path, 'wb') as fh:
+            fh.write(data[:len(data) - 8])
+        text = elfText.getText(path)
+        self.assertEqual((text.address, text.offset, text.size), (None, None, None))
+
+    def testNoFile(self):
+        self.assertEqual(elfText.getText(os.path.join(self.tmp, 'none')), None)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+'''
+Count the breakpoint API calls GenContextMgr makes per 10k task switches, with breakpoints
+suspended (disabled) while unwatched tasks run, and with them deleted and recreated.
+Uses the counting Simics stand-in of mockSimics, run with:
+    python -m unittest discover -s simics/monitorCore/tests
+or run this file directly to see the counts.
+'''
+import os
+import sys
+import time
+import types
+import logging
+import unittest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.modules.setdefault('simics', types.ModuleType('simics'))
+import genContextMgr
+import mockSimics
+
+SWITCHES = 10000
+BREAKS = 50
+WATCHED = 0x1000
+''' task records of unwatched tasks '''
+OTHERS = [0x2000, 0x3000, 0x4000]
+''' which task is scheduled on each switch:  the watched task runs one slot in four '''
+SCHEDULE = [WATCHED, OTHERS[0], OTHERS[1], OTHERS[2]]
+''' API calls that create or delete Simics breakpoints or haps '''
+CREATE_DELETE = ['SIM_breakpoint', 'SIM_delete_breakpoint', 'SIM_hap_add_callback_index',
+                 'SIM_hap_add_callback_range', 'SIM_hap_delete_callback_id']
+
+class TaskUtils():
+    def __init__(self):
+        self.cur_task_rec = WATCHED
+    def getMemUtils(self):
+        return None
+    def getPhysCurrentTask(self):
+        return 0x10000
+    def getCurTaskRec(self):
+        return self.cur_task_rec
+    def invalidateCurProc(self):
+        pass
+
+class TestBreakCounts(unittest.TestCase):
+    def setUp(self):
+        self.lgr = logging.getLogger('test_genContextMgr')
+        self.lgr.addHandler(logging.NullHandler())
+        self.sim = mockSimics.MockSimics()
+        self.sim.install(genContextMgr)
+        self.cpu = mockSimics.MockCpu('cpu0', None)
+        self.task_utils = TaskUtils()
+        self.cm = genContextMgr.GenContextMgr(None, 'cell', self.task_utils, None, self.cpu, self.lgr)
+        for index in range(BREAKS):
+            handle = self.cm.genBreakpoint('cell', mockSimics.Sim_Break_Linear, mockSimics.Sim_Access_Execute,
+                                           0x8048000 + index*0x10, 1, 0)
+            self.cm.genHapIndex('Core_Breakpoint_Memop', None, None, handle, name='syscall%d' % index)
+        start = self.cm.genBreakpoint('cell', mockSimics.Sim_Break_Linear, mockSimics.Sim_Access_Execute, 0xc0000000, 1, 0)
+        end = self.cm.genBreakpoint('cell', mockSimics.Sim_Break_Linear, mockSimics.Sim_Access_Execute, 0xc0000010, 1, 0)
+        self.cm.genHapRange('Core_Breakpoint_Memop', None, None, start, end, name='range')
+        ''' watching the current task, as watchTasks does, without its task break '''
+        self.cm.task_hap = 1
+        self.cm.watching_tasks = True
+        self.cm.addWatchRec(WATCHED)
+
+    def switch(self, cur_addr):
+        self.cm.changedThread(self.cpu, None, None, cur_addr)
+        self.task_utils.cur_task_rec = cur_addr
+
+    def runSwitches(self, schedule, switches):
+        self.sim.reset()
+        start = time.time()
+        for index in range(switches):
+            self.switch(schedule[index % len(schedule)])
+        return time.time() - start
+
+    def checkLive(self):
+        ''' each GenBreakpoint and GenHap has at most one Simics object, none leaked '''
+        break_nums = [bp.break_num for bp in self.cm.breakpoints.values() if bp.break_num is not None]
+        self.assertEqual(set(break_nums), self.sim.live_breaks)
+        hap_nums = [hap.hap_num for hap in self.cm.haps.values() if hap.hap_num is not None]
+        self.assertEqual(set(hap_nums), self.sim.live_haps)
+
+    def testSuspend(self):
+        elapsed = self.runSwitches(SCHEDULE, SWITCHES)
+        suspend_calls = dict(self.sim.calls)
+        for name in CREATE_DELETE:
+            self.assertEqual(suspend_calls.get(name, 0), 0, name)
+        ''' the watched task runs 2500 times, each time its breakpoints are enabled and later disabled '''
+        self.assertEqual(suspend_calls['SIM_enable_breakpoint'], (SWITCHES/4 - 1) * (BREAKS + 2))
+        self.assertEqual(suspend_calls['SIM_disable_breakpoint'], SWITCHES/4 * (BREAKS + 2))
+        self.checkLive()
+        self.cm.suspendBreaks(False)
+        self.task_utils.cur_task_rec = WATCHED
+        self.switch(WATCHED)
+        delete_elapsed = self.runSwitches(SCHEDULE, SWITCHES)
+        delete_calls = dict(self.sim.calls)
+        self.checkLive()
+        self.assertTrue(self.sim.total() > sum(suspend_calls.values()))
+        self.lgr.debug('per %d switches, %d breakpoints: suspend %d calls in %.3fs, delete %d calls in %.3fs' % (SWITCHES,
+                       BREAKS+2, sum(suspend_calls.values()), elapsed, sum(delete_calls.values()), delete_elapsed))
+        for name in sorted(set(suspend_calls) | set(delete_calls)):
+            self.lgr.debug('    %s suspend %d delete %d' % (name, suspend_calls.get(name, 0), delete_calls.get(name, 0)))
+
+    def testUnwatchedSwitches(self):
+        ''' switches between unwatched tasks touch no breakpoints '''
+        self.switch(OTHERS[0])
+        self.runSwitches(OTHERS, SWITCHES)
+        self.assertEqual(self.sim.total(), 0)
+        self.cm.suspendBreaks(False)
+        self.runSwitches(OTHERS, SWITCHES)
+        self.assertEqual(self.sim.total(), 0)
+
+    def testDeleteWhileSuspended(self):
+        ''' a hap deleted while its task is not scheduled is gone once the task returns '''
+        self.switch(OTHERS[0])
+        self.cm.genDeleteHap(1, immediate=True)
+        self.switch(WATCHED)
+        self.checkLive()
+        self.assertEqual(len(self.sim.disabled), 0)
+
+if __name__ == '__main__':
+    ''' show the call counts '''
+    logging.basicConfig(level=logging.DEBUG)
+    unittest.main()
@@ -0,0 +1,87 @@
+'''
+Tests of the monitor side of idaChannel on a temp socket, driven by the MonitorChannel
+client of ida/gdbProt.py.  Only the names of the simics and IDA modules are needed,
+run with:  python -m unittest discover -s simics/monitorCore/tests
+or run this file directly to see the round trip latency.
+'''
+import os
+import sys
+import types
+import shutil
+import logging
+import tempfile
+import threading
+import unittest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'ida'))
+sys.modules.setdefault('simics', types.ModuleType('simics'))
+sys.modules.setdefault('idaapi', types.ModuleType('idaapi'))
+idc = sys.modules.setdefault('idc', types.ModuleType('idc'))
+idc.Eval = None
+import idaChannel
+import gdbProt
+
+PINGS = 200
+
+class TestIdaChannel(unittest.TestCase):
+    def setUp(self):
+        self.lgr = logging.getLogger('test_idaChannel')
+        self.lgr.addHandler(logging.NullHandler())
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'ida.sock')
+        self.channel = idaChannel.IdaChannel(self.lgr, path=self.path)
+        self.assertTrue(self.channel.start())
+        self.client = gdbProt.MonitorChannel(self.path)
+
+    def tearDown(self):
+        self.client.sock.close()
+        self.channel.stop()
+        shutil.rmtree(self.tmp)
+
+    def testPing(self):
+        req_id = self.client.request('ping')
+        self.assertEqual(self.client.getReply(req_id, 5), {'id':req_id, 'pong':True})
+
+    def testUnknownOp(self):
+        req_id = self.client.request('bogus')
+        self.assertTrue('error' in self.client.getReply(req_id, 5))
+
+    def testWaitStop(self):
+        ''' no mail yet, the request stays pending until the monitor posts '''
+        self.assertEqual(self.client.waitStop(0.05), None)
+        timer = threading.Timer(0.05, self.channel.post, ['0x8048400'])
+        timer.start()
+        self.assertEqual(self.client.waitStop(5), '0x8048400')
+        timer.join()
+
+    def testPostedMail(self):
+        ''' mail posted before the request is returned at once, until cleared '''
+        self.channel.post('0xc0001000')
+        self.assertEqual(self.client.waitStop(5), '0xc0001000')
+        self.assertEqual(self.client.waitStop(5), '0xc0001000')
+        self.channel.clear()
+        self.assertEqual(self.client.waitStop(0.05), None)
+
+    def testReconnect(self):
+        self.client.sock.close()
+        self.client = gdbProt.MonitorChannel(self.path)
+        self.channel.post('0x1000')
+        self.assertEqual(self.client.waitStop(5), '0x1000')
+
+    def testStartTwice(self):
+        ''' a channel reused across debug sessions keeps its socket '''
+        self.assertTrue(self.channel.start())
+        req_id = self.client.request('ping')
+        self.assertNotEqual(self.client.getReply(req_id, 5), None)
+
+    def testLatency(self):
+        ''' round trip latency of the channel, which replaces polling the monitor via gdb '''
+        times = sorted([self.client.ping() for i in range(PINGS)])
+        median = times[PINGS/2]
+        self.lgr.debug('IdaChannel round trip median %.1f us, max %.1f us' % (median*1000000, times[-1]*1000000))
+        self.assertTrue(median < 0.1)
+
+if __name__ == '__main__':
+    ''' show the latency measurement '''
+    logging.basicConfig(level=logging.DEBUG)
+    unittest.main()
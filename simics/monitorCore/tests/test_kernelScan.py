@@ -0,0 +1,98 @@
+'''
+Tests of kernelScan over a synthetic memory dump, and of the kernel parameter cache.
+kernelScan does not use Simics, run with:  python -m unittest discover -s simics/monitorCore/tests
+'''
+import os
+import sys
+import struct
+import shutil
+import tempfile
+import unittest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import kernelScan
+import kParams
+
+BASE = 0x1000000
+VALUE = 0xc1234560
+''' offsets of aligned copies of VALUE, one at the end of the first scan chunk '''
+ALIGNED = [0x40, kernelScan.SCAN_CHUNK - 4, kernelScan.SCAN_CHUNK + 0x100, 2*kernelScan.SCAN_CHUNK + 0x2008]
+UNALIGNED = [0x82, kernelScan.SCAN_CHUNK + 0x203]
+''' the dump ends part way into the third chunk '''
+DUMP_SIZE = 2*kernelScan.SCAN_CHUNK + 0x3000
+
+class Cpu():
+    def __init__(self, architecture):
+        self.architecture = architecture
+
+class TestKernelScan(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.dump = os.path.join(self.tmp, 'memory.dump')
+        data = bytearray(DUMP_SIZE)
+        for offset in ALIGNED + UNALIGNED:
+            data[offset:offset+4] = struct.pack('<I', VALUE)
+        ''' kernel text for the fingerprint '''
+        for offset in range(0, kernelScan.FINGERPRINT_PAGES * kernelScan.PAGE_SIZE, 0x100):
+            if data[offset:offset+4] == b'\0\0\0\0':
+                data[offset:offset+4] = struct.pack('<I', offset)
+        with open(self.dump, 'wb') as fh:
+            fh.write(data)
+        self.read_fn = kernelScan.fileReader(self.dump, base=BASE)
+        self.cache_dir = kernelScan.KPARAM_CACHE_DIR
+        kernelScan.KPARAM_CACHE_DIR = os.path.join(self.tmp, 'kparam_cache')
+
+    def tearDown(self):
+        kernelScan.KPARAM_CACHE_DIR = self.cache_dir
+        shutil.rmtree(self.tmp)
+
+    def testFindWords(self):
+        data = b'\0\0' + struct.pack('<I', VALUE) + b'\0\0' + struct.pack('<I', VALUE)
+        self.assertEqual(kernelScan.findWords(data, VALUE), [8])
+        data = b'\0' * 8 + struct.pack('<Q', VALUE)
+        self.assertEqual(kernelScan.findWords(data, VALUE, word_size=8), [8])
+
+    def testAlignedHits(self):
+        hits = kernelScan.scanMemory(self.read_fn, BASE, DUMP_SIZE, VALUE)
+        self.assertEqual(hits, ALIGNED)
+
+    def testMaxHits(self):
+        hits = kernelScan.scanMemory(self.read_fn, BASE, DUMP_SIZE, VALUE, max_hits=2)
+        self.assertEqual(hits, ALIGNED[:2])
+
+    def testStopsAtEndOfDump(self):
+        reads = []
+        def read_fn(paddr, count):
+            reads.append(paddr)
+            return self.read_fn(paddr, count)
+        hits = kernelScan.scanMemory(read_fn, BASE, 8*kernelScan.SCAN_CHUNK, VALUE)
+        self.assertEqual(hits, ALIGNED)
+        self.assertTrue(max(reads) < BASE + DUMP_SIZE)
+
+    def testFingerprint(self):
+        digest = kernelScan.fingerprint(self.read_fn, BASE, 'x86-64', 8)
+        self.assertNotEqual(digest, None)
+        self.assertEqual(kernelScan.fingerprint(self.read_fn, BASE, 'x86-64', 8), digest)
+        self.assertNotEqual(kernelScan.fingerprint(self.read_fn, BASE, 'x86', 4), digest)
+        ''' text that runs past the end of the dump has no fingerprint '''
+        self.assertEqual(kernelScan.fingerprint(self.read_fn, BASE + DUMP_SIZE - kernelScan.PAGE_SIZE, 'x86-64', 8), None)
+        ''' nor does text that is all zeros '''
+        self.assertEqual(kernelScan.fingerprint(self.read_fn, BASE + kernelScan.SCAN_CHUNK + 0x1000, 'x86', 4, pages=1), None)
+
+    def testCachedParam(self):
+        digest = kernelScan.fingerprint(self.read_fn, BASE, 'x86-64', 8)
+        self.assertEqual(kernelScan.loadCachedParam(digest), None)
+        param = kParams.Kparams(Cpu('x86-64'), word_size=8)
+        param.current_task = 0xffffffff81e0d000
+        kernelScan.saveCachedParam(digest, param)
+        self.assertTrue(os.path.isfile(os.path.join(kernelScan.KPARAM_CACHE_DIR, digest)))
+        cached = kernelScan.loadCachedParam(digest)
+        self.assertEqual(cached.__dict__, param.__dict__)
+
+    def testCorruptCachedParam(self):
+        os.makedirs(kernelScan.KPARAM_CACHE_DIR)
+        with open(os.path.join(kernelScan.KPARAM_CACHE_DIR, 'bad'), 'wb') as fh:
+            fh.write(b'\x80\x02')
+        self.assertEqual(kernelScan.loadCachedParam('bad'), None)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+'''
+Tests and a micro-benchmark of the memUtils physical page cache against a mock memory
+space, see mockSimics.  Run with:
+    python -m unittest discover -s simics/monitorCore/tests
+or run this file directly to see the benchmark.
+'''
+import os
+import sys
+import time
+import types
+import struct
+import logging
+import unittest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.modules.setdefault('simics', types.ModuleType('simics'))
+import memUtils
+import instructCache
+import mockSimics
+
+MEM_SIZE = 0x100000
+''' task records as the kernel might have them:  a list of records linked by next pointers '''
+TASKS = 64
+TASK_BASE = 0x20000
+TASK_SIZE = 0x600
+TS_NEXT = 0x10
+TS_PID = 0x20
+TS_COMM = 0x40
+''' haps in the benchmark, each walking the task list as getTaskStructs does '''
+HAPS = 50
+
+class Param():
+    kernel_base = 0xc0000000
+
+class TestPageCache(unittest.TestCase):
+    def setUp(self):
+        self.lgr = logging.getLogger('test_memUtils')
+        self.lgr.addHandler(logging.NullHandler())
+        self.memory = mockSimics.MockMemory(MEM_SIZE)
+        self.cpu = mockSimics.MockCpu('board.cpu0', self.memory)
+        ''' a second core of the same cell, and a cpu of another cell '''
+        self.cpu1 = mockSimics.MockCpu('board.cpu1', self.memory)
+        self.other = mockSimics.MockCpu('other.cpu0', mockSimics.MockMemory(0x1000))
+        self.sim = mockSimics.MockSimics(cpus=[self.cpu, self.cpu1, self.other])
+        self.sim.install(memUtils)
+        self.sim.install(instructCache)
+        self.mem_utils = memUtils.memUtils(4, Param(), self.lgr)
+        for index in range(TASKS):
+            rec = TASK_BASE + index*TASK_SIZE
+            next_rec = TASK_BASE + ((index+1) % TASKS)*TASK_SIZE
+            self.memory.write(rec+TS_NEXT, struct.pack('<I', next_rec))
+            self.memory.write(rec+TS_PID, struct.pack('<I', 100+index))
+            self.memory.write(rec+TS_COMM, 'task%d\0' % index)
+
+    def walkTasks(self):
+        ''' read the pid and comm of each task, following next pointers '''
+        retval = []
+        rec = TASK_BASE
+        for index in range(TASKS):
+            pid = self.mem_utils.readWord32(self.cpu, rec+TS_PID)
+            comm = self.mem_utils.readString(self.cpu, rec+TS_COMM, 16)
+            retval.append((pid, comm))
+            rec = self.mem_utils.readPtr(self.cpu, rec+TS_NEXT)
+        return retval
+
+    def testWalk(self):
+        tasks = self.walkTasks()
+        self.assertEqual(tasks[0], (100, 'task0'))
+        self.assertEqual(tasks[-1], (100+TASKS-1, 'task%d' % (TASKS-1)))
+        ''' one read per page touched '''
+        pages = (TASKS*TASK_SIZE + memUtils.pageUtils.PAGE_SIZE - 1) / memUtils.pageUtils.PAGE_SIZE
+        self.assertEqual(self.memory.reads, pages)
+
+    def testNewCycle(self):
+        self.assertEqual(self.mem_utils.readWord32(self.cpu, TASK_BASE+TS_PID), 100)
+        self.memory.write(TASK_BASE+TS_PID, struct.pack('<I', 7))
+        ''' same cycle, the cached page is used '''
+        self.assertEqual(self.mem_utils.readWord32(self.cpu, TASK_BASE+TS_PID), 100)
+        self.cpu.cycles += 1
+        self.assertEqual(self.mem_utils.readWord32(self.cpu, TASK_BASE+TS_PID), 7)
+
+    def testOtherCore(self):
+        ''' another core of the cell may write memory without the reading cpu advancing '''
+        self.mem_utils.readWord32(self.cpu, TASK_BASE+TS_PID)
+        self.memory.write(TASK_BASE+TS_PID, struct.pack('<I', 7))
+        self.other.cycles += 1
+        self.assertEqual(self.mem_utils.readWord32(self.cpu, TASK_BASE+TS_PID), 100)
+        self.cpu1.cycles += 1
+        self.assertEqual(self.mem_utils.readWord32(self.cpu, TASK_BASE+TS_PID), 7)
+
+    def testWriteWord(self):
+        self.mem_utils.readWord32(self.cpu, TASK_BASE+TS_PID)
+        self.mem_utils.writeWord(self.cpu, TASK_BASE+TS_PID, 7)
+        self.assertEqual(self.mem_utils.readWord32(self.cpu, TASK_BASE+TS_PID), 7)
+
+    def testCrossPage(self):
+        paddr = 0x10ffe
+        self.memory.write(paddr, 'abcdef\0')
+        self.assertEqual(self.mem_utils.readString(self.cpu, paddr, 16), 'abcdef')
+        self.assertEqual(self.mem_utils.getBytes(self.cpu, 4, paddr), ('61626364', (0x61, 0x62, 0x63, 0x64)))
+
+    def testUnreadable(self):
+        ''' the last page is only partly backed, so it is read directly '''
+        small = mockSimics.MockMemory(0x1800)
+        cpu = mockSimics.MockCpu('small.cpu0', small)
+        small.write(0x1100, 'tail\0')
+        self.assertEqual(self.mem_utils.readString(cpu, 0x1100, 8), 'tail')
+        self.assertEqual(self.mem_utils.readWord32(cpu, 0x2000), None)
+
+    def testBenchmark(self):
+        ''' memory space reads and time for HAPS haps that each walk the task list, through the
+            page cache, and with each read going directly to the memory space '''
+        start = time.time()
+        for hap in range(HAPS):
+            self.cpu.cycles += 1
+            self.walkTasks()
+        cached = time.time() - start
+        cached_reads = self.memory.reads
+        self.memory.reads = 0
+        def directRead(cpu, paddr, count):
+            return bytearray(memUtils.readPhysBytes(cpu, paddr, count))
+        self.mem_utils.readPhysBlock = directRead
+        start = time.time()
+        for hap in range(HAPS):
+            self.cpu.cycles += 1
+            self.walkTasks()
+        direct = time.time() - start
+        direct_reads = self.memory.reads
+        self.assertEqual(direct_reads, HAPS * TASKS * 3)
+        self.assertTrue(cached_reads * 4 < direct_reads)
+        self.lgr.debug('%d haps walking %d tasks: cached %d reads in %.3fs, direct %d reads in %.3fs' % (HAPS,
+                       TASKS, cached_reads, cached, direct_reads, direct))
+
+if __name__ == '__main__':
+    ''' show the benchmark '''
+    logging.basicConfig(level=logging.DEBUG)
+    unittest.main()
@@ -0,0 +1,123 @@
+'''
+Tests of the operand model of decode (x86) and decodeArm, and of the register sets of
+instructCache.Decoded, using canned disassembly text.  Only the name of the simics
+module is needed, run with:  python -m unittest discover -s simics/monitorCore/tests
+'''
+import os
+import sys
+import types
+import unittest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.modules.setdefault('simics', types.ModuleType('simics'))
+import decode
+import decodeArm
+import instructCache
+
+class Cpu():
+    def __init__(self, architecture):
+        self.architecture = architecture
+
+def decoded(architecture, text):
+    return instructCache.Decoded(Cpu(architecture), 4, text)
+
+class TestX86(unittest.TestCase):
+    def testAliasFamilies(self):
+        for reg in ['al', 'ah', 'ax', 'eax', 'rax']:
+            self.assertEqual(decode.regFamily(reg), 'rax')
+        self.assertEqual(decode.regFamily('sil'), 'rsi')
+        self.assertEqual(decode.regFamily('r9d'), 'r9')
+        self.assertTrue(decode.regIsPart('al', 'eax'))
+        self.assertFalse(decode.regIsPart('al', 'ebx'))
+
+    def testMemOperand(self):
+        op = decode.parseOperand('dword ptr [ebx+esi*4-0x10]')
+        self.assertEqual(op.kind, 'mem')
+        self.assertEqual((op.ea.base, op.ea.index, op.ea.scale, op.ea.disp), ('ebx', 'esi', 4, -0x10))
+        self.assertEqual(op.regs, set(['rbx', 'rsi']))
+        op = decode.parseOperand('dword ptr fs:[0x30]')
+        self.assertEqual((op.ea.segment, op.ea.base, op.ea.disp), ('fs', None, 0x30))
+
+    def testRegAndImm(self):
+        op = decode.parseOperand('cl')
+        self.assertEqual((op.kind, op.reg), ('reg', 'rcx'))
+        op = decode.parseOperand('0x1f')
+        self.assertEqual((op.kind, op.value), ('imm', 0x1f))
+
+    def testMovWritesSubRegister(self):
+        d = decoded('x86', 'mov al, byte ptr [ebp+0x8]')
+        self.assertTrue(d.modifiesReg('eax'))
+        self.assertTrue(d.modifiesReg('rax'))
+        self.assertFalse(d.modifiesReg('ebp'))
+        self.assertEqual(d.regs_read, set(['rbp']))
+        self.assertEqual(d.ea.disp, 8)
+
+    def testStoreWritesNoRegister(self):
+        d = decoded('x86', 'mov dword ptr [esp+0x4], eax')
+        self.assertEqual(d.regs_written, set())
+        self.assertEqual(d.regs_read, set(['rsp', 'rax']))
+
+    def testXchg(self):
+        d = decoded('x86', 'xchg eax, ebx')
+        self.assertEqual(d.regs_written, set(['rax', 'rbx']))
+
+    def testPop(self):
+        d = decoded('x86', 'pop ebp')
+        self.assertEqual(d.regs_written, set(['rbp']))
+        self.assertEqual(d.regs_read, set())
+
+    def testBranchTarget(self):
+        d = decoded('x86', 'call 0x8048400')
+        self.assertEqual(d.branch_target, 0x8048400)
+
+class TestArm(unittest.TestCase):
+    def testAliasFamilies(self):
+        self.assertEqual(decodeArm.regFamily('sp'), 'r13')
+        self.assertEqual(decodeArm.regFamily('fp'), 'r11')
+        self.assertTrue(decodeArm.regIsPart('lr', 'r14'))
+        self.assertFalse(decodeArm.regIsPart('ip', 'r11'))
+
+    def testMemOperand(self):
+        op = decodeArm.parseOperand('[r1, r2, lsl #2]')
+        self.assertEqual((op.ea.base, op.ea.index, op.ea.scale), ('r1', 'r2', 4))
+        op = decodeArm.parseOperand('[fp, #-8]')
+        self.assertEqual((op.ea.base, op.ea.disp, op.ea.writeback), ('fp', -8, False))
+
+    def testLdrPreIndexWriteback(self):
+        d = decoded('arm', 'ldr r0, [r1, #4]!')
+        self.assertTrue(d.ea.writeback)
+        self.assertFalse(d.ea.post_index)
+        self.assertEqual(d.regs_written, set(['r0', 'r1']))
+
+    def testLdrPostIndex(self):
+        d = decoded('arm', 'ldr r3, [sp], #4')
+        self.assertTrue(d.ea.post_index)
+        self.assertEqual(d.regs_written, set(['r3', 'r13']))
+
+    def testStrNoWriteback(self):
+        d = decoded('arm', 'str r2, [r3, #8]')
+        self.assertEqual(d.regs_written, set())
+        self.assertEqual(d.regs_read, set(['r2', 'r3']))
+
+    def testLdmWriteback(self):
+        d = decoded('arm', 'ldm r0!, {r4, r5, lr}')
+        self.assertEqual(d.regs_written, set(['r0', 'r4', 'r5', 'r14']))
+        self.assertEqual(d.regs_read, set(['r0']))
+
+    def testPopList(self):
+        d = decoded('arm', 'pop {r4, fp, pc}')
+        self.assertEqual(d.regs_written, set(['r4', 'r11', 'r15']))
+        self.assertTrue(d.modifiesReg('pc'))
+        self.assertFalse(d.modifiesReg('r5'))
+
+    def testPushList(self):
+        d = decoded('arm', 'push {r4, lr}')
+        self.assertEqual(d.regs_written, set())
+        self.assertEqual(d.regs_read, set(['r4', 'r14']))
+
+    def testMovShift(self):
+        d = decoded('arm', 'mov r0, r1, lsl #2')
+        self.assertEqual(d.regs_written, set(['r0']))
+        self.assertEqual(d.regs_read, set(['r1']))
+
+if __name__ == '__main__':
+    unittest.main()
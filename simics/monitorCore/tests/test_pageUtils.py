@@ -0,0 +1,154 @@
+'''
+Benchmark and tests of the page table walk and its cache in pageUtils, over an x86-32 page
+table image laid out as for a Linux process:  text, heap and stack tables below the kernel
+base and kernel tables above it.  The walk that read one entry at a time, as getPageBases
+did before reading whole tables, is kept here as the reference.  Run with:
+    python -m unittest discover -s simics/monitorCore/tests
+or run this file directly to see the benchmark.
+'''
+import os
+import sys
+import time
+import types
+import struct
+import logging
+import unittest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.modules.setdefault('simics', types.ModuleType('simics'))
+import pageUtils
+import memUtils
+import mockSimics
+
+KERNEL_BASE = 0xc0000000
+CR3 = 0x1000
+ENTRIES = 1024
+''' page directory index -> number of present pages in its table, from the start of the table '''
+TABLES = {0x20:0x60, 0x21:0x200, 0x2ff:0x21, 0x300:ENTRIES, 0x301:ENTRIES, 0x302:ENTRIES, 0x303:ENTRIES}
+''' physical page numbers of mapped pages start here '''
+PAGE_FRAMES = 0x100
+WALKS = 5
+
+def pageBasesPerEntry(cpu, kernel_base, read_phys):
+    ''' the walk as it was, with a memory read per page directory and page table entry '''
+    retval = []
+    pdir_entry_addr = CR3
+    for pdir_index in range(ENTRIES):
+        pdir_entry = read_phys(cpu, pdir_entry_addr, 4)
+        ptable_base = memUtils.bitRange(pdir_entry, 12, 31) * pageUtils.PAGE_SIZE
+        if pdir_entry != 0:
+            ptable_entry_addr = ptable_base
+            for ptable_index in range(ENTRIES):
+                ptable_entry = read_phys(cpu, ptable_entry_addr, 4)
+                if memUtils.testBit(ptable_entry, 0):
+                    page_base = memUtils.bitRange(ptable_entry, 12, 31) * pageUtils.PAGE_SIZE
+                    logical = memUtils.setBitRange(0, pdir_index, 22)
+                    logical = memUtils.setBitRange(logical, ptable_index, 12)
+                    if logical >= kernel_base:
+                        break
+                    retval.append((logical, page_base, ptable_entry))
+                ptable_entry_addr += 4
+        pdir_entry_addr += 4
+    return retval
+
+class TestPageBases(unittest.TestCase):
+    def setUp(self):
+        self.lgr = logging.getLogger('test_pageUtils')
+        self.lgr.addHandler(logging.NullHandler())
+        ''' the page directory, its tables and a second page directory '''
+        self.memory = mockSimics.MockMemory(CR3 + (len(TABLES)+2) * pageUtils.PAGE_SIZE)
+        self.cpu = mockSimics.MockCpu('board.cpu0', self.memory, architecture='x86', regs={'cr3':CR3})
+        self.sim = mockSimics.MockSimics(cpus=[self.cpu])
+        self.sim.install(pageUtils)
+        table_addr = CR3 + pageUtils.PAGE_SIZE
+        frame = PAGE_FRAMES
+        for pdir_index in sorted(TABLES):
+            self.memory.write(CR3 + pdir_index*4, struct.pack('<I', table_addr | 0x67))
+            for ptable_index in range(TABLES[pdir_index]):
+                self.memory.write(table_addr + ptable_index*4, struct.pack('<I', (frame << 12) | 0x67))
+                frame += 1
+            table_addr += pageUtils.PAGE_SIZE
+        ''' another process, sharing only the text table '''
+        self.cr3_other = table_addr
+        self.memory.write(self.cr3_other + 0x20*4, struct.pack('<I', (CR3 + pageUtils.PAGE_SIZE) | 0x67))
+        pageUtils.clearPageCache()
+        pageUtils.fault_watch.clear()
+
+    def tearDown(self):
+        pageUtils.clearPageCache()
+        pageUtils.fault_watch.clear()
+
+    def walk(self):
+        self.memory.reads = 0
+        pages = pageUtils.getPageBases(self.cpu, self.lgr, KERNEL_BASE)
+        return [(page.logical, page.physical, page.entry) for page in pages], self.memory.reads
+
+    def testSameAsPerEntry(self):
+        pages, reads = self.walk()
+        expected = pageBasesPerEntry(self.cpu, KERNEL_BASE, self.sim.SIM_read_phys_memory)
+        self.assertEqual(pages, expected)
+        self.assertEqual(len(pages), 0x60 + 0x200 + 0x21)
+        ''' the page directory and each table are read whole '''
+        self.assertEqual(reads, 1 + len(TABLES))
+
+    def testCachedAtSameCycle(self):
+        pages, reads = self.walk()
+        self.assertEqual(self.walk(), (pages, 0))
+        self.cpu.cycles += 1
+        ''' not watching page faults, a later cycle walks again '''
+        self.assertEqual(self.walk(), (pages, 1 + len(TABLES)))
+
+    def testWatchedFaults(self):
+        pageUtils.watchFaults(self.cpu, True)
+        pages, reads = self.walk()
+        self.cpu.cycles += 100
+        self.assertEqual(self.walk(), (pages, 0))
+        ''' a page fault or page table write drops the walk '''
+        pageUtils.pageTableChanged(self.cpu)
+        self.assertEqual(self.walk()[1], 1 + len(TABLES))
+        ''' never reused at an earlier cycle, e.g., after reversing '''
+        self.cpu.cycles -= 50
+        self.assertEqual(self.walk()[1], 1 + len(TABLES))
+        ''' nor after clearPageCache, as before reverse execution or skip-to '''
+        pageUtils.clearPageCache()
+        self.assertEqual(self.walk()[1], 1 + len(TABLES))
+        pageUtils.watchFaults(self.cpu, False)
+        self.cpu.cycles += 1
+        self.assertEqual(self.walk()[1], 1 + len(TABLES))
+
+    def testNewTable(self):
+        ''' a new address space, i.e., cr3, is walked anew '''
+        self.walk()
+        self.cpu.regs['cr3'] = self.cr3_other
+        pages, reads = self.walk()
+        self.assertEqual((len(pages), reads), (0x60, 2))
+        self.cpu.regs['cr3'] = CR3
+        self.assertEqual(len(self.walk()[0]), 0x60 + 0x200 + 0x21)
+
+    def testBenchmark(self):
+        ''' memory reads and time of the walk done when setting up reverse to call '''
+        self.sim.reset()
+        start = time.time()
+        for index in range(WALKS):
+            pageBasesPerEntry(self.cpu, KERNEL_BASE, self.sim.SIM_read_phys_memory)
+        per_entry = (time.time() - start) / WALKS
+        per_entry_reads = self.sim.calls['SIM_read_phys_memory'] / WALKS
+        start = time.time()
+        for index in range(WALKS):
+            self.cpu.cycles += 1
+            pages, reads = self.walk()
+        whole = (time.time() - start) / WALKS
+        pageUtils.watchFaults(self.cpu, True)
+        self.walk()
+        start = time.time()
+        for index in range(WALKS):
+            self.cpu.cycles += 1
+            self.walk()
+        cached = (time.time() - start) / WALKS
+        self.assertTrue(reads * 100 < per_entry_reads)
+        self.lgr.debug('walk of %d pages: per entry %d reads %.2f ms, whole tables %d reads %.2f ms, cached %.3f ms' % (len(pages),
+                       per_entry_reads, per_entry*1000, reads, whole*1000, cached*1000))
+
+if __name__ == '__main__':
+    ''' show the benchmark '''
+    logging.basicConfig(level=logging.DEBUG)
+    unittest.main()
@@ -0,0 +1,127 @@
+'''
+Tests of resim_utils.Lazy and the log level of getLogger, and a benchmark of the per-hap
+logging overhead at INFO versus DEBUG:  the frame logging done by syscallHap, and the
+recorded frames of test_syscallParse replayed through syscallParse.  Run with:
+    python -m unittest discover -s simics/monitorCore/tests
+or run this file directly to see the benchmark.
+'''
+import os
+import sys
+import time
+import types
+import shutil
+import logging
+import tempfile
+import unittest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.modules.setdefault('simics', types.ModuleType('simics'))
+import resim_utils
+import taskUtils
+import test_syscallParse
+
+HAPS = 20000
+REPLAYS = 500
+FRAME = {'param1':3, 'param2':0xbffff6cb, 'param3':1, 'param4':0, 'param5':0, 'param6':0}
+
+class FormatHandler(logging.Handler):
+    ''' formats each record as a file handler would, and drops it '''
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+        self.records = 0
+    def emit(self, record):
+        self.format(record)
+        self.records += 1
+
+class Counter():
+    def __init__(self):
+        self.calls = 0
+    def frameString(self, frame):
+        self.calls += 1
+        return taskUtils.stringFromFrame(frame)
+
+class TestLazy(unittest.TestCase):
+    def setUp(self):
+        self.lgr = logging.getLogger('test_resimUtils')
+        self.lgr.addHandler(logging.NullHandler())
+        self.hap_lgr = logging.getLogger('test_resimUtils.hap')
+        self.hap_lgr.propagate = False
+        self.handler = FormatHandler()
+        self.hap_lgr.addHandler(self.handler)
+
+    def tearDown(self):
+        self.hap_lgr.removeHandler(self.handler)
+
+    def testNotBuiltAtInfo(self):
+        counter = Counter()
+        self.hap_lgr.setLevel(logging.INFO)
+        self.hap_lgr.debug('frame string %s', resim_utils.Lazy(counter.frameString, FRAME))
+        self.assertEqual((counter.calls, self.handler.records), (0, 0))
+        self.hap_lgr.setLevel(logging.DEBUG)
+        self.hap_lgr.debug('frame string %s', resim_utils.Lazy(counter.frameString, FRAME))
+        self.assertEqual((counter.calls, self.handler.records), (1, 1))
+
+    def testGetLoggerLevel(self):
+        logdir = tempfile.mkdtemp()
+        old_level = os.environ.pop(resim_utils.LOG_LEVEL_ENV, None)
+        try:
+            lgr = resim_utils.getLogger('test_resimUtils_default', logdir)
+            self.assertEqual(lgr.level, logging.DEBUG)
+            os.environ[resim_utils.LOG_LEVEL_ENV] = 'info'
+            lgr = resim_utils.getLogger('test_resimUtils_env', logdir)
+            self.assertEqual(lgr.level, logging.INFO)
+            lgr = resim_utils.getLogger('test_resimUtils_arg', logdir, level='WARNING')
+            self.assertEqual(lgr.level, logging.WARNING)
+        finally:
+            for name in ['test_resimUtils_default', 'test_resimUtils_env', 'test_resimUtils_arg']:
+                lgr = logging.getLogger(name)
+                for handler in list(lgr.handlers):
+                    handler.close()
+                    lgr.removeHandler(handler)
+            os.environ.pop(resim_utils.LOG_LEVEL_ENV, None)
+            if old_level is not None:
+                os.environ[resim_utils.LOG_LEVEL_ENV] = old_level
+            shutil.rmtree(logdir)
+
+    def timeFrameLogging(self, level, lazy):
+        self.hap_lgr.setLevel(level)
+        start = time.time()
+        for index in range(HAPS):
+            if lazy:
+                self.hap_lgr.debug('frame string %s', resim_utils.Lazy(taskUtils.stringFromFrame, FRAME))
+            else:
+                self.hap_lgr.debug('frame string %s' % taskUtils.stringFromFrame(FRAME))
+        return (time.time() - start) * 1000000 / HAPS
+
+    def timeReplay(self, level):
+        sc = test_syscallParse.ReplaySyscall(self.hap_lgr)
+        self.hap_lgr.setLevel(level)
+        hits = REPLAYS * len(test_syscallParse.RECORDED)
+        start = time.time()
+        for index in range(REPLAYS):
+            for callnum, params, expected in test_syscallParse.RECORDED:
+                info = test_syscallParse.syscall.SyscallInfo(None, None, callnum, None, True, [])
+                sc.syscallParse(callnum, test_syscallParse.getFrame(params), None, test_syscallParse.PID, info)
+        return (time.time() - start) * 1000000 / hits
+
+    def testBenchmark(self):
+        ''' per-hap cost of the frame logging of syscallHap and of syscallParse '''
+        eager = self.timeFrameLogging(logging.INFO, False)
+        lazy_info = self.timeFrameLogging(logging.INFO, True)
+        records = self.handler.records
+        lazy_debug = self.timeFrameLogging(logging.DEBUG, True)
+        self.assertEqual(records, 0)
+        self.assertEqual(self.handler.records, HAPS)
+        self.handler.records = 0
+        parse_info = self.timeReplay(logging.INFO)
+        self.assertEqual(self.handler.records, 0)
+        parse_debug = self.timeReplay(logging.DEBUG)
+        self.assertTrue(self.handler.records > 0)
+        self.lgr.debug('frame logging per hap: formatted at INFO %.2f us, Lazy at INFO %.2f us, Lazy at DEBUG %.2f us' % (eager,
+                       lazy_info, lazy_debug))
+        self.lgr.debug('syscallParse per hap: INFO %.2f us, DEBUG %.2f us' % (parse_info, parse_debug))
+
+if __name__ == '__main__':
+    ''' show the benchmark '''
+    logging.basicConfig(level=logging.DEBUG)
+    unittest.main()
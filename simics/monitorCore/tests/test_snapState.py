@@ -0,0 +1,208 @@
+'''
+Round trip tests of the snapshot state container, and a benchmark of opening a snapshot
+with large SO maps and process trees against loading the per-component pickle files
+written before the container.  snapState does not use Simics, run with:
+    python -m unittest discover -s simics/monitorCore/tests
+or run this file directly to see the benchmark.
+'''
+import os
+import sys
+import time
+import pickle
+import shutil
+import logging
+import tempfile
+import unittest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import snapState
+import elfText
+import traceProcs
+
+''' benchmark snapshot:  cells, each with PIDS processes that have SOS shared objects '''
+CELLS = ['cell0', 'cell1']
+PIDS = 500
+SOS = 20
+
+class TestSnapState(unittest.TestCase):
+    def setUp(self):
+        self.lgr = logging.getLogger('test_snapState')
+        self.lgr.addHandler(logging.NullHandler())
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.mkdtemp()
+        os.chdir(self.tmp)
+        os.mkdir('snap')
+        snapState.snap_states.clear()
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmp)
+        snapState.snap_states.clear()
+
+    def writeState(self):
+        state = snapState.SnapState(self.lgr)
+        state.put(snapState.sectionName('cell', 'soMap'), 1, {'so_file_map':{12:{'text':'libc.so'}}})
+        state.put(snapState.sectionName('cell', 'traceProcs'), 2, {'plist':{'12':None}})
+        state.write('snap')
+        return os.path.join(self.tmp, 'snap', snapState.STATE_FILE)
+
+    def testRoundTrip(self):
+        self.writeState()
+        state = snapState.SnapState(self.lgr)
+        self.assertTrue(state.read('snap'))
+        self.assertTrue(state.has('cell/soMap'))
+        self.assertFalse(state.has('cell/taskUtils'))
+        self.assertEqual(state.get('cell/soMap', 1), {'so_file_map':{12:{'text':'libc.so'}}})
+        self.assertEqual(state.get('cell/traceProcs', 2), {'plist':{'12':None}})
+        self.assertEqual(state.get('cell/taskUtils', 1), None)
+
+    def testLazyGet(self):
+        self.writeState()
+        state = snapState.SnapState(self.lgr)
+        state.read('snap')
+        self.assertEqual(state.loaded, {})
+        first = state.get('cell/soMap', 1)
+        self.assertEqual(list(state.loaded), ['cell/soMap'])
+        self.assertTrue(state.get('cell/soMap', 1) is first)
+
+    def testVersionMismatch(self):
+        self.writeState()
+        state = snapState.SnapState(self.lgr)
+        state.read('snap')
+        self.assertEqual(state.get('cell/soMap', 2), None)
+        self.assertEqual(state.get('cell/traceProcs', 2), {'plist':{'12':None}})
+
+    def testTruncated(self):
+        path = self.writeState()
+        with open(path, 'rb') as fh:
+            data = fh.read()
+        with open(path, 'wb') as fh:
+            fh.write(data[:snapState.HEADER.size - 1])
+        state = snapState.SnapState(self.lgr)
+        self.assertFalse(state.read('snap'))
+
+    def testBadMagic(self):
+        path = self.writeState()
+        with open(path, 'r+b') as fh:
+            fh.write(b'XXXXX')
+        state = snapState.SnapState(self.lgr)
+        self.assertFalse(state.read('snap'))
+
+    def testNoContainer(self):
+        self.assertEqual(snapState.getSnapState('snap', self.lgr), None)
+        self.writeState()
+        ''' the result is cached per snapshot name '''
+        self.assertEqual(snapState.getSnapState('snap', self.lgr), None)
+        snapState.snap_states.clear()
+        self.assertTrue(snapState.getSnapState('snap', self.lgr).has('cell/soMap'))
+
+def soMapState(cell_index):
+    ''' soMap state as saved by SOMap.saveState, the text segments shared by both maps '''
+    so_addr_map = {}
+    so_file_map = {}
+    text_start = {}
+    text_end = {}
+    text_prog = {}
+    for pid in range(cell_index*PIDS, (cell_index+1)*PIDS):
+        so_addr_map[pid] = {}
+        so_file_map[pid] = {}
+        for index in range(SOS):
+            fpath = '/lib/lib%d.so.%d' % (index, pid % 7)
+            text_seg = elfText.Text(0xb7000000 + index*0x100000, 0x1000, 0x80000 + index)
+            so_addr_map[pid][fpath] = text_seg
+            so_file_map[pid][text_seg] = fpath
+        text_start[pid] = 0x8048000
+        text_end[pid] = 0x8100000 + pid
+        text_prog[pid] = '/usr/bin/prog%d' % (pid % 50)
+    return {'so_addr_map':so_addr_map, 'so_file_map':so_file_map, 'text_start':text_start,
+            'text_end':text_end, 'text_prog':text_prog}
+
+def traceProcsState(cell_index):
+    ''' traceProcs state as saved by TraceProcs.saveState:  a tree with each process the
+        child of the one before it, with a few files and pipes '''
+    plist = {}
+    parent = None
+    for pid in range(cell_index*PIDS, (cell_index+1)*PIDS):
+        pinfo = traceProcs.Pinfo(pid, parent=parent)
+        pinfo.prog = '/usr/bin/prog%d' % (pid % 50)
+        pinfo.args = '%s -c %d' % (pinfo.prog, pid)
+        pinfo.files = {'/etc/passwd':[3], '/var/log/messages':[4, 5]}
+        pinfo.rpipe = {6:None}
+        pinfo.wpipe = {7:None}
+        if parent is not None:
+            plist[str(parent)].children.append(pid)
+        plist[str(pid)] = pinfo
+        parent = pid
+    return {'plist':plist, 'pipe_handle':{}, 'socket_handle':{}, 'latest_pid_instance':{},
+            'init_proc_list':[]}
+
+class TestSnapStateLoad(unittest.TestCase):
+    def setUp(self):
+        self.lgr = logging.getLogger('test_snapState')
+        self.lgr.addHandler(logging.NullHandler())
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.mkdtemp()
+        os.chdir(self.tmp)
+        os.mkdir('snap')
+        snapState.snap_states.clear()
+        ''' the same state in the container and in the old per-component files '''
+        state = snapState.SnapState(self.lgr)
+        self.old_files = []
+        for cell_index in range(len(CELLS)):
+            cell_name = CELLS[cell_index]
+            os.mkdir(os.path.join('snap', cell_name))
+            for component, data in [('soMap', soMapState(cell_index)), ('traceProcs', traceProcsState(cell_index))]:
+                state.put(snapState.sectionName(cell_name, component), 1, data)
+                old_file = os.path.join('./', 'snap', cell_name, '%s.pickle' % component)
+                pickle.dump(data, open(old_file, 'wb'))
+                self.old_files.append(old_file)
+        state.write('snap')
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmp)
+        snapState.snap_states.clear()
+
+    def testBenchmark(self):
+        ''' time to open the snapshot:  the old load of every pickle file at startup, the
+            container table of contents alone, then with one section, then with all of them '''
+        start = time.time()
+        old = [pickle.load(open(old_file, 'rb')) for old_file in self.old_files]
+        old_load = time.time() - start
+
+        start = time.time()
+        state = snapState.SnapState(self.lgr)
+        self.assertTrue(state.read('snap'))
+        toc_read = time.time() - start
+        self.assertEqual(state.loaded, {})
+
+        start = time.time()
+        state = snapState.SnapState(self.lgr)
+        state.read('snap')
+        so_map = state.get(snapState.sectionName(CELLS[0], 'soMap'), 1)
+        one_section = time.time() - start
+        self.assertEqual(list(state.loaded), [snapState.sectionName(CELLS[0], 'soMap')])
+
+        start = time.time()
+        state = snapState.SnapState(self.lgr)
+        state.read('snap')
+        sections = []
+        for cell_name in CELLS:
+            for component in ['soMap', 'traceProcs']:
+                sections.append(state.get(snapState.sectionName(cell_name, component), 1))
+        all_sections = time.time() - start
+
+        self.assertEqual(len(so_map['so_file_map']), PIDS)
+        for index in range(len(old)):
+            self.assertEqual(sorted(sections[index]), sorted(old[index]))
+        self.assertEqual(len(sections[1]['plist']), PIDS)
+        self.assertEqual(sections[1]['plist'][str(PIDS-2)].children, [PIDS-1])
+        ''' text segments stay shared between the two maps of a pid '''
+        text_seg = sections[0]['so_addr_map'][0]['/lib/lib0.so.0']
+        self.assertEqual(sections[0]['so_file_map'][0][text_seg], '/lib/lib0.so.0')
+        self.lgr.debug('%d cells of %d pids with %d SOs each:  old pickle files %.3fs, container table of contents %.4fs, one section %.3fs, all sections %.3fs' % (len(CELLS),
+                       PIDS, SOS, old_load, toc_read, one_section, all_sections))
+
+if __name__ == '__main__':
+    ''' show the benchmark '''
+    logging.basicConfig(level=logging.DEBUG)
+    unittest.main()
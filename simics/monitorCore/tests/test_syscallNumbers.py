@@ -0,0 +1,58 @@
+'''
+Tests of the compiled syscall number tables.  syscallNumbers does not use Simics,
+run with:  python -m unittest discover -s simics/monitorCore/tests
+'''
+import os
+import sys
+import shutil
+import logging
+import tempfile
+import unittest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import syscallNumbers
+
+UNISTD = '#define __NR_read 0\n#define __NR_write 1\n#define __NR_open 2\n'
+
+class TestSyscallNumbers(unittest.TestCase):
+    def setUp(self):
+        self.lgr = logging.getLogger('test_syscallNumbers')
+        self.lgr.addHandler(logging.NullHandler())
+        self.tmp = tempfile.mkdtemp()
+        self.unistd = os.path.join(self.tmp, 'unistd_64.h')
+        self.table = os.path.join(self.tmp, 'target.syscalls')
+        self.writeHeader(UNISTD)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def writeHeader(self, text):
+        with open(self.unistd, 'w') as fh:
+            fh.write(text)
+
+    def testCompile(self):
+        sn = syscallNumbers.SyscallNumbers(self.unistd, self.lgr, table_file=self.table)
+        self.assertEqual(sn.callnums['write'], 1)
+        self.assertEqual(sn.syscalls[2], 'open')
+        table = syscallNumbers.loadTable(self.table)
+        self.assertEqual(table[syscallNumbers.NATIVE][2], [('read', 0), ('write', 1), ('open', 2)])
+
+    def testDigestRefreshed(self):
+        syscallNumbers.SyscallNumbers(self.unistd, self.lgr, table_file=self.table)
+        self.writeHeader(UNISTD + '/* no new calls */\n')
+        sn = syscallNumbers.SyscallNumbers(self.unistd, self.lgr, table_file=self.table)
+        self.assertEqual(sn.callnums['open'], 2)
+        table = syscallNumbers.loadTable(self.table)
+        self.assertEqual(table[syscallNumbers.NATIVE][1], syscallNumbers.headerDigest(self.unistd))
+
+    def testStaleTable(self):
+        syscallNumbers.SyscallNumbers(self.unistd, self.lgr, table_file=self.table)
+        self.writeHeader(UNISTD + '#define __NR_close 3\n')
+        table = syscallNumbers.loadTable(self.table)
+        self.assertEqual(len(syscallNumbers.validateTable(table)), 1)
+        sn = syscallNumbers.SyscallNumbers(self.unistd, self.lgr, table_file=self.table)
+        self.assertEqual(sn.callnums['close'], 3)
+        table = syscallNumbers.loadTable(self.table)
+        self.assertEqual(syscallNumbers.validateTable(table), [])
+
+if __name__ == '__main__':
+    unittest.main()
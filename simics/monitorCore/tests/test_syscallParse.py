@@ -0,0 +1,156 @@
+'''
+Replay of recorded syscall register frames through Syscall.syscallParse and its parser table.
+Checks the trace message and exit info of each call, and times the replay with the parser
+selected when the breakpoint is set and with it looked up on each hit, as when tracing all
+calls.  Run with:
+    python -m unittest discover -s simics/monitorCore/tests
+or run this file directly to see the timing.
+'''
+import os
+import sys
+import time
+import types
+import logging
+import unittest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.modules.setdefault('simics', types.ModuleType('simics'))
+import syscall
+import net
+
+REPLAYS = 2000
+PID = 1234
+''' i386 call numbers '''
+CALLNAMES = {3:'read', 4:'write', 6:'close', 20:'getpid', 42:'pipe', 54:'ioctl', 63:'dup2', 78:'gettimeofday',
+             120:'clone', 140:'_llseek', 192:'mmap2', 221:'fcntl64'}
+''' call number, param1..param6 and the expected trace message, as seen from a busybox shell '''
+RECORDED = [
+    (3, (0, 0xbffff6cb, 1, 0, 0, 0), 'read pid:1234 FD: 0 buf: 0xbffff6cb count: 1'),
+    (4, (1, 0x80f5000, 0x1d, 0, 0, 0), 'write pid:1234 FD: 1 buf: 0x80f5000 count: 29'),
+    (54, (3, net.FIONREAD, 0xbffff5a0, 0, 0, 0), 'ioctl pid:1234 FD: 3 FIONREAD ptr: 0xbffff5a0'),
+    (54, (3, 0x5401, 0xbffff5a0, 0, 0, 0), 'ioctl pid:1234 FD: 3 cmd: 0x5401'),
+    (78, (0xbffff688, 0, 0, 0, 0, 0), 'gettimeofday pid:1234 timeval_ptr: 0xbffff688'),
+    (120, (0x1200011, 0, 0, 0, 0xb7fd8728, 0), 'clone pid:1234 flags:0x1200011 child_stack: 0x0 ptid: 0x0 ctid: 0x0 iregs: 0xb7fd8728'),
+    (192, (0, 0x1000, 3, 0x22, 0xffffffff, 0), 'mmap2 pid:1234 FD: 3 buf: 0x0 len: 4096'),
+    (221, (3, 2, 1, 0, 0, 0), 'fcntl64 pid:1234 FD: 3 command: 2 arg: 1\n\tparam1:0x3 param2:0x2 param3:0x1 param4:0x0 param5:0x0 param6:0x0 '),
+    (140, (3, 0, 0x200, 0xbffff5e0, 0, 0), '_llseek pid:1234 FD: 3 high: 0x0 low: 0x200 result: 0xbffff5e0 whence: 0x0 \nparam1:0x3 param2:0x0 param3:0x200 param4:0xbffff5e0 param5:0x0 param6:0x0 '),
+    (20, (0, 0, 0, 0, 0, 0), 'getpid param1:0x0 param2:0x0 param3:0x0 param4:0x0 param5:0x0 param6:0x0    pid:1234'),
+    (6, (3, 0, 0, 0, 0, 0), None),
+    (42, (0xbffff6a0, 0, 0, 0, 0, 0), None),
+    (63, (4, 1, 0, 0, 0, 0), None),
+]
+
+class TaskUtils():
+    def syscallName(self, callnum):
+        return CALLNAMES[callnum]
+
+class MemUtils():
+    WORD_SIZE = 4
+    def getRegValue(self, cpu, reg):
+        return 0xc1000000
+
+class ContextManager():
+    def __init__(self):
+        self.ida_message = None
+    def setIdaMessage(self, message):
+        self.ida_message = message
+
+def getFrame(params):
+    frame = {}
+    for index in range(6):
+        frame['param%d' % (index+1)] = params[index]
+    return frame
+
+class ReplaySyscall(syscall.Syscall):
+    ''' a Syscall with only what parsing needs, no breakpoints are set '''
+    def __init__(self, lgr):
+        self.lgr = lgr
+        self.cpu = None
+        self.task_utils = TaskUtils()
+        self.mem_utils = MemUtils()
+        self.context_manager = ContextManager()
+        self.traceMgr = None
+        self.traceProcs = None
+        self.sockwatch = syscall.SockWatch()
+        self.buildParsers()
+
+class TestSyscallParse(unittest.TestCase):
+    def setUp(self):
+        self.lgr = logging.getLogger('test_syscallParse')
+        self.lgr.addHandler(logging.NullHandler())
+        self.sc = ReplaySyscall(self.lgr)
+
+    def replay(self, preselect, call_params=[]):
+        ''' feed each recorded frame to syscallParse, return the ida messages and exit infos '''
+        infos = {}
+        for callnum in CALLNAMES:
+            infos[callnum] = syscall.SyscallInfo(None, None, callnum, None, True, call_params)
+            if preselect:
+                infos[callnum].parser = self.sc.getParser(CALLNAMES[callnum])
+        retval = []
+        for callnum, params, expected in RECORDED:
+            self.sc.context_manager.ida_message = None
+            exit_info = self.sc.syscallParse(callnum, getFrame(params), None, PID, infos[callnum])
+            retval.append((exit_info, self.sc.context_manager.ida_message))
+        return retval
+
+    def testParsers(self):
+        self.assertEqual(self.sc.getParser('read'), self.sc.parseReadCall)
+        self.assertEqual(self.sc.getParser('_newselect'), self.sc.parseSelectCall)
+        self.assertEqual(self.sc.getParser('recvfrom'), self.sc.socketParse)
+        self.assertEqual(self.sc.getParser('getpid'), self.sc.parseOtherCall)
+
+    def testMessages(self):
+        ''' each frame reaches its parser, whose message is traced by syscallParse '''
+        messages = []
+        def debug(msg, *args):
+            messages.append(msg % args)
+        self.sc.lgr = types.ModuleType('lgr')
+        self.sc.lgr.debug = debug
+        for preselect in [True, False]:
+            del messages[:]
+            self.replay(preselect)
+            expected = [record[2].strip() for record in RECORDED if record[2] is not None]
+            self.assertEqual(messages, expected)
+
+    def testExitInfo(self):
+        results = self.replay(True)
+        by_call = {}
+        for index in range(len(RECORDED)):
+            by_call[RECORDED[index][0]] = results[index][0]
+        self.assertEqual((by_call[3].old_fd, by_call[3].retval_addr), (0, 0xbffff6cb))
+        self.assertEqual(by_call[54].cmd, 0x5401)
+        self.assertEqual(by_call[120].flags, 0x1200011)
+        self.assertEqual(by_call[192].count, 0x1000)
+        self.assertEqual((by_call[63].old_fd, by_call[63].new_fd), (4, 1))
+        self.assertEqual(by_call[42].retval_addr, 0xbffff6a0)
+        for exit_info in by_call.values():
+            self.assertEqual(exit_info.syscall_entry, 0xc1000000)
+
+    def testCallParams(self):
+        ''' a call param narrows the read of one FD '''
+        call_param = syscall.CallParams('read', 0)
+        results = self.replay(True, call_params=[call_param])
+        for index in range(len(RECORDED)):
+            if RECORDED[index][0] == 3:
+                self.assertTrue(results[index][0].call_params is call_param)
+            elif RECORDED[index][0] == 4:
+                self.assertEqual(results[index][0].call_params, None)
+
+    def testReplayTime(self):
+        ''' time the parsing, not the logging of the messages '''
+        self.sc.lgr = logging.getLogger('test_syscallParse.replay')
+        self.sc.lgr.setLevel(logging.WARNING)
+        elapsed = {}
+        for preselect in [True, False]:
+            start = time.time()
+            for index in range(REPLAYS):
+                self.replay(preselect)
+            elapsed[preselect] = time.time() - start
+        hits = REPLAYS * len(RECORDED)
+        self.lgr.debug('%d hits: parser selected when set %.2f us per hit, looked up per hit %.2f us per hit' % (hits,
+                       elapsed[True]*1000000/hits, elapsed[False]*1000000/hits))
+
+if __name__ == '__main__':
+    ''' show the timing '''
+    logging.basicConfig(level=logging.DEBUG)
+    unittest.main()
@@ -1,3 +1,4 @@
+from simics import *
 class TraceFiles():
     class FileWatch():
         def __init__(self, path, outfile):
@@ -12,6 +13,31 @@ class TraceFiles():
         self.lgr = lgr
         self.open_files = {}
         self.traceProcs = traceProcs
+        ''' output file handles, kept open and flushed on close of the traced FD and when the simulation stops '''
+        self.out_fh = {}
+        self.stop_hap = None
+
+    def getOutFH(self, outfile):
+        if outfile not in self.out_fh:
+            self.out_fh[outfile] = open(outfile, 'ab')
+            if self.stop_hap is None:
+                self.stop_hap = SIM_hap_add_callback("Core_Simulation_Stopped", self.stopHap, None)
+        return self.out_fh[outfile]
+
+    def flush(self):
+        for outfile in self.out_fh:
+            self.out_fh[outfile].flush()
+
+    def stopHap(self, dumb, one, exception, error_string):
+        self.flush()
+
+    def closeOutFH(self, outfile):
+        if outfile in self.out_fh:
+            self.out_fh[outfile].close()
+            del self.out_fh[outfile]
+        if len(self.out_fh) == 0 and self.stop_hap is not None:
+            SIM_hap_delete_callback_id("Core_Simulation_Stopped", self.stop_hap)
+            self.stop_hap = None
 
     def watchFile(self, path, outfile):
         self.path_list[path] = self.FileWatch(path, outfile)
@@ -37,6 +63,8 @@ class TraceFiles():
 
     def close(self, fd):
         if fd in self.open_files:
+            outfile = self.open_files[fd].outfile
+            self.closeOutFH(outfile)
             self.open_files[fd].fd = None
             del self.open_files[fd]
             self.lgr.debug('TraceFiles close %d num open files %d'  % (fd, len(self.open_files)))
@@ -44,19 +72,14 @@ class TraceFiles():
     def write(self, pid, fd, the_bytes):
         if self.traceProcs is not None and len(self.path_list) > 0:
             fname = self.traceProcs.getFileName(pid, fd)
-            self.lgr.debug('TraceFiles write got fname %s' % fname)
+            #self.lgr.debug('TraceFiles write got fname %s' % fname)
             if fname is not None and fname in self.path_list:
-                file_watch = self.path_list[fname]
-                with open(self.path_list[fname].outfile, 'a') as fh:
-                    s = ''.join(map(chr,the_bytes))
-                    self.lgr.debug('TraceFiles got %s from traceProcs for fd %d, writing to %s %s'  % (fname, fd, self.path_list[fname].outfile, s))
-                    fh.write(s)
-                    fh.flush()
+                outfile = self.path_list[fname].outfile
+                #self.lgr.debug('TraceFiles got %s from traceProcs for fd %d, writing %d bytes to %s'  % (fname, fd, len(the_bytes), outfile))
+                self.getOutFH(outfile).write(bytearray(the_bytes))
         
                  
         elif fd in self.open_files:
-            with open(self.open_files[fd].outfile, 'a') as fh:
-                s = ''.join(map(chr,the_bytes))
-                self.lgr.debug('TraceFiles writing to %s %s'  % (self.open_files[fd].outfile, s))
-                fh.write(s)
-            
+            outfile = self.open_files[fd].outfile
+            #self.lgr.debug('TraceFiles writing %d bytes to %s'  % (len(the_bytes), outfile))
+            self.getOutFH(outfile).write(bytearray(the_bytes))
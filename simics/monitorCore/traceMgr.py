@@ -1,27 +1,68 @@
+from simics import *
+import binTrace
+''' buffered trace output is written once it reaches this many bytes, or when the simulation stops '''
+FLUSH_SIZE = 64*1024
 class TraceMgr():
     def __init__(self, lgr):
         self.trace_fh = None
         self.lgr = lgr
         self.cpu = None
+        ''' write binTrace records rather than text '''
+        self.binary = False
+        self.buf = []
+        self.buf_size = 0
+        self.stop_hap = None
+
+    def setBinary(self, binary):
+        self.binary = binary
 
     def write(self, msg):
+        self.writeRecord(msg)
+
+    def writeRecord(self, msg, pid=None, callnum=None, args=None, buf=None):
+        ''' pid, callnum, args and buf are only kept in binary traces '''
         if self.trace_fh is not None:
-            cycle = '%010x--' % self.cpu.cycles
-            self.trace_fh.write(cycle+msg)
+            if self.binary:
+                rec = binTrace.pack(self.cpu.cycles, pid, callnum, args, buf, msg)
+            else:
+                rec = '%010x--%s' % (self.cpu.cycles, msg)
+            self.buf.append(rec)
+            self.buf_size += len(rec)
+            if self.buf_size >= FLUSH_SIZE:
+                self.writeBuf()
+
+    def writeBuf(self):
+        if len(self.buf) > 0:
+            self.trace_fh.write(''.join(self.buf))
+            self.buf = []
+            self.buf_size = 0
 
     def close(self):
         if self.trace_fh is not None:
+            self.writeBuf()
             self.trace_fh.close()
             self.trace_fh = None
+        if self.stop_hap is not None:
+            SIM_hap_delete_callback_id("Core_Simulation_Stopped", self.stop_hap)
+            self.stop_hap = None
 
     def flush(self):
         if self.trace_fh is not None:
+            self.writeBuf()
             self.trace_fh.flush()
 
+    def stopHap(self, dumb, one, exception, error_string):
+        self.flush()
+
     def open(self, fname, cpu):
         if self.trace_fh is not None:
             self.lgr.error('TraceMgr asked to open file %s while other still open' % fname)
-            self.trace_fh.close()
-            
-        self.trace_fh = open(fname, 'w') 
+            self.close()
+        if self.binary:
+            fname = fname.replace('.txt', '') + '.bin'
+            self.trace_fh = open(fname, 'wb')
+        else:
+            self.trace_fh = open(fname, 'w')
         self.cpu = cpu
+        self.stop_hap = SIM_hap_add_callback("Core_Simulation_Stopped", self.stopHap, None)
+        self.lgr.debug('TraceMgr open %s binary: %r' % (fname, self.binary))
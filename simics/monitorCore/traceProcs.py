@@ -1,6 +1,11 @@
 ''' maintain structure of process hierarchy '''
 import pickle
 import os
+import snapState
+''' schema version of the state saved with snapshots '''
+STATE_VERSION = 1
+''' attributes restored from a snapshot, see TraceProcs.__getattr__ '''
+SNAP_STATE = ['plist', 'pipe_handle', 'socket_handle', 'latest_pid_instance', 'init_proc_list']
 class Pinfo():
     def __init__(self, pid, clone=None, parent=None):
         self.pid = pid
@@ -24,9 +29,19 @@ class TraceProcs():
     def __init__(self, cell_name, lgr, run_from_snap=None):
         self.lgr = lgr
         self.cell_name = cell_name
+        self.did_that = []
+        ''' snapshot whose state is not unpickled until first used '''
+        self.pending_snap = run_from_snap
+        if run_from_snap is None:
+            self.initState()
+            #for pid in proc_list:
+            #    spid = str(pid)
+            #    self.setName(spid, proc_list[pid], None, quiet=False)
+            #    self.init_proc_list[spid] = proc_list[pid]
+
+    def initState(self):
         ''' dict of Pinfo indexed by pid '''
         self.plist = {}
-        self.did_that = []
         self.pipe_handle = {}
         self.socket_handle = {}
         self.latest_pid_instance = {}
@@ -34,21 +49,28 @@ class TraceProcs():
         ''' init_proc_list is the pid/comm pair read from a checkpoint json
             On display, we'll the entries that do not have children
         '''
-        if run_from_snap is not None:
-            self.loadPickle(run_from_snap)
-        else:
-            pass
-            #for pid in proc_list:
-            #    spid = str(pid)
-            #    self.setName(spid, proc_list[pid], None, quiet=False)
-            #    self.init_proc_list[spid] = proc_list[pid]
+
+    def __getattr__(self, name):
+        ''' only called for attributes not yet set, i.e., the snapshot state has not been loaded '''
+        if name in SNAP_STATE and self.__dict__.get('pending_snap') is not None:
+            snap_name = self.pending_snap
+            self.pending_snap = None
+            self.loadPickle(snap_name)
+            return getattr(self, name)
+        raise AttributeError(name)
 
     def loadPickle(self, name):
-        proc_file = os.path.join('./', name, self.cell_name, 'traceProcs.pickle')
-        if os.path.isfile(proc_file):
-            self.lgr.debug('traceProcs pickle from %s' % proc_file)
-            proc_pickle = pickle.load( open(proc_file, 'rb') ) 
-            #print('start %s' % str(so_pickle['text_start']))
+        self.initState()
+        proc_pickle = None
+        snap_state = snapState.getSnapState(name, self.lgr)
+        if snap_state is not None:
+            proc_pickle = snap_state.get(snapState.sectionName(self.cell_name, 'traceProcs'), STATE_VERSION)
+        else:
+            proc_file = os.path.join('./', name, self.cell_name, 'traceProcs.pickle')
+            if os.path.isfile(proc_file):
+                self.lgr.debug('traceProcs pickle from %s' % proc_file)
+                proc_pickle = pickle.load( open(proc_file, 'rb') ) 
+        if proc_pickle is not None:
             self.plist = proc_pickle['plist']
             self.pipe_handle = proc_pickle['pipe_handle']
             self.socket_handle = proc_pickle['socket_handle']
@@ -56,16 +78,14 @@ class TraceProcs():
             self.init_proc_list = proc_pickle['init_proc_list']
             
 
-    def pickleit(self, name):
-        proc_file = os.path.join('./', name, self.cell_name, 'traceProcs.pickle')
+    def saveState(self, snap_state):
         proc_pickle = {}
         proc_pickle['plist'] = self.plist
         proc_pickle['pipe_handle'] = self.pipe_handle
         proc_pickle['socket_handle'] = self.socket_handle
         proc_pickle['latest_pid_instance'] = self.latest_pid_instance
         proc_pickle['init_proc_list'] = self.init_proc_list
-        pickle.dump( proc_pickle, open( proc_file, "wb" ) )
-        self.lgr.debug('traceProcs pickleit to %s ' % (proc_file))
+        snap_state.put(snapState.sectionName(self.cell_name, 'traceProcs'), STATE_VERSION, proc_pickle)
 
     def pidExists(self, pid):
         if str(pid) in self.plist:
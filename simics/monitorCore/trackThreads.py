@@ -132,6 +132,7 @@ class TrackThreads():
                 self.lgr.debug('trackThreads exitHap assume clone return to child for pid %d ?' % pid)
                 self.context_manager.addTask(pid)
                 self.traceProcs.addProc(pid, None, clone=True)
+                self.task_utils.indexCurTask()
             return
 
         if self.cpu != cpu:
@@ -165,6 +166,7 @@ class TrackThreads():
             child_pid = eax
             self.lgr.debug('TrackThreads exitHap for pid: %d adding child pid %d to contextManager' % (pid, child_pid))
             self.context_manager.addTask(child_pid)
+            self.task_utils.noteClone(child_pid)
             self.context_manager.genDeleteHap(self.exit_hap[pid])
             #self.top.addProcList(pid, None)
             self.traceProcs.addProc(child_pid, pid, clone=True)